@@ -28,7 +28,6 @@ logging.basicConfig(filename=config.loggingFilename, level=int(config.loggingLev
 logger = logging.getLogger()
 
 from . import configuration
-from . import mainWindow
 
 
 
@@ -15,9 +15,10 @@ the Free Software Foundation; either version 2 of the License, or
 '''
 import numpy as np
 import pandas as pd
-from scipy.interpolate import interp1d
 import time, random, math
 from datetime import datetime
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from PyQt5.QtWidgets import (QApplication,QAbstractItemView)
 from PyQt5.QtCore import (Qt,QObject, QThread, pyqtSlot, pyqtSignal)
 from .acquisitionWindow import *
@@ -25,6 +26,14 @@ from .modules.xystage.xystage import *
 from .modules.sourcemeter.sourcemeter import *
 from .modules.switchbox.switchbox import *
 from .modules.shutter.shutter import *
+from .jvAnalysis import *
+from .perfData import *
+from .dataManagement import *
+
+# Substrate entry of the acquisition plan.
+# lotDM: arguments of create_lot_DM for the substrate
+AcqPlanEntry = namedtuple('AcqPlanEntry',
+                ['i', 'j', 'substrateNum', 'substrateID', 'devices', 'lotDM'])
 
 ####################################################################
 # Acquisition
@@ -74,14 +83,26 @@ class Acquisition(QObject):
         self.parent().enableButtonsAcq(False)
         self.parent().resultswind.show()
         
-        self.acq_thread = acqThread(self.numRow, self.numCol, self.dfAcqParams, self)
+        self.acqPlan = self.getAcqPlan()
+        self.acq_thread = acqThread(self.numRow, self.numCol, self.dfAcqParams, self.acqPlan, self)
+        self.acq_thread.switchOnly = self.parent().acquisitionwind.switchOnlyMenu.isChecked()
+        self.acq_thread.adaptiveSweep = self.parent().acquisitionwind.adaptiveSweepMenu.isChecked()
+        self.acq_thread.adaptiveTol = self.parent().config.acqAdaptiveTol
         self.acq_thread.Msg.connect(self.printMsg)
         self.acq_thread.acqJVComplete.connect(lambda JV,perfData,deviceID,i,j: \
                 self.JVDeviceProcess(JV,perfData,deviceID,i,j))
         self.acq_thread.tempTracking.connect(lambda JV,perfData,deviceID,setupTable,saveData: \
                 self.plotTempTracking(JV,perfData,deviceID,setupTable,saveData))
+        self.acq_thread.trackingData.connect(lambda perfData,deviceID: \
+                self.plotTrackingData(perfData,deviceID))
         self.acq_thread.colorCell.connect(lambda i,j,color: self.parent().samplewind.colorCellAcq(i,j,color))
         self.acq_thread.maxPowerDev.connect(self.printMsg)
+        self.acq_thread.clearResults.connect(self.clearResults)
+        # Submit the last batch of DM documents at the end of the acquisition
+        self.acq_thread.finished.connect(self.parent().resultswind.persistence.flushDM)
+        # Save all devices of the run in a single archive file
+        if self.parent().config.saveRunArchive == True:
+            self.acq_thread.finished.connect(lambda: self.parent().resultswind.save_archive())
         self.acq_thread.start()
 
     # Action for stop button
@@ -90,8 +111,7 @@ class Acquisition(QObject):
         reply = QMessageBox.question(self.parent(), 'Message',
                      quit_msg, QMessageBox.No, QMessageBox.Yes)
         if reply == QMessageBox.Yes:
-            msg = "Acquisition stopped: " + self.acq_thread.getDateTimeNow()[0]+ \
-                  " at "+self.acq_thread.getDateTimeNow()[1]
+            msg = "Acquisition stopped: {0} at {1}".format(*self.acq_thread.getDateTimeNow())
             self.acq_thread.stop()
             self.printMsg(msg)
         else:
@@ -103,6 +123,11 @@ class Acquisition(QObject):
         logger.info(msg)
         self.parent().statusBarLabel.setText(msg)
 
+    # Clear plots, table and results store before acquiring (GUI thread)
+    def clearResults(self):
+        self.parent().resultswind.clearPlots(True)
+        self.parent().resultswind.setupResultsStore()
+
     # Process JV Acquisition to result page
     def JVDeviceProcess(self, JV, perfData, deviceID, i,j):
         self.parent().resultswind.clearPlots(False)
@@ -120,6 +145,24 @@ class Acquisition(QObject):
         if saveData is True:
             time.sleep(1)
 
+    # Plot new samples from tracking
+    def plotTrackingData(self, perfData, deviceID):
+        self.parent().resultswind.processTrackingData(deviceID, perfData)
+        QApplication.processEvents()
+
+    # Build the list of substrates and devices to be acquired ahead of time.
+    # Everything read from the GUI for DM entries is collected here.
+    def getAcqPlan(self):
+        plan = []
+        for j in range(self.numCol):
+            for i in range(self.numRow):
+                substrateID = self.parent().samplewind.tableWidget.item(i,j).text()
+                if substrateID != "" and self.parent().samplewind.activeSubs[i,j] == True:
+                    plan.append(AcqPlanEntry(i, j, self.getSubstrateNumber(i,j),
+                                substrateID, list(range(1,7)),
+                                self.parent().samplewind.getLotDMInfo(substrateID, i, j)))
+        return plan
+
     # Convert coordinates as in the Sample Windown Table into the
     # correct substrate number as defined in xystage.py
     def getSubstrateNumber(self, i,j):
@@ -139,19 +182,32 @@ class acqThread(QThread):
 
     acqJVComplete = pyqtSignal(np.ndarray, np.ndarray, str, int, int)
     tempTracking = pyqtSignal(np.ndarray, np.ndarray, str, bool, bool)
+    trackingData = pyqtSignal(np.ndarray, str)
     maxPowerDev = pyqtSignal(str)
     colorCell = pyqtSignal(int,int,str)
     Msg = pyqtSignal(str)
     shutterFlag = pyqtSignal(str)
+    clearResults = pyqtSignal()
 
-    def __init__(self, numRow, numCol, dfAcqParams, parent=None):
+    def __init__(self, numRow, numCol, dfAcqParams, acqPlan, parent=None):
         super(acqThread, self).__init__(parent)
         self.dfAcqParams = dfAcqParams
+        self.acqPlan = acqPlan
         self.numRow = numRow
         self.numCol = numCol
         self.powerIn = float(self.parent().parent().config.conf['Instruments']['irradiance1Sun'])
         self.tracking_points = 2
         self.stopAcqFlag = False
+        self.hwSweep = False
+        self.shutterOpen = False
+        # Address devices only through the switchbox, stage at substrate center
+        self.switchOnly = False
+        # Refine JV voltage steps only near MPP and Voc
+        self.adaptiveSweep = False
+        self.adaptiveTol = 0.01
+        self.adaptiveList = None
+        # Workers for tasks overlapping with stage motion and measurements
+        self.executor = ThreadPoolExecutor(max_workers=2)
 
     def __del__(self):
         self.wait()
@@ -173,13 +229,19 @@ class acqThread(QThread):
         # If stage is open in stage window, close.
         if self.parent().parent().stagewind.activeStage:
             self.parent().parent().stagewind.activateStage()
-        self.parent().xystage = XYstage(self.parent().parent().config.xDefStageOrigin,
-                            self.parent().parent().config.yDefStageOrigin)
+        config = self.parent().parent().config
+        # Devices are corrected by the offsets measured during alignment
+        self.parent().xystage = XYstage(config.xDefStageOrigin, config.yDefStageOrigin,
+                            config.stageCalibration(),
+                            config.stagePosTolerance)
         if self.parent().xystage.xystageInit == False:
             self.Msg.emit(" Stage not activated: no acquisition possible")
             self.stop()
             return
         self.Msg.emit(" Stage activated.")
+
+        # Visit substrates (and devices) in the order minimizing stage travel
+        self.planStagePath()
         
         # Activate switchbox
         self.Msg.emit("Activating switchbox...")        
@@ -202,7 +264,11 @@ class acqThread(QThread):
             self.Msg.emit(" Sourcemeter not activated: no acquisition possible")
             self.stop()
             return
+        self.hwSweep = self.parent().parent().config.sourcemeterHwSweep and \
+                self.parent().source_meter.sweepSupport
         self.Msg.emit(" Sourcemeter activated.")
+        if self.hwSweep:
+            self.Msg.emit(" Sourcemeter: using hardware-triggered sweeps")
         
         # Activate shutter
         self.Msg.emit("Activating shutter...")
@@ -213,144 +279,154 @@ class acqThread(QThread):
             self.Msg.emit(" Shutter not activated: no acquisition possible")
             self.stop()
             return
-        self.parent().shutter.closed()
+        self.setShutter(False)
         self.Msg.emit(" Shutter activated and closed.")
 
         ### Setup interface and get parameters before acquisition
-        self.parent().parent().resultswind.clearPlots(True)
-        self.parent().parent().resultswind.setupDataFrame()
+        self.clearResults.emit()
         operator = self.parent().parent().samplewind.operatorText.text()
         self.Msg.emit("Operator: " + operator)
-        self.Msg.emit("Acquisition started: "+self.getDateTimeNow()[0]+" at " + \
-                self.getDateTimeNow()[1])
+        self.Msg.emit("Acquisition started: {0} at {1}".format(*self.getDateTimeNow()))
                 
-        # If all is OK, start acquiring
-        # Start from moving to the correct substrate
-        for j in range(self.numCol):
-            for i in range(self.numRow):
+        # If all is OK, start acquiring following the acquisition plan.
+        # DM entries for the next substrate are prepared in the background
+        # while the current one is measured.
+        lotDM = {}
+        if len(self.acqPlan) > 0:
+            lotDM[0] = self.executor.submit(self.createLotDM, self.acqPlan[0])
+        for n, entry in enumerate(self.acqPlan):
+            if self.stopAcqFlag == True:
+                break
+            i, j = entry.i, entry.j
+            substrateNum = entry.substrateNum
+            substrateID = entry.substrateID
+            self.colorCell.emit(i,j,"yellow")
+
+            # Create DM if doesn't exist and update AcParams dataframe for correct architecture
+            try:
+                lotDM.pop(n).result()
+            except Exception as e:
+                self.Msg.emit(" DM entry for substrate "+substrateID+" not created: "+str(e))
+            if n+1 < len(self.acqPlan):
+                lotDM[n+1] = self.executor.submit(self.createLotDM, self.acqPlan[n+1])
+            self.parent().parent().samplewind.setArchDfAcqParams(self.dfAcqParams, i,j)
+            # Acquisition parameters may differ: no adaptive sweep from another substrate
+            self.adaptiveList = None
+
+            # Move stage to desired substrate. With switchOnly the whole substrate
+            # is illuminated from its center and the stage does not move further.
+            if self.parent().xystage.xystageInit is True:
+                self.Msg.emit("Moving stage to substrate #"+ \
+                                str(substrateNum)+ \
+                                ": ("+str(4-i)+", "+str(4-j)+")")
+                if self.parent().xystage.move_to_substrate_4x4(substrateNum) is None:
+                    self.stageFailed()
+                    break
+                time.sleep(0.1)
+            else:
+                print("Skipping acquisition: stage not activated.")
+                break
+
+            id_mpp_v = np.zeros((0,7))
+            #self.devMaxPower = 0
+            for dev_id in entry.devices:
                 if self.stopAcqFlag == True:
                     break
-                # convert to correct substrate number in holder
-                substrateNum = self.parent().getSubstrateNumber(i,j)
-                substrateID = self.parent().parent().samplewind.tableWidget.item(i,j).text()
-                
-                # Check if the holder has a substrate in that slot
-                if self.parent().parent().samplewind.tableWidget.item(i,j).text() != ""  and \
-                        self.parent().parent().samplewind.activeSubs[i,j] == True:
-                    self.colorCell.emit(i,j,"yellow")
-                    
-                    # Create DM if doesn't exist and update AcParams dataframe for correct architecture
-                    self.parent().parent().samplewind.checkCreateLotDM(substrateID, i, j)
-                    self.parent().parent().samplewind.setArchDfAcqParams(self.dfAcqParams, i,j)
-                    
-                    # Move stage to desired substrate
-                    if self.parent().xystage.xystageInit is True:
-                        self.Msg.emit("Moving stage to substrate #"+ \
-                                        str(self.parent().getSubstrateNumber(i,j))+ \
-                                        ": ("+str(4-i)+", "+str(4-j)+")")
-                        self.parent().xystage.move_to_substrate_4x4(substrateNum)
-                        time.sleep(0.1)
-                    else:
-                        print("Skipping acquisition: stage not activated.")
-                        break
-                    
-                    id_mpp_v = np.zeros((0,7))
-                    #self.devMaxPower = 0
-                    for dev_id in range(1,7):
-                        if self.stopAcqFlag == True:
-                            break
-                        self.Msg.emit(" Moving to device: " + str(dev_id)+", substrate #"+ \
-                                str(self.parent().getSubstrateNumber(i,j))) 
-                        deviceID = substrateID+str(dev_id)
-                        # prepare parameters, plots, tables for acquisition
-                        self.Msg.emit("  Acquiring JV from device: " + deviceID)
-                        
-                        # Switch to correct device and start acquisition of JV
-                        self.parent().xystage.move_to_device_3x2(self.parent().getSubstrateNumber(i, j), dev_id)
-                        self.switch_device(i, j, dev_id)
-                        
-                        # light JV
-                        # open the shutter
-                        self.parent().shutter.open()
-                        time.sleep(0.2)
-                        time.sleep(float(self.dfAcqParams.at[0,'Delay Before Meas']))
-                        JV_r, JV_f = self.measure_JV()
-
-                        # Acquire parameters
-                        perfData = self.analyseJV(JV_r)
-                        perfData_f = self.analyseJV(JV_f)
-                        perfData = np.vstack((perfData_f, perfData))
-                        
-                        self.acqJVComplete.emit(np.hstack((JV_r, JV_f)), perfData, deviceID, i, j)
-                        
-                        # Prepare stack for list of best devices
-                        JV = np.vstack((JV_r, JV_f))
-                        PV = np.zeros(JV.shape)
-                        PV[:,0] = JV[:,0]
-                        PV[:,1] = JV[:,0]*JV[:,1]
-                        max_i = np.argmin(PV[:,1])
-                        id_mpp_v = np.vstack(([dev_id, JV[max_i, 0]*JV[max_i, 1],JV[max_i, 0],
-                                    perfData[0][3], perfData[0][4], perfData[0][7],
-                                    perfData[0][8]],id_mpp_v))
-                        self.Msg.emit('  Device '+deviceID+' acquisition: complete')
-                    if self.stopAcqFlag == True:
-                            break
-                    
-                    id_mpp_v = id_mpp_v.astype(np.float32)
-                    id_mpp_v = id_mpp_v[sorted(range(len(id_mpp_v[:,1])), key=lambda k: id_mpp_v[:,1][k])]
-                    id_mpp_v[:,0] = id_mpp_v[:,0].astype('int')
-
-                    self.maxPowerDev.emit("\n Summary of device with max power: "+str(int(id_mpp_v[0,0])))
-                    self.maxPowerDev.emit("  Max power (mW/cm^2): {0:0.3e}".format(id_mpp_v[0,1]))
-                    self.maxPowerDev.emit("  V at Max power (V): {0:0.3e}".format(id_mpp_v[0,2]))
-                    self.maxPowerDev.emit("  Voc (V): {0:0.3e}".format(id_mpp_v[0,3]))
-                    self.maxPowerDev.emit("  Jsc (mA/cm^2): {0:0.3e}".format(id_mpp_v[0,4]))
-                    self.maxPowerDev.emit("  FF: {0:0.2f}".format(id_mpp_v[0,5]))
-                    self.maxPowerDev.emit("  PCE[%]: {0:0.2f}\n".format(id_mpp_v[0,6]))
-                    
-                    # Tracking
-                    time.sleep(1)
-                    tracking_points = int(self.dfAcqParams.at[0,'Num Track Devices'])
-                    # Switch to device with max power and start tracking
-                    for dev_id, mpp, v_mpp, voc_mpp, jsc_mpp, ff_mpp, pcs_mpp in id_mpp_v[:tracking_points, :]:
-                        dev_id = int(dev_id)
-                        v_mpp = float(v_mpp)
-                        
-                        # Move and activate correct device
-                        self.parent().xystage.move_to_device_3x2(self.parent().getSubstrateNumber(i, j), dev_id)
-                        self.switch_device(i, j, dev_id)
-                        time.sleep(float(self.dfAcqParams.at[0,'Delay Before Meas']))
-                        
-                        # Acquire dark JV
-                        # close the shutter
-                        self.parent().shutter.closed()
-                        time.sleep(0.2)
-
-                        self.Msg.emit(" Acquiring dark JV for device: "+substrateID+str(dev_id))
-                        dark_JV_r, dark_JV_f = self.measure_JV()
-                        perfDataDark = self.analyseDarkJV(dark_JV_r)
-                        perfDataDark_f = self.analyseDarkJV(dark_JV_f)
-                        perfDataDark = np.vstack((perfDataDark_f, perfDataDark))
-                        self.acqJVComplete.emit(np.hstack((dark_JV_r, dark_JV_f)),
-                                                perfDataDark, substrateID+str(dev_id), i, j)
-                        time.sleep(1)
-                        # tracking
-                        # open the shutter
-                        self.parent().shutter.open()
-                        time.sleep(0.2)
-        
-                        perfData, JV = self.tracking(substrateID+str(dev_id), v_mpp)
-                        self.Msg.emit(' Device '+substrateID+str(dev_id)+' tracking: complete')
-                        
-                    self.colorCell.emit(i,j,"green")
+                if self.switchOnly:
+                    self.Msg.emit(" Switching to device: " + str(dev_id)+", substrate #"+ \
+                        str(substrateNum))
+                else:
+                    self.Msg.emit(" Moving to device: " + str(dev_id)+", substrate #"+ \
+                        str(substrateNum))
+                deviceID = substrateID+str(dev_id)
+                # prepare parameters, plots, tables for acquisition
+                self.Msg.emit("  Acquiring JV from device: " + deviceID)
+
+                # Switch to correct device and start acquisition of JV
+                if not self.moveSwitchDevice(entry, dev_id):
+                    self.stageFailed()
+                    break
+
+                # light JV
+                # open the shutter
+                self.setShutter(True)
+                time.sleep(float(self.dfAcqParams.at[0,'Delay Before Meas']))
+                JV_r, JV_f = self.measure_JV(self.adaptiveSweep)
+
+                # Acquire parameters
+                perfData = self.analyseJV(JV_f, JV_r)
+
+                self.acqJVComplete.emit(np.hstack((JV_r, JV_f)), perfData, deviceID, i, j)
+
+                # Prepare stack for list of best devices
+                JV = np.vstack((JV_r, JV_f))
+                PV = np.zeros(JV.shape)
+                PV[:,0] = JV[:,0]
+                PV[:,1] = JV[:,0]*JV[:,1]
+                max_i = np.argmin(PV[:,1])
+                id_mpp_v = np.vstack(([dev_id, JV[max_i, 0]*JV[max_i, 1],JV[max_i, 0],
+                            perfData['Voc'][0], perfData['Jsc'][0], perfData['FF'][0],
+                            perfData['PCE'][0]],id_mpp_v))
+                self.Msg.emit('  Device '+deviceID+' acquisition: complete')
+            if self.stopAcqFlag == True:
+                    break
+
+            id_mpp_v = id_mpp_v.astype(np.float32)
+            id_mpp_v = id_mpp_v[sorted(range(len(id_mpp_v[:,1])), key=lambda k: id_mpp_v[:,1][k])]
+            id_mpp_v[:,0] = id_mpp_v[:,0].astype('int')
+
+            self.maxPowerDev.emit("\n Summary of device with max power: "+str(int(id_mpp_v[0,0])))
+            self.maxPowerDev.emit("  Max power (mW/cm^2): {0:0.3e}".format(id_mpp_v[0,1]))
+            self.maxPowerDev.emit("  V at Max power (V): {0:0.3e}".format(id_mpp_v[0,2]))
+            self.maxPowerDev.emit("  Voc (V): {0:0.3e}".format(id_mpp_v[0,3]))
+            self.maxPowerDev.emit("  Jsc (mA/cm^2): {0:0.3e}".format(id_mpp_v[0,4]))
+            self.maxPowerDev.emit("  FF: {0:0.2f}".format(id_mpp_v[0,5]))
+            self.maxPowerDev.emit("  PCE[%]: {0:0.2f}\n".format(id_mpp_v[0,6]))
+
+            # Tracking
+            time.sleep(1)
+            tracking_points = int(self.dfAcqParams.at[0,'Num Track Devices'])
+            # Switch to device with max power and start tracking
+            for dev_id, mpp, v_mpp, voc_mpp, jsc_mpp, ff_mpp, pcs_mpp in id_mpp_v[:tracking_points, :]:
+                dev_id = int(dev_id)
+                v_mpp = float(v_mpp)
+
+                # Move and activate correct device
+                if not self.moveSwitchDevice(entry, dev_id):
+                    self.stageFailed()
+                    break
+                time.sleep(float(self.dfAcqParams.at[0,'Delay Before Meas']))
+
+                # Acquire dark JV
+                # close the shutter
+                self.setShutter(False)
+
+                self.Msg.emit(" Acquiring dark JV for device: "+substrateID+str(dev_id))
+                dark_JV_r, dark_JV_f = self.measure_JV()
+                perfDataDark = self.analyseDarkJV(dark_JV_r)
+                perfDataDark_f = self.analyseDarkJV(dark_JV_f)
+                perfDataDark = np.concatenate((perfDataDark_f, perfDataDark))
+                self.acqJVComplete.emit(np.hstack((dark_JV_r, dark_JV_f)),
+                                        perfDataDark, substrateID+str(dev_id), i, j)
+                time.sleep(1)
+                # tracking
+                # open the shutter
+                self.setShutter(True)
+
+                perfData, JV = self.tracking(substrateID+str(dev_id), v_mpp)
+                self.Msg.emit(' Device '+substrateID+str(dev_id)+' tracking: complete')
+            if self.stopAcqFlag == True:
+                break
+
+            self.colorCell.emit(i,j,"green")
 
         # close the shutter
-        self.parent().shutter.closed()
-        self.Msg.emit("Acquisition Completed: "+ self.getDateTimeNow()[0] + \
-                " at "+self.getDateTimeNow()[1])
+        self.setShutter(False)
+        self.Msg.emit("Acquisition Completed: {0} at {1}".format(*self.getDateTimeNow()))
         self.endAcq()
 
     def endAcq(self):
+        self.executor.shutdown(wait=False)
         self.parent().parent().acquisitionwind.enableAcqPanel(True)
         self.parent().parent().samplewind.enableSamplePanel(True)
         self.parent().parent().enableButtonsAcq(True)
@@ -403,9 +479,52 @@ class acqThread(QThread):
     def switch_device(self, i,j, dev_id):
         "Switch operation devices"
         self.parent().switch_box.connect(*self.get_pcb_id(i,j, dev_id))
+
+    def planStagePath(self):
+        "Reorder the acquisition plan to minimize the total stage travel time"
+        xystage = self.parent().xystage
+        subOrder = xystage.plan_substrate_order([entry.substrateNum for entry in self.acqPlan])
+        plan = sorted(self.acqPlan, key=lambda entry: subOrder.index(entry.substrateNum))
+        if not self.switchOnly:
+            plan = [entry._replace(devices=xystage.plan_device_order(entry.substrateNum,
+                        entry.devices)) for entry in plan]
+        self.acqPlan = plan
+
+    def moveSwitchDevice(self, entry, dev_id):
+        "Move stage to device while switching to it (stage and switchbox are independent). False if the stage move failed"
+        if self.switchOnly:
+            self.switch_device(entry.i, entry.j, dev_id)
+            return True
+        switch = self.executor.submit(self.switch_device, entry.i, entry.j, dev_id)
+        moved = self.parent().xystage.move_to_device_3x2(entry.substrateNum, dev_id) is not None
+        switch.result()
+        return moved
+
+    def stageFailed(self):
+        "Abort the acquisition after a failed stage move: the run ends with endAcq"
+        self.Msg.emit(" Stage move failed: acquisition aborted")
+        self.stopAcqFlag = True
+
+    def createLotDM(self, entry):
+        "Create DM entry for the substrate if it does not exist (no GUI access)"
+        create_lot_DM(*entry.lotDM)
+
+    def setShutter(self, openFlag):
+        "Open/close the shutter, waiting for it to settle only when its state changes"
+        if openFlag:
+            self.parent().shutter.open()
+        else:
+            self.parent().shutter.closed()
+        if self.shutterOpen != openFlag:
+            time.sleep(0.2)
+        self.shutterOpen = openFlag
     
     ## measurements: JV - new flow
-    def measure_JV(self):
+    # With adaptive, the voltage steps are refined only near MPP and Voc
+    # (light JV only: there is no MPP to refine for dark JV). The refined
+    # list is derived from the soaked sweep of the previous device, so no
+    # extra sweep is needed (see adaptive_voltage_list).
+    def measure_JV(self, adaptive=False):
         self.parent().source_meter.set_mode('VOLT')
         self.parent().source_meter.on()
 
@@ -430,22 +549,43 @@ class acqThread(QThread):
         else:
             v_list = list(np.arange(v_f+1e-9, v_r-1e-9, -v_step))
 
-        self.parent().source_meter.set_output(voltage = polarity*v_soak)
-        time.sleep(soak_time)
-
         # measure
         def __sweep(v_list, hold_time):
             data = np.zeros((len(v_list), 2))
             data[:, 0] = v_list
+            # Use the sourcemeter internal sweep when available
+            if self.hwSweep:
+                try:
+                    data[:, 1] = polarity*self.parent().source_meter.sweep(
+                        polarity*np.array(v_list), hold_time, deviceArea)[:,1]
+                    return data
+                except:
+                    self.Msg.emit("  Hardware sweep failed: switching to software sweep")
+                    self.hwSweep = False
+                    self.parent().source_meter.set_mode('VOLT')
             for i in range(len(v_list)):
                 v = v_list[i]
                 self.parent().source_meter.set_output(voltage = polarity*v)
                 time.sleep(hold_time)
                 data[i, 1] = polarity*self.parent().source_meter.read_values(deviceArea)[1]
             return data
-        
-        JV_r = __sweep(v_list, hold_time)
-        JV_f = __sweep(v_list[::-1], hold_time)
+
+        # Non-uniform list of voltages, denser around MPP and Voc of the
+        # previous device of the substrate (the first one uses v_list)
+        v_meas = v_list
+        if adaptive and self.adaptiveList is not None:
+            v_meas = self.adaptiveList
+
+        self.parent().source_meter.set_output(voltage = polarity*v_soak)
+        time.sleep(soak_time)
+
+        JV_r = __sweep(v_meas, hold_time)
+        JV_f = __sweep(v_meas[::-1], hold_time)
+        if adaptive:
+            if len(v_meas) < len(v_list):
+                self.Msg.emit("  Adaptive sweep: {0:d} points instead of {1:d}".format(len(v_meas),len(v_list)))
+            self.adaptiveList = adaptive_voltage_list(JV_r[:,0], JV_r[:,1], v_list,
+                v_step, self.powerIn, self.adaptiveTol)
         return JV_r, JV_f
 
     ## measurements: voc, jsc
@@ -466,14 +606,11 @@ class acqThread(QThread):
 
     ## measurements: voc, jsc
     def calculate_voc_jsc(self, JV):
-        try:
-            jsc = interp1d(JV[:,0],JV[:,1])(0)
-            voc = interp1d(JV[:,1],JV[:,0])(0)
-        except:
+        voc, jsc = voc_jsc(*stack_jv([JV]))
+        if not (np.isfinite(voc[0]) and np.isfinite(jsc[0])):
             self.Msg.emit("Failed to calculate Voc and Jsc")
-            jsc = 0.
-            voc = 0.
-        return voc, jsc
+            return 0., 0.
+        return voc[0], jsc[0]
     
     # Tracking (take JV once and track Vpmax) - testing
     def tracking(self, deviceID, v_mpp):
@@ -498,8 +635,7 @@ class acqThread(QThread):
         # light JV
         # open the shutter
         self.Msg.emit("  Acquiring JV from device: " + deviceID)
-        self.parent().shutter.open()
-        time.sleep(0.2)
+        self.setShutter(True)
         JVtrack_r, JVtrack_f = self.measure_JV()
        
         # Prepare stack for list of best devices
@@ -512,12 +648,13 @@ class acqThread(QThread):
         v = PVtrack[:,0][max_i]
         mp = PVtrack[:,1][max_i]
 
-        perfData = np.zeros((0,10))
+        # Only new samples are emitted while tracking, the full series at the end.
+        # All samples are kept for saving, only the plotted series is bounded.
+        trackBuffer = PerfDataBuffer()
         JV = np.zeros([1,4], dtype=float)
-        data = np.array([0,0, 0, v, mp, 0,0,1])
-        data = np.hstack(([self.getDateTimeNow()[0],self.getDateTimeNow()[1]], data))
-        perfData = np.vstack((data, perfData))
-        self.tempTracking.emit(JV, perfData, deviceID, True, False)
+        data = make_perf_data([0, 0, v, mp, 0, 0], 1)
+        trackBuffer.append(data)
+        self.tempTracking.emit(JV, data, deviceID, True, False)
 
         self.Msg.emit(" Tracking device: "+deviceID+"...")
         start_time = time.time()
@@ -596,46 +733,24 @@ class acqThread(QThread):
             #         mp=mp
             #         print("else, mp=mp",mp)
 
-            data = np.array([ 0, 0, v, mp , 0, 0, 1])
-            data = np.hstack(([self.getDateTimeNow()[0],self.getDateTimeNow()[1],time.time() - start_time], data))
-            perfData = np.vstack((data, perfData))
-            self.tempTracking.emit(JV, perfData, deviceID, False, False)
+            data = make_perf_data([0, 0, v, mp, 0, 0], 1, time.time() - start_time)
+            trackBuffer.append(data)
+            self.trackingData.emit(data, deviceID)
             time.sleep(hold_track_time)
+        # Latest first, as saved in csv and DM
+        perfData = trackBuffer.data()[::-1]
         self.tempTracking.emit(JV, perfData, deviceID, False, True)
         return perfData, JV
     
-    # Extract parameters from JV
-    def analyseJV(self, JV):
-        PV = np.zeros(JV.shape)
-        PV[:,0] = JV[:,0]
-        PV[:,1] = JV[:,0]*JV[:,1]
-        # measurements: voc, jsc
-        Voc, Jsc = self.calculate_voc_jsc(JV)
-
-        # find mpp
-        ind_Pmax = np.argmin(PV[:,1])
-        Jpmax = JV[ind_Pmax,1]
-        Vpmax = JV[ind_Pmax,0]
-        
-        if Voc != 0. and Jsc != 0.:
-            FF = Vpmax*Jpmax/(Voc*Jsc)
-            effic = abs(100*Vpmax*Jpmax/self.powerIn)
-        else:
-            FF = 0.
-            effic = 0.
-        data = np.array([0, Voc, Jsc, Vpmax, Vpmax*Jpmax,FF,effic,1])
-        data = np.hstack((self.getDateTimeNow()[1], data))
-        data = np.hstack((self.getDateTimeNow()[0], data))
-        return np.array([data])
-        
+    # Extract parameters from one or more JV curves (one row per curve)
+    def analyseJV(self, *JVs):
+        return make_perf_data(analyse_jv(*stack_jv(JVs), self.powerIn), 1)
+
     def analyseDarkJV(self, JV):
-        data = np.array([0, 0, 0, 0, 0, 0, 0, 0])
-        data = np.hstack((self.getDateTimeNow()[1], data))
-        data = np.hstack((self.getDateTimeNow()[0], data))
-        return np.array([data])
+        return make_perf_data(np.zeros(len(PERF_METRICS)), 0)
 
     # Get date/time
     def getDateTimeNow(self):
-        return str(datetime.now().strftime('%Y-%m-%d')),\
-                    str(datetime.now().strftime('%H-%M-%S'))
+        now = datetime.now()
+        return now.strftime('%Y-%m-%d'), now.strftime('%H-%M-%S')
 
@@ -23,6 +23,13 @@ from PyQt5.QtCore import (pyqtSlot,QRectF,QRect)
 
 from . import logger
 
+# Estimated duration (s) of the steps of an acquisition not set in the panel
+NUM_DEVICES = 6
+SUBSTRATE_MOVE_TIME = 3
+DEVICE_MOVE_TIME = 1
+SWITCH_TIME = 0.5
+DM_LOT_TIME = 2
+
 ####################################################################
 #   Acquisition Window
 ####################################################################
@@ -137,6 +144,16 @@ class AcquisitionWindow(QMainWindow):
         self.menuBar = QMenuBar(MainWindow)
         self.menuBar.setGeometry(QRect(0, 0, 772, 22))
         self.menuBar.setObjectName("menubar")
+
+        self.switchOnlyMenu = QAction("&Move to substrate only (switchbox addressing)", self)
+        self.switchOnlyMenu.setCheckable(True)
+        self.switchOnlyMenu.setStatusTip('Illuminate the whole substrate and address devices only via the switchbox')
+        self.adaptiveSweepMenu = QAction("&Adaptive voltage steps (near MPP and Voc)", self)
+        self.adaptiveSweepMenu.setCheckable(True)
+        self.adaptiveSweepMenu.setStatusTip('Use finer voltage steps only around MPP and Voc')
+        optionsMenu = self.menuBar.addMenu('&Options')
+        optionsMenu.addAction(self.switchOnlyMenu)
+        optionsMenu.addAction(self.adaptiveSweepMenu)
         
         self.parent().viewWindowMenus(self.menuBar, self.parent())
         
@@ -193,6 +210,7 @@ class AcquisitionWindow(QMainWindow):
         self.numDevTrackText.valueChanged.connect(self.acquisitionTime)
         self.trackTText.editingFinished.connect(self.acquisitionTime)
         self.holdTrackTText.editingFinished.connect(self.acquisitionTime)
+        self.switchOnlyMenu.toggled.connect(self.acquisitionTime)
 
     # Grab acquisition parameters from Acquisition panel
     def grabParameters(self):
@@ -208,6 +226,8 @@ class AcquisitionWindow(QMainWindow):
         self.parent().config.conf['Acquisition']['acqTrackNumDevices'] = str(self.numDevTrackText.value())
         self.parent().config.conf['Acquisition']['acqTrackTime'] = str(self.trackTText.text())
         self.parent().config.conf['Acquisition']['acqHoldTrackTime'] = str(self.holdTrackTText.text())
+        self.parent().config.conf['Acquisition']['acqSwitchOnly'] = str(self.switchOnlyMenu.isChecked())
+        self.parent().config.conf['Acquisition']['acqAdaptiveSweep'] = str(self.adaptiveSweepMenu.isChecked())
 
     # Save acquisition parameters in configuration ini
     def saveParameters(self):
@@ -241,6 +261,8 @@ class AcquisitionWindow(QMainWindow):
         self.numDevTrackText.setValue(int(self.parent().config.acqTrackNumDevices))
         self.trackTText.setText(str(self.parent().config.acqTrackTime))
         self.holdTrackTText.setText(str(self.parent().config.acqHoldTrackTime))
+        self.switchOnlyMenu.setChecked(self.parent().config.acqSwitchOnly)
+        self.adaptiveSweepMenu.setChecked(self.parent().config.acqAdaptiveSweep)
         self.acquisitionTime()
 
     # Field validator for Reverse and Forward Voltages
@@ -297,29 +319,29 @@ class AcquisitionWindow(QMainWindow):
                 for i in range(self.parent().config.numSubsHolderCol):
                     if self.parent().samplewind.tableWidget.item(i,j).text() != "":
                         numActiveSubs +=1
-            #timePerDevice is one scan forward, but needs to be multiplied by 2 for the backwards scan
+            # One soak, then reverse and forward scans
+            timeJV = 2*len(np.arange(float(self.reverseVText.text())-1e-9,
+                                    float(self.forwardVText.text())+1e-9,
+                                    float(self.stepVText.text())))* \
+                                    float(self.holdTText.text()) + \
+                                    float(self.soakTText.text())
             #if holdtime=0, by default add 10 seconds for every device
-            if float(self.holdTText.text()) == 0:            
-                timePerDevice = 2*(len(np.arange(float(self.reverseVText.text())-1e-9,
-                                        float(self.forwardVText.text())+1e-9,
-                                        float(self.stepVText.text())))* \
-                                        float(self.holdTText.text()) + \
-                                        float(self.soakTText.text()) + \
-                                        float(self.delayBeforeMeasText.text())) + \
-                                        10
+            if float(self.holdTText.text()) == 0:
+                timeJV += 10
+            # The switchbox is set while the stage moves to the device
+            if self.switchOnlyMenu.isChecked():
+                timeToDevice = SWITCH_TIME
             else:
-                timePerDevice = 2*(len(np.arange(float(self.reverseVText.text())-1e-9,
-                                        float(self.forwardVText.text())+1e-9,
-                                        float(self.stepVText.text())))* \
-                                        float(self.holdTText.text()) + \
-                                        float(self.soakTText.text()) + \
-                                        float(self.delayBeforeMeasText.text()))
-            #When tracking is activated, software runs 1 dark JV + 1 light JV before the tracking, so 4*timePerDevice and 4*delayBeforeMeas
+                timeToDevice = max(DEVICE_MOVE_TIME, SWITCH_TIME)
+            timePerDevice = timeToDevice + float(self.delayBeforeMeasText.text()) + timeJV
+            # Per substrate: light JV of all devices, then dark JV and tracking
+            # of the best ones
+            timePerSubstrate = SUBSTRATE_MOVE_TIME + NUM_DEVICES*timePerDevice + 1 + \
+                float(self.numDevTrackText.text())*(timePerDevice + 1 + float(self.trackTText.text()))
+            # DM entries are created in the background while the previous
+            # substrate is measured: only the first one is waited for.
             if numActiveSubs >0:
-                totalAcqTime += 4*float(self.delayBeforeMeasText.text()) + \
-                    float(4*timePerDevice*numActiveSubs) +\
-                    float(self.numDevTrackText.text())*float(self.trackTText.text())+\
-                    float(self.delayBeforeMeasText.text())*numActiveSubs
+                totalAcqTime += DM_LOT_TIME + timePerSubstrate*numActiveSubs
         except:
             timePerDevice = 0
             totalAcqTime = 0
@@ -348,6 +370,8 @@ class AcquisitionWindow(QMainWindow):
         self.trackTText.setEnabled(flag)
         self.holdTrackTText.setEnabled(flag)
         self.numDevTrackText.setEnabled(flag)
+        self.switchOnlyMenu.setEnabled(flag)
+        self.adaptiveSweepMenu.setEnabled(flag)
         self.saveButton.setEnabled(flag)
         self.defaultButton.setEnabled(flag)
         self.saveCustomButton.setEnabled(flag)
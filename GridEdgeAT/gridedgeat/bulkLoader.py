@@ -0,0 +1,144 @@
+'''
+bulkLoader.py
+-------------
+Parallel loading of folders of saved device data (csv)
+
+Copyright (C) 2017-2019 Nicola Ferralis <ferralis@mit.edu>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+'''
+import os, time
+import numpy as np
+import pandas as pd
+import concurrent.futures
+from PyQt5.QtCore import (QThread, pyqtSignal)
+
+from .perfData import *
+from .jvAnalysis import *
+
+# Parse a csv file saved by ResultsWindow.save_csv.
+# Returns (deviceID, perfData, dfAcqParams, JV)
+# Metrics missing from the file, or blank, are NaN (see parse_csv_chunk).
+def parse_csv_file(filename):
+    dftot = pd.read_csv(filename, na_filter=False)
+    deviceID = str(dftot.at[0,'Device'])
+    dfPerfData = dftot.iloc[range(0,np.count_nonzero(dftot['Acq Date']))].copy()
+    for m in PERF_METRICS:
+        if m in dfPerfData:
+            dfPerfData[m] = pd.to_numeric(dfPerfData[m], errors='coerce')
+        else:
+            dfPerfData[m] = np.nan
+    perfData = perf_from_dataframe(dfPerfData)
+    JV = dftot[['V_f','J_f','V_r','J_r']].values[range(0,np.count_nonzero(dftot['V_r']))].astype(float)
+    dfAcqParams = dftot.loc[0:1, 'Acq Soak Voltage':'Comments']
+    return deviceID, perfData, dfAcqParams, JV
+
+# Parse a chunk of csv files (run in a worker process).
+# Stored metrics are kept. Metrics missing from light JV measurements
+# are computed from the JV curves, for all forward and reverse curves
+# of the chunk at once, with powerIn for PCE.
+# The csv JV columns are saved as hstack((JV_r, JV_f)), while perfData
+# has the forward scan in row 0 (as in Acquisition.analyseJV).
+# Returns a list of (filename, parsed data or None, error message)
+def parse_csv_chunk(filenames, powerIn):
+    results = []
+    for filename in filenames:
+        try:
+            results.append((filename, parse_csv_file(filename), ""))
+        except Exception as e:
+            results.append((filename, None, str(e)))
+    light = [r[1] for r in results if r[1] is not None and len(r[1][1]) == 2 and \
+            r[1][1]['Time step'][0] == 0 and r[1][1]['Light'][0] == 1 and \
+            any(np.isnan(r[1][1][m]).any() for m in PERF_METRICS)]
+    if len(light) > 0 and powerIn > 0:
+        JVs = []
+        for _, _, _, JV in light:
+            JVs += [JV[:,2:4], JV[:,0:2]]
+        metrics = analyse_jv(*stack_jv(JVs), powerIn)
+        for k, (_, perfData, _, _) in enumerate(light):
+            for i, m in enumerate(PERF_METRICS):
+                perfData[m] = np.where(np.isnan(perfData[m]), metrics[2*k:2*k+2,i], perfData[m])
+    return results
+
+# csv files in a folder tree, sorted by name
+def find_csv_files(folder):
+    filenames = []
+    for root, _, files in os.walk(folder):
+        filenames += [os.path.join(root, f) for f in files if f.lower().endswith(".csv")]
+    return sorted(filenames)
+
+####################################################################
+#   Bulk loader
+####################################################################
+# Files are parsed in a process pool, in chunks of chunkSize files.
+# Parsed devices are emitted in batches (loaded signal) as chunks
+# complete, at most every batchInterval s, so that the results table is
+# updated once per batch. stop() cancels the chunks not yet started.
+class BulkLoader(QThread):
+    Msg = pyqtSignal(str)
+    progress = pyqtSignal(int, int)
+    loaded = pyqtSignal(list)
+
+    def __init__(self, folder, powerIn, chunkSize=50, maxWorkers=None,
+                 batchInterval=0.5, parent=None):
+        super(BulkLoader, self).__init__(parent)
+        self.folder = folder
+        self.powerIn = powerIn
+        self.chunkSize = chunkSize
+        self.maxWorkers = maxWorkers
+        self.batchInterval = batchInterval
+        self.stopFlag = False
+
+    def __del__(self):
+        self.wait()
+
+    def stop(self):
+        self.stopFlag = True
+
+    def run(self):
+        filenames = find_csv_files(self.folder)
+        numFiles = len(filenames)
+        self.Msg.emit(" Bulk loading {0:d} csv files from: ".format(numFiles)+self.folder)
+        self.progress.emit(0, numFiles)
+        numDone, numFailed = 0, 0
+        batch, lastEmit = [], time.time()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.maxWorkers) as pool:
+            chunks = {pool.submit(parse_csv_chunk, filenames[k:k+self.chunkSize], self.powerIn): \
+                len(filenames[k:k+self.chunkSize]) for k in range(0, numFiles, self.chunkSize)}
+            pending = set(chunks)
+            while len(pending) > 0:
+                if self.stopFlag:
+                    for f in pending:
+                        f.cancel()
+                    break
+                done, pending = concurrent.futures.wait(pending, timeout=0.2,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                for f in done:
+                    try:
+                        results = f.result()
+                    except Exception as e:
+                        self.Msg.emit(" Bulk loading: chunk failed ("+str(e)+")")
+                        numDone += chunks[f]
+                        numFailed += chunks[f]
+                        continue
+                    for filename, data, err in results:
+                        if data is None:
+                            numFailed += 1
+                            self.Msg.emit(" Loading file failed: "+filename+" ("+err+")")
+                        else:
+                            batch.append(data)
+                    numDone += len(results)
+                self.progress.emit(numDone, numFiles)
+                if len(batch) > 0 and (time.time() - lastEmit > self.batchInterval or len(pending) == 0):
+                    self.loaded.emit(batch)
+                    batch, lastEmit = [], time.time()
+        if len(batch) > 0:
+            self.loaded.emit(batch)
+        if self.stopFlag:
+            self.Msg.emit(" Bulk loading cancelled: {0:d}/{1:d} files loaded".format(numDone-numFailed, numFiles))
+        else:
+            self.Msg.emit(" Bulk loading complete: {0:d}/{1:d} files loaded".format(numDone-numFailed, numFiles))
@@ -40,6 +40,7 @@ class CameraWindow(QMainWindow):
         self.config.readConfig(self.config.configFile)
         self.numRow = self.config.numSubsHolderRow
         self.numCol = self.config.numSubsHolderCol
+        camera_session(self.config.cameraIdleTimeout)
     
     def initUI(self):
         # Set up Window geometry and shape
@@ -166,7 +167,9 @@ class CameraWindow(QMainWindow):
         if self.parent().stagewind.activeStage:
             self.parent().stagewind.activateStage()
         self.xystage = XYstage(self.parent().config.xDefStageOrigin,
-                            self.parent().config.yDefStageOrigin)
+                            self.parent().config.yDefStageOrigin,
+                            self.config.stageCalibration(),
+                            self.config.stagePosTolerance)
         if self.xystage.xystageInit == False:
             self.printMsg(" Stage not activated: automated acquisition not possible. Aborting.")
             self.autoAlignBtn.setEnabled(True)
@@ -178,46 +181,72 @@ class CameraWindow(QMainWindow):
         ##########################
         self.openShutter()
         
+        # Offsets are measured from nominal positions: the calibration is
+        # replaced by that of the substrates aligned now (slots not aligned
+        # may hold different substrates)
+        correction = self.config.stageCalibration() is not None
+        if correction:
+            self.xystage.clear_calibration()
+
         self.firstRun = True
+        # The same camera feed (and session) is used for all substrates
+        self.cam = CameraFeed()
+        # Active substrates, visited in the order minimizing stage travel
+        subsList = {}
         for j in range(self.numCol):
             for i in range(self.numRow):
-                # Convert to correct substrate number in holder
-                substrateNum = Acquisition().getSubstrateNumber(i,j)
-                
-                # Check if the holder has a substrate in that slot
                 if self.parent().samplewind.tableWidget.item(i,j).text() != ""  and \
                         self.parent().samplewind.activeSubs[i,j] == True:
-                    self.parent().samplewind.colorCellAcq(i,j,"yellow")
-                                        
-                    # Move stage to desired substrate
-                    if self.xystage.xystageInit is True:
-                        self.printMsg("\nMoving stage to substrate #"+ \
-                                        str(substrateNum) + \
-                                        ": ("+str(4-i)+", "+str(4-j)+")")
-                        self.xystage.move_to_substrate_4x4(substrateNum)
-                        time.sleep(0.1)
-
-                        # Perform alignment analysis 
-                        self.cam = CameraFeed()
-                        self.setWindowTitle('Camera Alignment Panel - Substrate #'+\
-                                    str(substrateNum)+" ("+\
-                                    self.parent().samplewind.tableWidget.item(i,j).text()+")")
-                        self.setSelWindow(False)
-                        if hasattr(self,"cam"):
-                            alignFlag, alignPerc, iMax = self.alignment()
-                        else:
-                            self.deactivateStage()
-                            return
-                        if alignFlag == 0:
-                            self.parent().samplewind.colorCellAcq(i,j,"white")
-                            self.printMsg(" Substrate #"+str(substrateNum)+" aligned (alignPerc = "+ str(alignPerc)+")")
-                        else:
-                            self.parent().samplewind.colorCellAcq(i,j,"grey")
-                            if alignFlag == 1:
-                                self.printMsg(" Substrate #"+str(substrateNum)+" Empty! (alignPerc = "+ str(alignPerc)+")")
-                            if alignFlag == 2:
-                                self.printMsg(" Substrate #"+str(substrateNum)+" not aligned! (alignPerc = "+ str(alignPerc)+")")
-                        self.delCam()
+                    # Convert to correct substrate number in holder
+                    subsList[Acquisition().getSubstrateNumber(i,j)] = (i,j)
+
+        for substrateNum in self.xystage.plan_substrate_order(list(subsList.keys())):
+            i, j = subsList[substrateNum]
+            self.parent().samplewind.colorCellAcq(i,j,"yellow")
+
+            # Move stage to desired substrate
+            if self.xystage.xystageInit is True:
+                self.printMsg("\nMoving stage to substrate #"+ \
+                                str(substrateNum) + \
+                                ": ("+str(4-i)+", "+str(4-j)+")")
+                if self.xystage.move_to_substrate_4x4(substrateNum) is None:
+                    self.parent().samplewind.colorCellAcq(i,j,"grey")
+                    self.printMsg(" Stage move failed: substrate #"+str(substrateNum)+" not aligned")
+                    continue
+                time.sleep(0.1)
+
+                # Perform alignment analysis
+                self.setWindowTitle('Camera Alignment Panel - Substrate #'+\
+                            str(substrateNum)+" ("+\
+                            self.parent().samplewind.tableWidget.item(i,j).text()+")")
+                # Device windows are either detected or set by the operator
+                if self.config.alignmentAutoROI == True:
+                    self.cameraFeed(False)
+                else:
+                    self.setSelWindow(False)
+                if hasattr(self,"cam"):
+                    alignFlag, alignPerc, iMax = self.alignment()
+                else:
+                    self.deactivateStage()
+                    return
+                if correction:
+                    alignFlag = self.correctAlignment(substrateNum, alignFlag)
+                if alignFlag == 0:
+                    self.parent().samplewind.colorCellAcq(i,j,"white")
+                    self.printMsg(" Substrate #"+str(substrateNum)+" aligned (alignPerc = "+ str(alignPerc)+")")
+                else:
+                    self.parent().samplewind.colorCellAcq(i,j,"grey")
+                    if alignFlag == 1:
+                        self.printMsg(" Substrate #"+str(substrateNum)+" Empty! (alignPerc = "+ str(alignPerc)+")")
+                    if alignFlag == 2:
+                        self.printMsg(" Substrate #"+str(substrateNum)+" not aligned! (alignPerc = "+ str(alignPerc)+")")
+        self.delCam()
+        if correction:
+            try:
+                self.xystage.save_calibration()
+                self.printMsg(" Stage calibration saved in: "+self.config.stageCalibFile)
+            except:
+                self.printMsg(" Stage calibration NOT saved")
         self.printMsg("\nAuto-alignment completed")
         self.deactivateStage()
         self.closeShutter()
@@ -274,6 +303,10 @@ class CameraWindow(QMainWindow):
             
     # Alignment routine
     def alignment(self):
+        if self.config.alignmentAutoROI == True and self.isAutoAlign:
+            return self.alignmentAutoROI()
+        if self.config.alignmentDeviceROIs == True:
+            return self.alignmentDevices()
         image, image_data, image_orig = self.cam.get_image(True,
                              int(self.initial.x()),
                              int(self.final.x()),
@@ -286,17 +319,93 @@ class CameraWindow(QMainWindow):
         print(" DEBUG: alignPerc: ",alignPerc,"; iMax: ",iMax)
 
         self.checkAlignText.setText(str(alignPerc))
-        if float(alignPerc) > self.config.alignmentContrastDefault:
+        alignFlag = self.getAlignFlag(alignPerc, iMax)
+        if alignFlag != 0:
             self.checkAlignText.setStyleSheet("color: rgb(255, 0, 255);")
+        return alignFlag, alignPerc, iMax
+
+    # Alignment of the 6 device windows within the selected window, from
+    # the same frame. The substrate is empty if all windows are empty,
+    # aligned if all windows are aligned, misaligned otherwise.
+    def alignmentDevices(self):
+        rois = split_roi(int(self.initial.x()), int(self.final.x()),
+                         int(self.initial.y()), int(self.final.y()))
+        results = self.cam.check_alignment_rois(self.config.alignmentIntThreshold, rois)
+        return self.alignmentROIs(results)
+
+    # Alignment with the device windows detected automatically in the
+    # frame. The substrate is misaligned also if not all windows are
+    # found, or if it is offset by more than alignmentMaxOffset mm.
+    def alignmentAutoROI(self):
+        self.alignCorrectable = False
+        if getattr(self.cam, 'img', None) is None:
+            self.printMsg(" No frame from camera: alignment not possible")
+            return 2, "0.000", 0
+        windows = detect_device_windows(self.cam.img, self.xystage.pitchDevX,
+            self.xystage.pitchDevY, self.config.cameraPixelsPerMM)
+        self.alignOffset = windows.offset
+        for x1, x2, y1, y2 in windows.rois:
+            self.scene.addItem(QGraphicsSelectionItem(QPointF(x1,y1), QPointF(x2,y2)))
+        if windows.found == 0:
+            self.checkAlignText.setText("0.000")
+            self.checkAlignText.setStyleSheet("color: rgb(255, 0, 255);")
+            return 1, "0.000", 0
+        self.printMsg(" Device windows found: {0:d}/{1:d}; offset [mm]: ({2:0.3f}, {3:0.3f})".format(
+            windows.found, len(windows.rois), *windows.offset))
+        results = self.cam.check_alignment_rois(self.config.alignmentIntThreshold, windows.rois)
+        alignFlag, alignPerc, iMax = self.alignmentROIs(results)
+        self.alignCorrectable = alignFlag == 0 and windows.found == len(windows.rois) and \
+                np.hypot(*windows.offset) <= self.config.alignmentMaxCorrection
+        if alignFlag == 0 and (windows.found < len(windows.rois) or \
+                np.hypot(*windows.offset) > self.config.alignmentMaxOffset):
+            alignFlag = 2
+            self.checkAlignText.setStyleSheet("color: rgb(255, 0, 255);")
+        return alignFlag, alignPerc, iMax
+
+    # Correction mode: the offset of the substrate measured from the camera
+    # is stored as stage calibration for its devices, if all windows were
+    # found and the offset is within alignmentMaxCorrection mm. The
+    # substrate is then considered aligned. Otherwise the calibration of the
+    # substrate is removed.
+    def correctAlignment(self, substrateNum, alignFlag):
+        if self.alignCorrectable:
+            offset = [self.config.cameraStageSignX*self.alignOffset[0],
+                      self.config.cameraStageSignY*self.alignOffset[1]]
+            self.xystage.set_substrate_offset(substrateNum, offset)
+            self.printMsg(" Substrate #"+str(substrateNum)+ \
+                ": devices corrected by ({0:0.3f}, {1:0.3f}) mm".format(*offset))
+            return 0
+        self.xystage.set_substrate_offset(substrateNum, None)
+        return alignFlag
+
+    # Alignment from the results of the device windows
+    def alignmentROIs(self, results):
+        flags = []
+        for dev, res in enumerate(results, 1):
+            flags.append(self.getAlignFlag(res.contrast, res.iMax))
+            print(" Device {0:d}: alignPerc: {1:0.3f}; iMax: {2}; centroid: ({3:0.1f}, {4:0.1f})".format(
+                dev, res.contrast, res.iMax, *res.centroid))
+        if all([f == 1 for f in flags]):
             alignFlag = 1
+        elif all([f == 0 for f in flags]):
+            alignFlag = 0
         else:
-            if float(iMax) > self.config.alignmentIntMax:
-                self.checkAlignText.setStyleSheet("color: rgb(255, 0, 255);")
-                alignFlag = 2
-            else:
-                alignFlag = 0
+            alignFlag = 2
+        alignPerc = "{0:0.3f}".format(np.mean([res.contrast for res in results]))
+        iMax = max([res.iMax for res in results])
+        self.checkAlignText.setText(alignPerc)
+        if alignFlag != 0:
+            self.checkAlignText.setStyleSheet("color: rgb(255, 0, 255);")
         return alignFlag, alignPerc, iMax
 
+    # 0: aligned, 1: empty, 2: misaligned
+    def getAlignFlag(self, alignPerc, iMax):
+        if float(alignPerc) > self.config.alignmentContrastDefault:
+            return 1
+        if float(iMax) > self.config.alignmentIntMax:
+            return 2
+        return 0
+
     # Get image from feed
     def cameraFeed(self, live):
         self.scene.cleanup()
@@ -495,7 +604,11 @@ class CameraWindow(QMainWindow):
             x = int(self.end.x())
             y = int(self.end.y())
             if x > 0 and y > 0 and x < img_x and y < img_y:
-                intensity = cv2.cvtColor(self.cam.img, cv2.COLOR_RGB2GRAY)[y,x]
+                # Use the grayscale frame already shown, if available
+                if self.cam.gray is not None and self.cam.gray.shape == (img_y, img_x):
+                    intensity = self.cam.gray[y,x]
+                else:
+                    intensity = cv2.cvtColor(self.cam.img, cv2.COLOR_RGB2GRAY)[y,x]
                 msg = " Int: <b>"+str(intensity)+"</b> - ["+str(x)+", "+str(y)+"] "
                 #self.printMsg(msg)
                 #self.statusBar().showMessage(msg)
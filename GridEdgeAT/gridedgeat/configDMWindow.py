@@ -150,7 +150,7 @@ class DataManagementWindow(QMainWindow):
     def dbCheckConnect(self):
         self.dbConnect = DataManagement(self.getDbConnectionInfo())
         try:
-            if self.dbConnect.connectDB()[1] is True:
+            if self.dbConnect.connectDB(forceCheck=True)[1] is True:
                 self.dbConnectResultLabel.setText("Connection successful")
                 print("Connection to Data-Management successful")
         except:
@@ -37,6 +37,10 @@ class Configuration():
         Path(self.customConfigFolder).mkdir(parents=True, exist_ok=True)
         self.archFolder = self.generalFolder+'architectures/'
         Path(self.archFolder).mkdir(parents=True, exist_ok=True)
+        self.spoolFolder = self.generalFolder+'spool/'
+        Path(self.spoolFolder).mkdir(parents=True, exist_ok=True)
+        self.dataIndexFile = self.generalFolder+'dataIndex.sqlite'
+        self.stageCalibFile = self.generalFolder+'stageCalibration.json'
         self.conf = configparser.ConfigParser()
         self.conf.optionxform = str
     
@@ -77,19 +81,33 @@ class Configuration():
             'acqTrackNumDevices' : 2,
             'acqTrackTime' : 5,
             'acqHoldTrackTime': 0.5,
+            'acqSwitchOnly' : False,
+            'acqAdaptiveSweep' : False,
+            'acqAdaptiveTol' : 0.01,
             }
     def defineConfInstr(self):
         self.conf['Instruments'] = {
             'alignmentIntThreshold' : 0.6,
             'alignmentContrastDefault' : 40,
             'alignmentIntMax' : 255,
+            'alignmentDeviceROIs' : False,
+            'cameraIdleTimeout' : 60,
+            'cameraPixelsPerMM' : 20,
+            'alignmentAutoROI' : False,
+            'alignmentMaxOffset' : 0.5,
+            'alignmentCorrection' : False,
+            'alignmentMaxCorrection' : 2.0,
+            'cameraStageSignX' : 1,
+            'cameraStageSignY' : 1,
             'powermeterID' : "USB0::0x1313::0x8072::P2008173::INSTR",
             'irradiance1Sun' : 100,
             'irradianceSensorArea' : 0.1575,
             'switchboxID' : "GPIB0::16::INSTR",
             'sourcemeterID' : "GPIB0::24::INSTR",
+            'sourcemeterHwSweep' : True,
             'xDefStageOrigin' : 25,
             'yDefStageOrigin' : 120,
+            'stagePosTolerance' : 0.02,
             'xPosRefCell' : 234,
             'yPosRefCell' : 124,
             'xPosPowermeter' : 229,
@@ -104,8 +122,13 @@ class Configuration():
             'loggingFilename' : self.logFile,
             'csvSavingFolder' : self.dataFolder,
             'saveLocalCsv' : True,
+            'saveRunArchive' : True,
+            'dataIndexEnabled' : True,
             'logPlotJV' : False,
             'validateSubName' : False,
+            'trackMaxSamples' : 100000,
+            'trackMaxPlotPoints' : 2000,
+            'plotMaxFPS' : 10,
             }
     def defineConfDM(self):
         self.conf['DM'] = {
@@ -117,6 +140,15 @@ class Configuration():
             'DbPassword' : "Tata",
             'DbHttpPortNumber' : "3000",
             'DbHttpPath' : "/api/Measurements",
+            'DbQueueSize' : 100,
+            'DbMaxRetries' : 5,
+            'DbRetryBackoff' : 2,
+            'DbSpoolRetryInterval' : 60,
+            'DbBatchSubmit' : True,
+            'DbBatchTimeout' : 120,
+            'DbCacheEnabled' : True,
+            'DbCacheSize' : 2000,
+            'DbCacheTTL' : 24,
             }
 
     # Read configuration file into usable variables
@@ -150,17 +182,31 @@ class Configuration():
             self.acqTrackNumDevices = self.conf.getint('Acquisition','acqTrackNumDevices')
             self.acqTrackTime = self.conf.getint('Acquisition','acqTrackTime')
             self.acqHoldTrackTime = self.conf.getfloat('Acquisition','acqHoldTrackTime')
+            self.acqSwitchOnly = self.conf.getboolean('Acquisition','acqSwitchOnly')
+            self.acqAdaptiveSweep = self.conf.getboolean('Acquisition','acqAdaptiveSweep')
+            self.acqAdaptiveTol = self.conf.getfloat('Acquisition','acqAdaptiveTol')
 
             self.alignmentIntThreshold = self.conf.getfloat('Instruments','alignmentIntThreshold')
             self.alignmentContrastDefault = self.conf.getfloat('Instruments','alignmentContrastDefault')
             self.alignmentIntMax = self.conf.getfloat('Instruments','alignmentIntMax')
+            self.alignmentDeviceROIs = self.conf.getboolean('Instruments','alignmentDeviceROIs')
+            self.cameraIdleTimeout = self.conf.getfloat('Instruments','cameraIdleTimeout')
+            self.cameraPixelsPerMM = self.conf.getfloat('Instruments','cameraPixelsPerMM')
+            self.alignmentAutoROI = self.conf.getboolean('Instruments','alignmentAutoROI')
+            self.alignmentMaxOffset = self.conf.getfloat('Instruments','alignmentMaxOffset')
+            self.alignmentCorrection = self.conf.getboolean('Instruments','alignmentCorrection')
+            self.alignmentMaxCorrection = self.conf.getfloat('Instruments','alignmentMaxCorrection')
+            self.cameraStageSignX = self.conf.getfloat('Instruments','cameraStageSignX')
+            self.cameraStageSignY = self.conf.getfloat('Instruments','cameraStageSignY')
             self.powermeterID = self.instrConfig['powermeterID']
             self.irradiance1Sun = self.conf.getfloat('Instruments','irradiance1Sun')
             self.irradianceSensorArea = self.conf.getfloat('Instruments','irradianceSensorArea')
             self.switchboxID = self.instrConfig['switchboxID']
             self.sourcemeterID = self.instrConfig['sourcemeterID']
+            self.sourcemeterHwSweep = self.conf.getboolean('Instruments','sourcemeterHwSweep')
             self.xDefStageOrigin = self.conf.getint('Instruments','xDefStageOrigin')
             self.yDefStageOrigin = self.conf.getint('Instruments','yDefStageOrigin')
+            self.stagePosTolerance = self.conf.getfloat('Instruments','stagePosTolerance')
             self.xPosRefCell = self.conf.getint('Instruments','xPosRefCell')
             self.yPosRefCell = self.conf.getint('Instruments','yPosRefCell')
             self.xPosPowermeter = self.conf.getint('Instruments','xPosPowermeter')
@@ -173,8 +219,13 @@ class Configuration():
             self.loggingFilename = self.sysConfig['loggingFilename']
             self.csvSavingFolder = self.sysConfig['csvSavingFolder']
             self.saveLocalCsv = self.conf.getboolean('System','saveLocalCsv')
+            self.saveRunArchive = self.conf.getboolean('System','saveRunArchive')
+            self.dataIndexEnabled = self.conf.getboolean('System','dataIndexEnabled')
             self.logPlotJV = self.conf.getboolean('System','logPlotJV')
             self.validateSubName = self.conf.getboolean('System','validateSubName')
+            self.trackMaxSamples = self.conf.getint('System','trackMaxSamples')
+            self.trackMaxPlotPoints = self.conf.getint('System','trackMaxPlotPoints')
+            self.plotMaxFPS = self.conf.getfloat('System','plotMaxFPS')
         
             self.submitToDb = self.conf.getboolean('DM','submitToDb')
             self.DbHostname = self.dmConfig['DbHostname']
@@ -184,6 +235,15 @@ class Configuration():
             self.DbPassword = self.dmConfig['DbPassword']
             self.DbHttpPortNumber = self.dmConfig['DbHttpPortNumber']
             self.DbHttpPath = self.dmConfig['DbHttpPath']
+            self.DbQueueSize = self.conf.getint('DM','DbQueueSize')
+            self.DbMaxRetries = self.conf.getint('DM','DbMaxRetries')
+            self.DbRetryBackoff = self.conf.getfloat('DM','DbRetryBackoff')
+            self.DbSpoolRetryInterval = self.conf.getfloat('DM','DbSpoolRetryInterval')
+            self.DbBatchSubmit = self.conf.getboolean('DM','DbBatchSubmit')
+            self.DbBatchTimeout = self.conf.getfloat('DM','DbBatchTimeout')
+            self.DbCacheEnabled = self.conf.getboolean('DM','DbCacheEnabled')
+            self.DbCacheSize = self.conf.getint('DM','DbCacheSize')
+            self.DbCacheTTL = self.conf.getfloat('DM','DbCacheTTL')
 
         except:
             print("Configuration file is for an earlier version of the software")
@@ -195,6 +255,16 @@ class Configuration():
             self.createConfig()
             self.readConfig(configFile)
 
+    # Stage calibration file, if the correction of device positions is active.
+    # Offsets are measured only with automatic detection of device windows,
+    # so the correction requires alignmentAutoROI.
+    def stageCalibration(self):
+        if self.alignmentCorrection == True and self.alignmentAutoROI == True:
+            return self.stageCalibFile
+        if self.alignmentCorrection == True:
+            print(" alignmentCorrection requires alignmentAutoROI: stage calibration not used")
+        return None
+
     # Save current parameters in configuration file
     def saveConfig(self, configFile):
         try:
@@ -0,0 +1,278 @@
+'''
+dataIndex.py
+------------
+Persistent index (SQLite) of the device data saved locally (csv)
+
+Copyright (C) 2017-2019 Nicola Ferralis <ferralis@mit.edu>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+'''
+import os, sys, time, queue, sqlite3, threading, argparse
+from contextlib import closing, contextmanager
+import numpy as np
+from PyQt5.QtCore import (QThread, pyqtSignal)
+
+from .perfData import *
+from .resultsStore import meas_type
+from .bulkLoader import parse_csv_file, find_csv_files
+
+INDEX_COLUMNS = ['path', 'folder', 'mtime', 'size', 'deviceID', 'substrate', 'measType',
+                'acqDate', 'acqTime', 'epoch', 'Voc', 'Jsc', 'VPP', 'MPP', 'FF', 'PCE']
+# Version of the files table, increase when INDEX_COLUMNS change
+INDEX_VERSION = 2
+
+# Summary of a csv file, as a row ordered as INDEX_COLUMNS.
+# For JV the metrics are averaged over forward and reverse scans,
+# for tracking the latest time step is used (tracking data is stored
+# latest first, and only holds VPP and MPP).
+def index_row(path):
+    st = os.stat(path)
+    deviceID, perfData, _, _ = parse_csv_file(path)
+    measType = meas_type(perfData)
+    if measType == 'tracking':
+        summary = perfData[:1]
+    else:
+        summary = perfData
+    acqDate, acqTime = perf_date_time(perfData[0])
+    return (path, os.path.dirname(path), st.st_mtime, st.st_size, deviceID, deviceID[:-1],
+        measType, acqDate, acqTime, float(perfData['Acq Epoch'][0])) + \
+        tuple(float(np.mean(summary[m])) for m in ['Voc', 'Jsc', 'VPP', 'MPP', 'FF', 'PCE'])
+
+####################################################################
+#   Data index
+####################################################################
+# One row per csv file, keyed by path. Files are re-indexed only when
+# their modification time or size change; rows of deleted files are
+# removed. Files that cannot be parsed are recorded (table failed), and
+# parsed again only when they change. Queries never read the csv files.
+# An index with an older layout is dropped and rebuilt on the next update.
+class DataIndex():
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        with self.lock, self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+                conn.execute("DROP TABLE IF EXISTS files")
+                conn.execute("DROP TABLE IF EXISTS failed")
+                conn.execute("PRAGMA user_version = {0:d}".format(INDEX_VERSION))
+            conn.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, "
+                "folder TEXT, mtime REAL, size INTEGER, deviceID TEXT, substrate TEXT, "
+                "measType TEXT, acqDate TEXT, acqTime TEXT, epoch REAL, "
+                "Voc REAL, Jsc REAL, VPP REAL, MPP REAL, FF REAL, PCE REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS files_device ON files (deviceID)")
+            conn.execute("CREATE INDEX IF NOT EXISTS files_substrate ON files (substrate)")
+            conn.execute("CREATE INDEX IF NOT EXISTS files_folder ON files (folder)")
+            conn.execute("CREATE INDEX IF NOT EXISTS files_epoch ON files (epoch)")
+            conn.execute("CREATE TABLE IF NOT EXISTS failed (path TEXT PRIMARY KEY, "
+                "folder TEXT, mtime REAL, size INTEGER, error TEXT)")
+
+    # Connection used as a single transaction, closed on exit
+    @contextmanager
+    def connect(self):
+        with closing(sqlite3.connect(self.filename, timeout=10)) as conn:
+            with conn:
+                yield conn
+
+    # Bring the index up to date with a folder (and its subfolders if
+    # recursive). Returns the number of files (re)indexed and removed, and
+    # the list of (path, error) of the files that failed to parse.
+    def update(self, folder, recursive=True, stopFlag=lambda: False):
+        folder = os.path.normpath(folder)
+        if recursive:
+            paths = find_csv_files(folder)
+        else:
+            try:
+                paths = sorted([os.path.join(folder, f) for f in os.listdir(folder) \
+                    if f.lower().endswith(".csv")])
+            except OSError:
+                paths = []
+        if recursive:
+            where, args = "WHERE folder=? OR folder LIKE ?", (folder, folder.rstrip(os.sep)+os.sep+"%")
+        else:
+            where, args = "WHERE folder=?", (folder,)
+        with self.lock, self.connect() as conn:
+            rows = conn.execute("SELECT path, mtime, size FROM files "+where, args).fetchall()
+            failedPrev = conn.execute("SELECT path, mtime, size FROM failed "+where, args).fetchall()
+        indexed = {r[0]: (r[1], r[2]) for r in rows}
+        indexed.update({r[0]: (r[1], r[2]) for r in failedPrev})
+
+        changed = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if indexed.get(path) != (st.st_mtime, st.st_size):
+                changed.append(path)
+        removed = list(set(indexed) - set(paths))
+
+        newRows, failed, failedRows = [], [], []
+        for path in changed:
+            if stopFlag():
+                break
+            try:
+                newRows.append(index_row(path))
+            except Exception as e:
+                failed.append((path, str(e)))
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                failedRows.append((path, os.path.dirname(path), st.st_mtime, st.st_size, str(e)))
+        with self.lock, self.connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO files VALUES ("+ \
+                ",".join("?"*len(INDEX_COLUMNS))+")", newRows)
+            conn.executemany("INSERT OR REPLACE INTO failed VALUES (?,?,?,?,?)", failedRows)
+            conn.executemany("DELETE FROM files WHERE path=?", [(r[0],) for r in failedRows])
+            conn.executemany("DELETE FROM failed WHERE path=?", [(r[0],) for r in newRows])
+            conn.executemany("DELETE FROM files WHERE path=?", [(p,) for p in removed])
+            conn.executemany("DELETE FROM failed WHERE path=?", [(p,) for p in removed])
+        return len(newRows), len(removed), failed
+
+    # Indexed files matching the given filters (None matches all), newest
+    # first. deviceID and substrate match as prefixes. Dates as DATE_FORMAT.
+    def query(self, deviceID=None, substrate=None, measType=None,
+              dateFrom=None, dateTo=None, minPCE=None, limit=None):
+        where, args = [], []
+        if deviceID:
+            where.append("deviceID LIKE ?")
+            args.append(deviceID+"%")
+        if substrate:
+            where.append("substrate LIKE ?")
+            args.append(substrate+"%")
+        if measType:
+            where.append("measType=?")
+            args.append(measType)
+        if dateFrom:
+            where.append("acqDate>=?")
+            args.append(dateFrom)
+        if dateTo:
+            where.append("acqDate<=?")
+            args.append(dateTo)
+        if minPCE is not None:
+            where.append("PCE>=?")
+            args.append(minPCE)
+        sql = "SELECT * FROM files"
+        if len(where) > 0:
+            sql += " WHERE "+" AND ".join(where)
+        sql += " ORDER BY epoch DESC"
+        if limit is not None:
+            sql += " LIMIT {0:d}".format(int(limit))
+        with self.connect() as conn:
+            rows = conn.execute(sql, args).fetchall()
+        return [dict(zip(INDEX_COLUMNS, r)) for r in rows]
+
+    def __len__(self):
+        with self.connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+####################################################################
+#   Data indexer
+####################################################################
+# Keeps the index up to date in the background: the whole folder tree
+# is checked at start and when the folder changes; afterwards only the
+# folders reported as changed (see rescan) are checked again.
+# The folders signal lists the folders of the tree, to be watched.
+class DataIndexer(QThread):
+    Msg = pyqtSignal(str)
+    folders = pyqtSignal(list)
+    updated = pyqtSignal(int, int)
+
+    def __init__(self, filename, folder, parent=None):
+        super(DataIndexer, self).__init__(parent)
+        self.index = DataIndex(filename)
+        self.queue = queue.Queue()
+        self.stopFlag = False
+        self.setFolder(folder)
+
+    def __del__(self):
+        self.wait()
+
+    def stop(self):
+        self.stopFlag = True
+        self.wait()
+
+    # Index a new folder tree
+    def setFolder(self, folder):
+        self.folder = folder
+        self.queue.put((folder, True))
+
+    # Check a single folder again (e.g. from QFileSystemWatcher)
+    def rescan(self, folder):
+        self.queue.put((folder, folder == self.folder))
+
+    def run(self):
+        while not self.stopFlag:
+            try:
+                folder, recursive = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            # Changes come in bursts while files are written
+            time.sleep(0.2)
+            while not self.queue.empty():
+                job = self.queue.get_nowait()
+                if job[0] != folder or job[1] != recursive:
+                    self.queue.put(job)
+                    break
+            try:
+                numIndexed, numRemoved, failed = self.index.update(folder, recursive, lambda: self.stopFlag)
+            except Exception:
+                self.Msg.emit(" Indexing of local data failed: "+folder)
+                continue
+            for path, err in failed:
+                self.Msg.emit(" Local data index: file not indexed: "+path+" ("+err+")")
+            if recursive:
+                self.folders.emit([folder]+[os.path.join(root, d) \
+                    for root, dirs, _ in os.walk(folder) for d in dirs])
+            if numIndexed + numRemoved > 0:
+                self.Msg.emit(" Local data index: {0:d} file(s) indexed, {1:d} removed".format(numIndexed, numRemoved))
+                self.updated.emit(numIndexed, numRemoved)
+
+####################################################################
+#   Command line
+# Only the configuration is loaded (no GUI or instruments).
+####################################################################
+def main():
+    from .configuration import Configuration
+    config = Configuration()
+    if os.path.isfile(config.configFile) is False:
+        config.createConfig()
+    config.readConfig(config.configFile)
+    folder = config.csvSavingFolder
+
+    parser = argparse.ArgumentParser(description="Query the index of local GridEdge AT data")
+    parser.add_argument("-d", "--device", help="device ID (prefix)")
+    parser.add_argument("-s", "--substrate", help="substrate (prefix)")
+    parser.add_argument("-t", "--type", help="measurement type: JV, JV_dark, tracking")
+    parser.add_argument("--from", dest="dateFrom", help="from date ("+DATE_FORMAT+")")
+    parser.add_argument("--to", dest="dateTo", help="to date ("+DATE_FORMAT+")")
+    parser.add_argument("--min-pce", dest="minPCE", type=float, help="minimum PCE")
+    parser.add_argument("-n", "--limit", type=int, help="maximum number of results")
+    parser.add_argument("-u", "--update", action="store_true",
+        help="update the index from the data folder before querying")
+    parser.add_argument("-f", "--folder", default=folder, help="data folder (default: "+folder+")")
+    args = parser.parse_args()
+
+    index = DataIndex(config.dataIndexFile)
+    if args.update:
+        numIndexed, numRemoved, failed = index.update(args.folder)
+        for path, err in failed:
+            print(" File not indexed: "+path+" ("+err+")")
+        print(" Local data index: {0:d} file(s) indexed, {1:d} removed".format(numIndexed, numRemoved))
+    rows = index.query(args.device, args.substrate, args.type, args.dateFrom,
+        args.dateTo, args.minPCE, args.limit)
+    print("{0:<16} {1:<9} {2:<10} {3:<8} {4:>7} {5:>7} {6:>7} {7:>7} {8:>6} {9:>6}  {10}".format(
+        "Device", "Type", "Date", "Time", "Voc", "Jsc", "VPP", "MPP", "FF", "PCE", "File"))
+    for r in rows:
+        print("{0:<16} {1:<9} {2:<10} {3:<8} {4:7.3f} {5:7.3f} {6:7.3f} {7:7.3f} {8:6.3f} {9:6.3f}  {10}".format(
+            r['deviceID'], r['measType'], r['acqDate'], r['acqTime'],
+            r['Voc'], r['Jsc'], r['VPP'], r['MPP'], r['FF'], r['PCE'], r['path']))
+    print(" {0:d} file(s) found".format(len(rows)))
+
+if __name__ == "__main__":
+    main()
@@ -11,32 +11,221 @@ the Free Software Foundation; either version 2 of the License, or
 (at your option) any later version.
 
 '''
-import sys, math, json, os.path, time
+import sys, math, json, os.path, time, threading
+from collections import OrderedDict
+from . import logger
 global MongoDBhost
 
+# Process-wide pool of MongoClient instances, one per set of connection
+# parameters. MongoClient is thread-safe and keeps its own connection pool,
+# so it is created once (lazily) and shared by all DM operations.
+_mongoClients = {}
+_mongoClientsLock = threading.Lock()
+
+# Full Measurement documents (by _id) are cached after first access.
+# Documents are never modified once submitted, so they do not go stale.
+_documentCache = OrderedDict()
+_documentCacheLock = threading.Lock()
+_indexedDBs = set()
+# Optional local disk cache (see configure_DM_cache)
+_diskCache = None
+
 #************************************
 #   Class Database
 #************************************
 class DataManagement:
+    # Seconds after which a pooled connection is checked again
+    healthCheckInterval = 30
+    maxPoolSize = 10
+    documentCacheSize = 500
+    # Fields for listing measurements, without the data arrays
+    listProjection = {'itemId': 1, 'measType': 1, 'name': 1}
+
     def __init__(self, info):
         self.dbHostname = info[0]
         self.dbPortNum = info[1]
         self.dbName = info[2]
         self.dbUsername = info[3]
         self.dbPassword = info[4]
+        self.key = (self.dbHostname, str(self.dbPortNum), self.dbName,
+                    self.dbUsername, self.dbPassword)
+
+    # Connect to Data Management database via pyMongo.
+    # The client is shared, a health check ('ping') runs at most every
+    # healthCheckInterval s (always with forceCheck); a failed client is
+    # closed and recreated once.
+    def connectDB(self, forceCheck=False):
+        with _mongoClientsLock:
+            entry = _mongoClients.get(self.key)
+            if entry is None:
+                entry = _mongoClients[self.key] = [self.newClient(), 0.]
+        if not forceCheck and time.time() - entry[1] < self.healthCheckInterval:
+            return entry[0], True
+        if self.ping(entry[0]):
+            entry[1] = time.time()
+            return entry[0], True
+        with _mongoClientsLock:
+            if _mongoClients.get(self.key) is entry:
+                entry[0].close()
+                entry = _mongoClients[self.key] = [self.newClient(), 0.]
+        flag = self.ping(entry[0])
+        if flag:
+            entry[1] = time.time()
+        return entry[0], flag
+
+    # Shared database object and connection flag
+    def getDB(self):
+        client, flag = self.connectDB()
+        return client[self.dbName], flag
 
-    # Connect to Data Management database via pyMongo
-    def connectDB(self):
+    def newClient(self):
         from pymongo import MongoClient
-        client = MongoClient(self.dbHostname, int(self.dbPortNum),
-                             serverSelectionTimeoutMS=1000)
         if self.dbUsername != "" and self.dbPassword !="":
-            client[self.dbName].authenticate(self.dbUsername, self.dbPassword)
-        else:
-            client[self.dbName]
+            return MongoClient(self.dbHostname, int(self.dbPortNum),
+                             username=self.dbUsername, password=self.dbPassword,
+                             authSource=self.dbName, maxPoolSize=self.maxPoolSize,
+                             serverSelectionTimeoutMS=1000, connect=False)
+        return MongoClient(self.dbHostname, int(self.dbPortNum),
+                             maxPoolSize=self.maxPoolSize,
+                             serverSelectionTimeoutMS=1000, connect=False)
+
+    # Create the indexes used by DM queries (once per database)
+    def ensureIndexes(self, db):
+        if self.key in _indexedDBs:
+            return
+        try:
+            db.Measurement.create_index([('substrate', 1), ('itemId', 1), ('measType', 1)])
+            _indexedDBs.add(self.key)
+        except:
+            # No privileges for creating indexes: queries still work
+            _indexedDBs.add(self.key)
+
+    # Listing of all measurements for a substrate (only listProjection fields,
+    # _id as string). Without connection, the listing from the local cache is used.
+    def listMeasurements(self, substrate):
         try:
-            client.admin.command('ismaster')
-            flag = True
+            db, flag = self.getDB()
+            if flag is False:
+                raise Exception("No connection to DM")
+            self.ensureIndexes(db)
+            entries = list(db.Measurement.find({'substrate': substrate}, self.listProjection))
+            for e in entries:
+                e['_id'] = str(e['_id'])
         except:
-            flag = False
-        return client, flag
+            if _diskCache is None:
+                raise
+            entries, cached = _diskCache.getListing(substrate)
+            if entries is None:
+                raise
+            print(" DM not available: using local cache from "+ \
+                time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(cached)))
+            return entries
+        if _diskCache is not None:
+            _diskCache.putListing(substrate, entries)
+        return entries
+
+    # Full documents for a list of _id, in the same order. Read-through:
+    # memory cache, then local disk cache (not expired), then a single query
+    # to DM for the documents still missing.
+    def getDocuments(self, ids):
+        ids = [str(i) for i in ids]
+        docs = {}
+        with _documentCacheLock:
+            for i in ids:
+                key = (self.key[0], self.dbName, i)
+                if key in _documentCache:
+                    _documentCache.move_to_end(key)
+                    docs[i] = _documentCache[key]
+        missing = [i for i in ids if i not in docs]
+        if len(missing) > 0 and _diskCache is not None:
+            fromDisk = _diskCache.get(missing)
+            docs.update(fromDisk)
+            self.cacheDocuments(fromDisk.values())
+            missing = [i for i in missing if i not in docs]
+        if len(missing) > 0:
+            from bson.objectid import ObjectId
+            try:
+                db, flag = self.getDB()
+            except:
+                flag = False
+            if flag is False:
+                # Offline: expired documents from the local cache are better than none
+                if _diskCache is not None:
+                    docs.update(_diskCache.get(missing, expired=True))
+                    missing = [i for i in missing if i not in docs]
+                if len(missing) > 0:
+                    raise Exception("No connection to DM")
+                print(" DM not available: using expired documents from local cache")
+                return [docs[i] for i in ids]
+            fromDB = list(db.Measurement.find({'_id': {'$in':
+                [ObjectId(i) if ObjectId.is_valid(i) else i for i in missing]}}))
+            for doc in fromDB:
+                doc['_id'] = str(doc['_id'])
+                docs[doc['_id']] = doc
+            self.cacheDocuments(fromDB)
+            if _diskCache is not None:
+                _diskCache.put(fromDB)
+        return [docs[i] for i in ids]
+
+    def cacheDocuments(self, docs):
+        with _documentCacheLock:
+            for doc in docs:
+                _documentCache[(self.key[0], self.dbName, str(doc['_id']))] = doc
+            while len(_documentCache) > self.documentCacheSize:
+                _documentCache.popitem(last=False)
+
+    def ping(self, client):
+        try:
+            client.admin.command('ping')
+            return True
+        except:
+            return False
+
+# Close all pooled clients (when quitting)
+def close_DM_clients():
+    with _mongoClientsLock:
+        for client, _ in _mongoClients.values():
+            try:
+                client.close()
+            except:
+                pass
+        _mongoClients.clear()
+
+# Add a substrate to its batch (Lot) in DM, creating the batch if needed.
+# No GUI access: connection info and architecture configuration (archConfig,
+# named archName) are collected beforehand (SampleWindow.getLotDMInfo).
+def create_lot_DM(dbConnectInfo, deviceID, archConfig, archName):
+    print("\nOpening entry in DM for Lot:",deviceID[:8])
+    try:
+        db, connFlag = DataManagement(dbConnectInfo).getDB()
+    except:
+        connFlag = False
+    if connFlag == False:
+        print(" Connection to DM failed")
+        print("Abort")
+        return
+    try:
+        entry = db.Lot.find_one({'label':deviceID[:8]})
+        if entry:
+            db.Lot.update_one({ '_id': entry['_id'] },{"$push": archConfig}, upsert=False)
+            msg = " Data entry for this batch found in DM. Created substrate: "+deviceID
+        else:
+            print(" No data entry for this substrate found in DM. Creating new one...")
+            jsonData = {'label' : deviceID[:8], 'date' : deviceID[2:8], 'description': '', 'notes': '', 'tags': [], 'substrates': []}
+            db_entry = db.Lot.insert_one(json.loads(json.dumps(jsonData)))
+            db.Lot.update_one({ '_id': db_entry.inserted_id },{"$push": archConfig}, upsert=False)
+            msg = " Created batch: " + deviceID[:8] + " and device: "+deviceID +"  with Architecture: "+archName
+        print(msg)
+        logger.info(msg)
+    except:
+        print(" Connection with DM via Mongo cannot be established.")
+
+# Enable the local disk cache of DM documents
+def configure_DM_cache(filename, maxEntries, ttl):
+    global _diskCache
+    from .dmCache import DMCache
+    try:
+        _diskCache = DMCache(filename, maxEntries, ttl)
+    except:
+        print(" Local DM cache not available: "+filename)
+        _diskCache = None
@@ -0,0 +1,96 @@
+'''
+dmCache.py
+----------
+Local on-disk (SQLite) cache of Data Management measurement documents
+
+Copyright (C) 2017-2019 Nicola Ferralis <ferralis@mit.edu>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+'''
+import json, sqlite3, time, threading
+from contextlib import closing, contextmanager
+
+####################################################################
+#   DM cache
+####################################################################
+# Documents are stored by _id (as string), together with their
+# (substrate, itemId, measType) key, and evicted least recently used
+# first beyond maxEntries. Documents older than ttl (hours, 0: never)
+# are expired: they are fetched again from DM, and only used when DM is
+# not available. The listing of measurements of each substrate
+# is stored as well, so that substrates can be browsed offline.
+# When a listing is refreshed from DM, cached documents of that substrate
+# no longer in DM are removed.
+class DMCache():
+    def __init__(self, filename, maxEntries=2000, ttl=24):
+        self.filename = filename
+        self.maxEntries = maxEntries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        with self.lock, self.connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, "
+                "substrate TEXT, itemId TEXT, measType TEXT, doc TEXT, cached REAL, accessed REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS documents_key ON documents "
+                "(substrate, itemId, measType)")
+            conn.execute("CREATE INDEX IF NOT EXISTS documents_accessed ON documents (accessed)")
+            conn.execute("CREATE TABLE IF NOT EXISTS listings (substrate TEXT PRIMARY KEY, "
+                "entries TEXT, cached REAL)")
+
+    # Connection used as a single transaction, closed on exit
+    @contextmanager
+    def connect(self):
+        with closing(sqlite3.connect(self.filename, timeout=10)) as conn:
+            with conn:
+                yield conn
+
+    # Cached documents for a list of ids (str), as a dict by id.
+    # Expired documents are included only if expired is True.
+    def get(self, ids, expired=False):
+        if len(ids) == 0:
+            return {}
+        sql = "SELECT id, doc FROM documents WHERE id IN ("+",".join("?"*len(ids))+")"
+        args = list(ids)
+        if expired is False and self.ttl > 0:
+            sql += " AND cached>=?"
+            args.append(time.time() - self.ttl*3600)
+        with self.lock, self.connect() as conn:
+            rows = conn.execute(sql, args).fetchall()
+            if len(rows) > 0:
+                conn.execute("UPDATE documents SET accessed=? WHERE id IN ("+ \
+                    ",".join("?"*len(rows))+")", [time.time()]+[r[0] for r in rows])
+        return {r[0]: json.loads(r[1]) for r in rows}
+
+    def put(self, docs):
+        now = time.time()
+        with self.lock, self.connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO documents VALUES (?,?,?,?,?,?,?)",
+                [(str(d['_id']), str(d.get('substrate','')), str(d.get('itemId','')),
+                    str(d.get('measType','')), json.dumps(d, default=str), now, now) for d in docs])
+            num = conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            if num > self.maxEntries:
+                conn.execute("DELETE FROM documents WHERE id IN (SELECT id FROM documents "
+                    "ORDER BY accessed LIMIT ?)", (num - self.maxEntries,))
+
+    # Store the listing of a substrate and drop documents no longer in DM
+    def putListing(self, substrate, entries):
+        ids = [str(e['_id']) for e in entries]
+        with self.lock, self.connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO listings VALUES (?,?,?)",
+                (substrate, json.dumps(entries, default=str), time.time()))
+            cached = [r[0] for r in conn.execute("SELECT id FROM documents WHERE substrate=?",
+                (substrate,)).fetchall()]
+            conn.executemany("DELETE FROM documents WHERE id=?",
+                [(i,) for i in set(cached) - set(ids)])
+
+    # Cached listing of a substrate and the time it was cached (None if not cached)
+    def getListing(self, substrate):
+        with self.lock, self.connect() as conn:
+            row = conn.execute("SELECT entries, cached FROM listings WHERE substrate=?",
+                (substrate,)).fetchone()
+        if row is None:
+            return None, None
+        return json.loads(row[0]), row[1]
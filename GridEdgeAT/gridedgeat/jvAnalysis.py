@@ -0,0 +1,119 @@
+'''
+jvAnalysis.py
+-------------
+Vectorized extraction of photovoltaic parameters from JV curves
+
+Copyright (C) 2017-2019 Nicola Ferralis <ferralis@mit.edu>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+'''
+import numpy as np
+
+# Columns of the array returned by analyse_jv
+JV_PARAMS = ['Voc', 'Jsc', 'VPP', 'MPP', 'FF', 'PCE']
+
+# Stack a list of JV curves (each n_points x 2, possibly of different
+# length) into V and J arrays of shape (n_curves x max_points).
+# Shorter curves are padded with NaN.
+def stack_jv(JVs):
+    JVs = [np.asarray(JV, dtype=float) for JV in JVs]
+    numPoints = max([JV.shape[0] for JV in JVs]) if len(JVs) > 0 else 0
+    V = np.full((len(JVs), numPoints), np.nan)
+    J = np.full((len(JVs), numPoints), np.nan)
+    for k, JV in enumerate(JVs):
+        V[k,:JV.shape[0]] = JV[:,0]
+        J[k,:JV.shape[0]] = JV[:,1]
+    return V, J
+
+# Value of z where y first crosses zero (row by row), using linear
+# interpolation between the two bracketing points. NaN if no crossing.
+def interp_at_zero(y, z):
+    y0, y1 = y[:,:-1], y[:,1:]
+    with np.errstate(invalid='ignore'):
+        cross = (y0*y1 <= 0) & np.isfinite(y0) & np.isfinite(y1)
+    found = cross.any(axis=1)
+    rows = np.arange(y.shape[0])
+    k = np.argmax(cross, axis=1)
+    ya, yb = y[rows,k], y[rows,k+1]
+    za, zb = z[rows,k], z[rows,k+1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        res = np.where(yb != ya, za - ya*(zb-za)/(yb-ya), za)
+    return np.where(found, res, np.nan)
+
+# Voc and Jsc for all curves (NaN when the curve does not cross the axis)
+def voc_jsc(V, J):
+    V, J = _sort_by_voltage(V, J)
+    return interp_at_zero(J, V), interp_at_zero(V, J)
+
+# Voc, Jsc, Vpmax, Pmax, FF and PCE for all curves in one pass.
+# V and J are (n_curves x n_points), NaN-padded (see stack_jv).
+# Returns a (n_curves x 6) array with columns as in JV_PARAMS.
+# Voc and Jsc are set to 0 when the curve does not cross the axis,
+# in which case FF and PCE are 0 as well.
+def analyse_jv(V, J, powerIn):
+    V = np.atleast_2d(np.asarray(V, dtype=float))
+    J = np.atleast_2d(np.asarray(J, dtype=float))
+    V, J = _sort_by_voltage(V, J)
+    if V.shape[1] < 2:
+        return np.zeros((V.shape[0], len(JV_PARAMS)))
+    voc = interp_at_zero(J, V)
+    jsc = interp_at_zero(V, J)
+
+    # Maximum power point is the most negative power
+    P = V*J
+    ind = np.argmin(np.where(np.isfinite(P), P, np.inf), axis=1)
+    rows = np.arange(V.shape[0])
+    vpmax = np.nan_to_num(V[rows,ind])
+    pmax = np.nan_to_num(P[rows,ind])
+
+    valid = np.isfinite(voc) & np.isfinite(jsc) & (voc != 0) & (jsc != 0)
+    voc = np.where(valid, voc, 0.)
+    jsc = np.where(valid, jsc, 0.)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ff = np.where(valid, pmax/(voc*jsc), 0.)
+    pce = np.where(valid, np.abs(100*pmax/powerIn), 0.)
+    return np.column_stack((voc, jsc, vpmax, pmax, ff, pce))
+
+# Voltages for an adaptive JV sweep, from a measured curve (V, J) of a
+# similar device. The uniform v_list (step v_step) is reduced to a coarse
+# grid, refined to v_step within two coarse steps of the MPP and Voc of
+# the measured curve. The coarsest grid (16, 8, 4 or 2 steps) whose Pmax
+# and FF, interpolated from the measured curve, are within tol (relative)
+# of the measured ones is returned. The full v_list is returned if none
+# is, or if the measured curve is not resolved to v_step near MPP and Voc.
+def adaptive_voltage_list(V, J, v_list, v_step, powerIn, tol):
+    V, J = _sort_by_voltage(np.atleast_2d(np.asarray(V, dtype=float)),
+                            np.atleast_2d(np.asarray(J, dtype=float)))
+    V, J = V[0], J[0]
+    if len(v_list) < 8 or len(V) < 2:
+        return list(v_list)
+    ref = analyse_jv(V, J, powerIn)[0]
+    centers = [ref[2]] if ref[0] == 0 else [ref[2], ref[0]]
+    for c in centers:
+        k = np.searchsorted(V, c)
+        spacing = np.diff(V[max(k-1,0):k+2])
+        if len(spacing) == 0 or np.max(spacing) > v_step*1.5:
+            return list(v_list)
+    v_list = np.asarray(v_list, dtype=float)
+    for coarse in [16, 8, 4, 2]:
+        if coarse*v_step >= abs(v_list[-1]-v_list[0]):
+            continue
+        keep = np.zeros(len(v_list), dtype=bool)
+        keep[::coarse] = True
+        keep[-1] = True
+        for c in centers:
+            keep |= np.abs(v_list-c) <= 2*coarse*v_step
+        grid = v_list[keep]
+        perf = analyse_jv(grid, np.interp(grid, V, J), powerIn)[0]
+        if abs(perf[3]-ref[3]) <= tol*abs(ref[3]) and abs(perf[4]-ref[4]) <= tol*abs(ref[4]):
+            return list(grid)
+    return list(v_list)
+
+# Sort each curve by voltage, keeping the NaN padding at the end
+def _sort_by_voltage(V, J):
+    ind = np.argsort(V, axis=1)
+    return np.take_along_axis(V, ind, axis=1), np.take_along_axis(J, ind, axis=1)
@@ -49,6 +49,9 @@ class MainWindow(QMainWindow):
         super(MainWindow, self).__init__(None)
         self.config = Configuration()
         self.config.readConfig(self.config.configFile)
+        if self.config.DbCacheEnabled:
+            configure_DM_cache(self.config.generalFolder+"dmCache.sqlite",
+                self.config.DbCacheSize, self.config.DbCacheTTL)
         self.initUI()
     
     # Define UI elements
@@ -387,6 +390,11 @@ class MainWindow(QMainWindow):
                 self.stagewind.activateStage()
             if hasattr(self.acquisition,"acq_thread"):
                 self.acquisition.acq_thread.stop()
+            self.resultswind.persistence.stop()
+            if self.resultswind.dataIndexer is not None:
+                self.resultswind.dataIndexer.stop()
+            close_DM_clients()
+            close_camera_session()
             self.camerawind.alignOn=False
             self.camerawind.firstRun=False
             self.close()
@@ -15,30 +15,235 @@ the Free Software Foundation; either version 2 of the License, or
 '''
 
 import cv2
-import time, sys
+import time, sys, threading
 import numpy as np
-from PIL import Image
-from PIL.ImageQt import ImageQt
 from datetime import datetime
+from collections import namedtuple
+from PyQt5.QtGui import QImage
+try:
+    from PyQt5 import sip
+except ImportError:
+    import sip
+
+# QImage sharing the memory of a 2D uint8 array (rows may be strided,
+# e.g. a crop of a larger frame): no copy is made. The array must be kept
+# alive and unchanged for as long as the image is used.
+def gray_qimage(gray):
+    return QImage(sip.voidptr(gray.ctypes.data), gray.shape[1], gray.shape[0],
+                  gray.strides[0], QImage.Format_Grayscale8)
+
+####################################################################
+# Alignment analysis
+####################################################################
+# Results for one region of interest (ROI):
+#   contrast: percentage of values above thresholdPerc*iMax
+#   iMax: maximum intensity
+#   histogram: counts of intensities (256 bins)
+#   centroid: (x, y) of the pixels above threshold, in image coordinates
+AlignmentResult = namedtuple('AlignmentResult', ['contrast', 'iMax', 'histogram', 'centroid'])
+
+# Analyse ROIs (x1, x2, y1, y2) of an image (whole image if rois is None).
+# Each ROI is a view into the image, analysed with vectorized operations.
+def analyse_alignment(img, thresholdPerc, rois=None):
+    img = np.asarray(img)
+    if rois is None:
+        rois = [(0, img.shape[1], 0, img.shape[0])]
+    results = []
+    for x1, x2, y1, y2 in rois:
+        x0, y0 = min(x1,x2), min(y1,y2)
+        roi = img[y0:max(y1,y2), x0:max(x1,x2)]
+        if roi.size == 0:
+            results.append(AlignmentResult(0., 0, np.zeros(256, dtype=int), (np.nan, np.nan)))
+            continue
+        iMax = roi.max()
+        mask = roi > thresholdPerc*iMax
+        contrast = 100*np.count_nonzero(mask)/roi.size
+        if roi.dtype == np.uint8:
+            histogram = np.bincount(roi.ravel(), minlength=256)
+        else:
+            histogram = np.histogram(roi, bins=256)[0]
+        if mask.ndim == 3:
+            mask = mask.any(axis=2)
+        ys, xs = np.nonzero(mask)
+        if len(xs) > 0:
+            centroid = (x0 + xs.mean(), y0 + ys.mean())
+        else:
+            centroid = (np.nan, np.nan)
+        results.append(AlignmentResult(contrast, iMax, histogram, centroid))
+    return results
+
+# Split a window (x1, x2, y1, y2) in a grid of ROIs, ordered as the devices
+# of a substrate: by column (left to right), top to bottom within a column.
+def split_roi(x1, x2, y1, y2, numCols=2, numRows=3):
+    xs = np.linspace(min(x1,x2), max(x1,x2), numCols+1).astype(int)
+    ys = np.linspace(min(y1,y2), max(y1,y2), numRows+1).astype(int)
+    return [(xs[c], xs[c+1], ys[r], ys[r+1]) for c in range(numCols) for r in range(numRows)]
+
+# Device windows located in a frame:
+#   rois: (x1, x2, y1, y2) of each device window, in device order
+#   offset: (x, y) offset in mm of the substrate from the center of the
+#           frame (x to the right, y upwards)
+#   found: number of device windows detected (the others are placed
+#          from the substrate geometry)
+DeviceWindows = namedtuple('DeviceWindows', ['rois', 'offset', 'found'])
+
+# Locate the device windows of a substrate in a frame. Bright regions are
+# found by Otsu thresholding and contour fitting, and matched to the grid
+# of device windows expected from the substrate geometry (pitchDevX,
+# pitchDevY in mm, devices ordered as in split_roi).
+def detect_device_windows(img, pitchDevX, pitchDevY, pxPerMM, numCols=2, numRows=3,
+                          minAreaMM2=0.5, numIter=3):
+    img = np.asarray(img)
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    gray = cv2.GaussianBlur(gray, (5,5), 0)
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # findContours returns 2 or 3 values depending on the OpenCV version
+    contours = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+    rects = np.array([cv2.boundingRect(c) for c in contours \
+        if cv2.contourArea(c) > minAreaMM2*pxPerMM**2], dtype=float).reshape(-1,4)
+    centers = rects[:,0:2] + rects[:,2:4]/2
+
+    # Expected centers for a substrate centered in the frame
+    h, w = gray.shape
+    expected = np.array([[w/2 + (c-(numCols-1)/2)*pitchDevX*pxPerMM,
+                          h/2 + (r-(numRows-1)/2)*pitchDevY*pxPerMM] \
+                          for c in range(numCols) for r in range(numRows)])
+    maxDist = 0.5*min(pitchDevX, pitchDevY)*pxPerMM
+    shift = np.zeros(2)
+    match = np.zeros(len(expected), dtype=bool)
+    nearest = np.zeros(len(expected), dtype=int)
+    if len(centers) > 0:
+        shift = centers.mean(axis=0) - expected.mean(axis=0)
+        for _ in range(numIter):
+            dist = np.linalg.norm(centers[None,:,:] - (expected + shift)[:,None,:], axis=2)
+            nearest = np.argmin(dist, axis=1)
+            match = dist[np.arange(len(expected)), nearest] < maxDist
+            if not match.any():
+                break
+            shift = np.mean(centers[nearest[match]] - expected[match], axis=0)
+
+    # Unmatched windows are placed on the grid, with the typical size
+    if match.any():
+        size = np.median(rects[nearest[match],2:4], axis=0)
+    else:
+        size = np.array([pitchDevX, pitchDevY])*pxPerMM/2
+    rois = []
+    for k in range(len(expected)):
+        if match[k]:
+            x, y, rw, rh = rects[nearest[k]]
+        else:
+            x, y = expected[k] + shift - size/2
+            rw, rh = size
+        rois.append((int(max(x,0)), int(min(x+rw,w)), int(max(y,0)), int(min(y+rh,h))))
+    offset = (shift[0]/pxPerMM, -shift[1]/pxPerMM) if match.any() else (np.nan, np.nan)
+    return DeviceWindows(rois, offset, int(np.count_nonzero(match)))
+
+####################################################################
+# Camera session
+####################################################################
+# The camera is opened once and frames are read continuously on a
+# background thread. Only the newest frame is kept, as a single
+# (frame number, time, frame) tuple: replacing it is a single reference
+# assignment, so readers never need a lock and never see a partial update.
+# The camera is released after idleTimeout s without frames being
+# requested, and reopened on the next request.
+class CameraSession():
+    def __init__(self, camera_port=0, idleTimeout=60.):
+        self.camera_port = camera_port
+        self.idleTimeout = idleTimeout
+        self.latest = None
+        self.lastRequest = time.time()
+        self.thread = None
+        self.running = False
+        self.startLock = threading.Lock()
+
+    def start(self):
+        with self.startLock:
+            if self.thread is not None and self.thread.is_alive():
+                if self.running:
+                    return
+                self.thread.join(2.)
+            self.camera = cv2.VideoCapture(self.camera_port)
+            self.camera.set(10, -200)
+            self.camera.set(15, -8.0)
+            self.latest = None
+            self.running = True
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    # Idle shutdown is decided under startLock, so that a concurrent
+    # start() either keeps the session or waits for it and restarts it.
+    def run(self):
+        camera = self.camera
+        frameNum = 0
+        while self.running:
+            if time.time() - self.lastRequest > self.idleTimeout:
+                with self.startLock:
+                    if time.time() - self.lastRequest > self.idleTimeout:
+                        self.running = False
+                        break
+            ret, frame = camera.read()
+            if not ret:
+                time.sleep(0.01)
+                continue
+            frameNum += 1
+            self.latest = (frameNum, time.time(), frame)
+        camera.release()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(2.)
+            self.thread = None
+
+    # Newest frame captured after time newerThan (any frame if None).
+    # Waits for it up to timeout s; returns None if none is available.
+    def latest_frame(self, newerThan=None, timeout=5.):
+        self.lastRequest = time.time()
+        self.start()
+        end = time.time() + timeout
+        while time.time() < end:
+            latest = self.latest
+            if latest is not None and (newerThan is None or latest[1] > newerThan):
+                return latest[2]
+            time.sleep(0.005)
+        return None
+
+_cameraSession = None
+
+# Camera session shared by all camera feeds
+def camera_session(idleTimeout=None):
+    global _cameraSession
+    if _cameraSession is None:
+        _cameraSession = CameraSession()
+    if idleTimeout is not None:
+        _cameraSession.idleTimeout = idleTimeout
+    return _cameraSession
+
+def close_camera_session():
+    if _cameraSession is not None:
+        _cameraSession.stop()
 
 ####################################################################
 # Camera low-level class
 ####################################################################
 class CameraFeed():
-    # Setup connection to OpenCV
-    def __init__(self):
-        self.camera_port = 0
-        self.ramp_frames = 2
-        self.camera = cv2.VideoCapture(self.camera_port)
-        self.camera.set(10, -200)
-        self.camera.set(15, -8.0)
+    # Frames are taken from the shared camera session
+    def __init__(self, session=None):
+        self.session = camera_session() if session is None else session
+        self.closeLiveFeed = False
+        self.gray = None
 
     # Grab frame into variable from live
     def grab_image_live(self):
         self.closeLiveFeed = False
         windowTitle = 'Live Feed: push \"q\" to stop and grab frame'
+        lastTime = None
         while True:
-            ret, frame = self.camera.read()
+            frame = self.session.latest_frame(lastTime)
+            if frame is None:
+                break
+            lastTime = time.time()
 
             cv2.namedWindow(windowTitle)
             # Our operations on the frame come here
@@ -55,27 +260,36 @@ class CameraFeed():
             if (cv2.waitKey(1) & 0xFF == ord('q')) or self.closeLiveFeed == True:
                 cv2.destroyAllWindows()
                 break
-        for i in range(self.ramp_frames):
-            temp = self.camera.read()
-        _, self.img = self.camera.read()
-        return self.img
+        return self.grab_image()
         
+    # Newest frame taken after this call (e.g. after the stage has moved)
     def grab_image(self):
-        for i in range(self.ramp_frames):
-            temp = self.camera.read()
-        _, self.img = self.camera.read()
+        self.img = self.session.latest_frame(time.time())
+        if self.img is None:
+            raise IOError("No frame from camera")
         return self.img
         
-    # Process image
+    # Process image. The frame is converted to grayscale into a buffer
+    # reused across frames; the returned QImages share its memory, and
+    # are valid until the next call (QPixmap.fromImage makes a copy).
+    # img_data is a view into the frame.
     def get_image(self, crop, x1, x2, y1, y2):
+        if self.img.ndim == 3:
+            if self.gray is None or self.gray.shape != self.img.shape[:2]:
+                self.gray = np.empty(self.img.shape[:2], dtype=np.uint8)
+            cv2.cvtColor(self.img, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        else:
+            self.gray = np.ascontiguousarray(self.img, dtype=np.uint8)
         if crop == True:
-            self.img1 = self.img[min(y1,y2):max(y1,y2), min(x1,x2):max(x1,x2)]
+            window = (slice(min(y1,y2), max(y1,y2)), slice(min(x1,x2), max(x1,x2)))
+            self.img1 = self.img[window]
+            gray1 = self.gray[window]
         else:
             self.img1 = self.img
-        self.img_raw = Image.fromarray(self.img1).convert('L')
-        self.imgg = ImageQt(self.img_raw)
-        self.img_data = np.asarray(self.img1)
-        self.imgg_orig = ImageQt(Image.fromarray(self.img).convert('L'))
+            gray1 = self.gray
+        self.img_data = self.img1
+        self.imgg = gray_qimage(gray1)
+        self.imgg_orig = gray_qimage(self.gray)
         return self.imgg, self.img_data, self.imgg_orig
 
     # Save image
@@ -85,18 +299,16 @@ class CameraFeed():
 
     # Logic for checking alignment
     def check_alignment(self, img_data, thresholdPerc):
-        count = 0
-        self.iMax = np.amax(img_data)
-        threshold = thresholdPerc*self.iMax
-        for i in np.nditer(img_data):
-            if i > threshold:
-                count = count + 1
-        contrast = 100*count/img_data.size
-        print(" Check alignment [%]: {0:0.3f}".format(contrast))
-        return "{0:0.3f}".format(contrast), self.iMax
-
-    # Close connection to camera
+        result = analyse_alignment(img_data, thresholdPerc)[0]
+        self.iMax = result.iMax
+        print(" Check alignment [%]: {0:0.3f}".format(result.contrast))
+        return "{0:0.3f}".format(result.contrast), self.iMax
+
+    # Check alignment of several ROIs (x1, x2, y1, y2) of the last frame
+    def check_alignment_rois(self, thresholdPerc, rois):
+        return analyse_alignment(self.img, thresholdPerc, rois)
+
+    # Close live feed. The camera session stays open for the next feed.
     def close_cam(self):
         self.closeLiveFeed = True
         cv2.destroyAllWindows()
-        del(self.camera)
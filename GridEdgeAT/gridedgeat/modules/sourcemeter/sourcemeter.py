@@ -19,6 +19,7 @@ the Free Software Foundation; either version 2 of the License, or
  
 '''
 import visa
+import numpy as np
 
 ####################################################################
 # Sourcemeter low-level class
@@ -39,6 +40,14 @@ class SourceMeter(object):
         self.write('SYSTEM:BEEP:STATE OFF')
         self.write('FORM:ELEM VOLT,CURR')
 
+        # Hardware sweeps (SOUR:LIST + trigger model) are only
+        # available on the 24xx series
+        try:
+            self.sweepSupport = 'MODEL 24' in self.ask('*IDN?').upper()
+        except:
+            self.sweepSupport = False
+        self.maxListPoints = 100
+
     def __del__(self):
         try:
             self.off()
@@ -124,6 +133,38 @@ class SourceMeter(object):
         data[1] = data[1]*1000.0/float(area)
         return data
 
+    def sweep(self, v_list, delay, area):
+        """
+        Hardware-triggered voltage sweep. The voltage list is loaded
+        in the SOUR:LIST buffer and the trigger model is armed with
+        the source delay, so that each chunk of points is
+        acquired with a single :READ? transfer.
+        Returns an array of (V, J) with J in mA/cm^2.
+        """
+        v_list = np.clip(np.asarray(v_list, dtype=float), None, self.voltage_limit)
+        data = np.zeros((0,2))
+        timeout = self.manager.timeout
+        try:
+            self.write('SOUR:FUNC VOLT')
+            self.write('SOUR:VOLT:MODE LIST')
+            self.write('SOUR:DEL {:f}'.format(delay))
+            for i in range(0, len(v_list), self.maxListPoints):
+                chunk = v_list[i:i+self.maxListPoints]
+                self.write('SOUR:LIST:VOLT '+','.join('{:f}'.format(v) for v in chunk))
+                self.write('TRIG:COUN {}'.format(len(chunk)))
+                # allow enough time for the whole chunk to complete
+                self.manager.timeout = int(1000*(len(chunk)*(delay+0.05)+5))
+                values = np.array(list(map(float, self.ask(':READ?').split(','))))
+                data = np.vstack((data, values.reshape(-1,2)))
+        finally:
+            self.manager.timeout = timeout
+            self.write('TRIG:COUN 1')
+            self.write('SOUR:DEL:AUTO ON')
+            self.write('SOUR:VOLT:MODE FIX')
+            self.mode = 'VOLT'
+        data[:,1] = data[:,1]*1000.0/float(area)
+        return data
+
     def on(self):
         "Turn Keithley on"
         self.write('OUTP ON')
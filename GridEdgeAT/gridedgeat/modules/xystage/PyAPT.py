@@ -17,7 +17,7 @@ mcleung@stanford.edu
 
 from ctypes import c_long, c_buffer, c_float, windll, pointer
 
-import os
+import os, time
 #print(os.getcwd())
 
 class APTMotor():
@@ -222,6 +222,51 @@ class APTMotor():
         if self.verbose: print('mAbs SUCCESS')
         return True
 
+    def mAbsNoWait(self, absPosition):
+        '''
+        Starts moving the motor to the Absolute position specified, without
+        waiting for the move to complete. Use waitForPos to wait.
+        absPosition    float     Position desired
+        '''
+        if self.verbose: print('mAbsNoWait ', absPosition, c_float(absPosition))
+        if not self.Connected:
+            raise Exception('Please connect first! Use initializeHardwareDevice')
+        absolutePosition = c_float(absPosition)
+        self.aptdll.MOT_MoveAbsoluteEx(self.SerialNum, absolutePosition, False)
+        if self.verbose: print('mAbsNoWait SUCCESS')
+        return True
+
+    def isMoving(self):
+        '''
+        True if the motor is moving, jogging or homing (from status bits)
+        '''
+        statusBits = c_long()
+        self.aptdll.MOT_GetStatusBits(self.SerialNum, pointer(statusBits))
+        return (statusBits.value & 0x000002F0) != 0
+
+    def waitForPos(self, absPosition, timeout=60, tolerance=0.02, settleTime=1.):
+        '''
+        Waits for the motor to settle at the Absolute position specified.
+        Returns False if the motor is still moving after timeout, or is
+        stopped farther than tolerance for more than settleTime.
+        absPosition    float     Position expected
+        timeout        float     Maximum waiting time, sec
+        tolerance      float     Maximum position error, mm
+        settleTime     float     Time allowed for the move to start, sec
+        '''
+        if self.verbose: print('waitForPos ', absPosition)
+        startTime = time.time()
+        while True:
+            moving = self.isMoving()
+            if not moving and abs(self.getPos() - absPosition) <= tolerance:
+                if self.verbose: print('waitForPos SUCCESS')
+                return True
+            elapsed = time.time() - startTime
+            if elapsed > timeout or (not moving and elapsed > settleTime):
+                if self.verbose: print('waitForPos FAILED at ', self.getPos())
+                return False
+            time.sleep(0.02)
+
     def mcRel(self, relDistance, moveVel=0.5):
         '''
         Moves the motor a relative distance specified at a controlled velocity
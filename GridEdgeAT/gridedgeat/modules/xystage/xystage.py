@@ -15,19 +15,109 @@ the Free Software Foundation; either version 2 of the License, or
 (at your option) any later version.
 
 '''
-import time, math
+import time, math, json
 try:
     from GridEdgeAT.gridedgeat.modules.xystage.PyAPT import APTMotor
     #from gridedgeat.modules.xystage.PyAPT import APTMotor
 except ImportError:
     pass
 
+####################################################################
+# Path planning
+####################################################################
+# Estimated time [s] for moving the stage between two (x,y) positions.
+# Backlash correction adds an overshoot (extra move) when moving towards
+# negative positions. Axes move one after the other, or at the same time
+# when simult is True (see XYstage.move_abs_simult).
+def move_time(startPos, endPos, velX, velY, blTime=0., simult=False):
+    tX = abs(endPos[0]-startPos[0])/velX
+    tY = abs(endPos[1]-startPos[1])/velY
+    blX = endPos[0] < startPos[0]
+    blY = endPos[1] < startPos[1]
+    if simult:
+        return max(tX, tY) + (blTime if blX or blY else 0.)
+    return tX + tY + blTime*(blX + blY)
+
+# Total travel time for visiting positions in the given order
+def path_time(positions, order, startPos, velX, velY, blTime=0., simult=False):
+    t = 0.
+    pos = startPos
+    for k in order:
+        t += move_time(pos, positions[k], velX, velY, blTime, simult)
+        pos = positions[k]
+    return t
+
+# Local search on a visiting order: 2-opt (segment reversal) and moving
+# single positions (or-opt) until no improvement is found.
+def improve_path(positions, order, startPos, velX, velY, blTime=0., simult=False):
+    best = path_time(positions, order, startPos, velX, velY, blTime, simult)
+    improved = True
+    while improved:
+        improved = False
+        for a in range(len(order)-1):
+            for b in range(a+1, len(order)):
+                newOrder = order[:a] + order[a:b+1][::-1] + order[b+1:]
+                t = path_time(positions, newOrder, startPos, velX, velY, blTime, simult)
+                if t < best - 1e-9:
+                    order, best = newOrder, t
+                    improved = True
+        for a in range(len(order)):
+            for b in range(len(order)):
+                if a == b:
+                    continue
+                newOrder = order[:a] + order[a+1:]
+                newOrder.insert(b, order[a])
+                t = path_time(positions, newOrder, startPos, velX, velY, blTime, simult)
+                if t < best - 1e-9:
+                    order, best = newOrder, t
+                    improved = True
+    return order, best
+
+# Order in which positions should be visited to minimize total travel time.
+# Nearest-neighbour paths starting from each position are refined with
+# improve_path and the fastest is kept. Returns a list of indexes in positions.
+def plan_path(positions, startPos, velX, velY, blTime=0., simult=False):
+    bestOrder, best = [], None
+    for first in range(len(positions)):
+        order = [first]
+        remaining = [k for k in range(len(positions)) if k != first]
+        while remaining:
+            pos = positions[order[-1]]
+            k = min(remaining, key=lambda k: move_time(pos, positions[k], velX, velY, blTime, simult))
+            order.append(k)
+            remaining.remove(k)
+        order, t = improve_path(positions, order, startPos, velX, velY, blTime, simult)
+        if best is None or t < best - 1e-9:
+            bestOrder, best = order, t
+    return bestOrder
+
+####################################################################
+# Stage calibration
+####################################################################
+# Offsets [dx, dy] (mm) of each substrate (1-16) and its devices from their
+# nominal positions, as measured from the camera during alignment.
+def load_stage_calibration(filename):
+    try:
+        with open(filename) as f:
+            return {int(k): list(v) for k, v in json.load(f).items()}
+    except:
+        return {}
+
+def save_stage_calibration(filename, calib):
+    with open(filename, 'w') as f:
+        json.dump({str(k): calib[k] for k in sorted(calib)}, f, indent=2)
+
 ####################################################################
 # XY-stage low-level class
 ####################################################################
 class XYstage():
     # Initialize X and Y stages
-    def __init__(self, xDefStageOrigin, yDefStageOrigin):
+    # With calibFile, the per-substrate calibration is applied to substrates
+    # and devices. posTolerance (mm) is the maximum position error of moves.
+    def __init__(self, xDefStageOrigin, yDefStageOrigin, calibFile=None, posTolerance=0.02):
+        self.calibFile = calibFile
+        self.posTolerance = posTolerance
+        self.subCalib = {} if calibFile is None else load_stage_calibration(calibFile)
         #Initialize stages
         self.SN1 = 45873236
         self.SN2 = 45873513
@@ -42,6 +132,10 @@ class XYstage():
         # Reduce maximum velocity to 15 mm/s
         self.stage1.setVelocityParameters(minVel=0, acc=15, maxVel=15)
         self.stage2.setVelocityParameters(minVel=0, acc=15, maxVel=15)
+        self.velX = 15
+        self.velY = 15
+        # Estimated overhead for each additional (backlash) move [s]
+        self.moveOverhead = 0.5
         # Define distances between adjacent substrates and between adjacent devices, all in mm
         # See interfacedrawings.pdf and Mask Design and Devices page on GridEdge wiki
         self.pitchSub = 25.4 + 4.6 # Substrate width/height + spacing between substrates
@@ -67,6 +161,29 @@ class XYstage():
         self.stage1.mbAbs(xPos)
         self.stage2.mbAbs(yPos)
 
+    # Move both axes at the same time to the specified position [mm]
+    # Include backlash correction: overshoots are also done simultaneously.
+    # If the axes do not settle within posTolerance, the move is done again
+    # one axis at a time (move_abs). Returns False if the move failed.
+    def move_abs_simult(self, xPos, yPos, timeout=60):
+        try:
+            moves = [[self.stage1, xPos], [self.stage2, yPos]]
+            blMoves = [[stage, pos - stage.blCorr] for stage, pos in moves if pos < stage.getPos()]
+            settled = True
+            for step in [blMoves, moves]:
+                for stage, pos in step:
+                    stage.mAbsNoWait(pos)
+                for stage, pos in step:
+                    settled = stage.waitForPos(pos, timeout, self.posTolerance) and settled
+            if settled:
+                return True
+            print(" Stage not settled at ({0:0.3f}, {1:0.3f}): moving one axis at a time".format(xPos, yPos))
+            self.move_abs(xPos, yPos)
+            return True
+        except:
+            print(" Stage move to ({0:0.3f}, {1:0.3f}) failed".format(xPos, yPos))
+            return False
+
     # Move relative to current position [mm]
     def move_rel(self, xDelta, yDelta):
         # Include backlash correction
@@ -96,7 +213,8 @@ class XYstage():
             # Example: [self.origin[0] + 5*self.pitchSub,
             # self.origin[1]] = 2 substrate pitches to the right of device 4
 
-    # Calculate the absolute position of each substrate center
+    # Calculate the absolute position of each substrate center, including
+    # the calibration offsets (used for substrates and their devices)
     def get_suborigins_4x4(self):
         # xIndex:  1 ==> 4   yIndex:
         # 13 | 14 | 15 | 16     4
@@ -109,7 +227,8 @@ class XYstage():
             yIndex = math.ceil(subIndex / 4)
             xPos = self.origin[0] + (xIndex - 1) * self.pitchSub
             yPos = self.origin[1] + (yIndex - 1) * self.pitchSub
-            self.subOriginList[subIndex - 1] = [xPos, yPos]
+            dx, dy = self.subCalib.get(subIndex, [0,0])
+            self.subOriginList[subIndex - 1] = [xPos + dx, yPos + dy]
             
     # Calculate the absolute position of each device center, given list of substrate centers
     def get_devorigins_3x2(self):
@@ -134,22 +253,71 @@ class XYstage():
                 devOrigin2, devOrigin3, devOrigin4, devOrigin5, devOrigin6]
         #return devOriginList
 
+    # Set the calibration offset [dx, dy] (mm) of a substrate (None to
+    # remove it) and update substrate and device positions
+    def set_substrate_offset(self, subIndex, offset):
+        if offset is None:
+            self.subCalib.pop(subIndex, None)
+        else:
+            self.subCalib[subIndex] = [float(offset[0]), float(offset[1])]
+        self.get_suborigins_4x4()
+        self.get_devorigins_3x2()
+
+    # Remove the calibration of all substrates (nominal positions)
+    def clear_calibration(self):
+        self.subCalib = {}
+        self.get_suborigins_4x4()
+        self.get_devorigins_3x2()
+
+    # Save the calibration to calibFile
+    def save_calibration(self):
+        if self.calibFile is not None:
+            save_stage_calibration(self.calibFile, self.subCalib)
+
     # Move to the center of the specified substrate (1-16)
+    # Returns the position, None if the move failed
     def move_to_substrate_4x4(self, subIndex):
         # Correct for zero-indexing
         subOrigin = self.subOriginList[subIndex - 1]
         # Expand list to individual args (xPos,yPos)
-        self.move_abs(*subOrigin)
+        if not self.move_abs_simult(*subOrigin):
+            return None
         return subOrigin
     
     # Move to the center of the specified substrate (1-16) and device (1-6)
+    # Returns the position, None if the move failed
     def move_to_device_3x2(self, subIndex, devIndex):
         # Correct for zero-indexing
         devOrigin = self.devOriginList[subIndex - 1][devIndex - 1]
         # Expand list to individual args (xPos,yPos)
-        self.move_abs(*devOrigin)
+        if not self.move_abs_simult(*devOrigin):
+            return None
         return devOrigin
 
+    # Time penalty of the backlash correction in mbAbs
+    def get_backlash_time(self):
+        return 2*self.stage1.blCorr/min(self.velX, self.velY) + self.moveOverhead
+
+    # Order substrates (1-16) to minimize total travel time from startPos
+    # (current position if not given)
+    def plan_substrate_order(self, subIndexList, startPos=None):
+        if startPos is None:
+            startPos = self.get_curr_pos()
+        positions = [self.subOriginList[subIndex - 1] for subIndex in subIndexList]
+        order = plan_path(positions, startPos, self.velX, self.velY,
+                    self.get_backlash_time(), simult=True)
+        return [subIndexList[k] for k in order]
+
+    # Order devices (1-6) of a substrate to minimize total travel time from
+    # startPos (substrate center if not given)
+    def plan_device_order(self, subIndex, devIndexList, startPos=None):
+        if startPos is None:
+            startPos = self.subOriginList[subIndex - 1]
+        positions = [self.devOriginList[subIndex - 1][devIndex - 1] for devIndex in devIndexList]
+        order = plan_path(positions, startPos, self.velX, self.velY,
+                    self.get_backlash_time(), simult=True)
+        return [devIndexList[k] for k in order]
+
     # Move to center of each device on specified substrates
     def scan_selected_substrates(self, subsToScanList, waitTime):
         for subIndex in subsToScanList:
@@ -0,0 +1,137 @@
+'''
+perfData.py
+-----------
+Typed container for device performance data (perfData)
+
+Copyright (C) 2017-2019 Nicola Ferralis <ferralis@mit.edu>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+'''
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+# perfData is a numpy structured array, one record per curve/time step.
+# The acquisition time is kept as epoch (s), all metrics as float64.
+# Date/time strings are only created when saving to csv or DM.
+PERF_METRICS = ['Voc', 'Jsc', 'VPP', 'MPP', 'FF', 'PCE']
+PERF_DTYPE = np.dtype([('Acq Epoch', 'f8'), ('Time step', 'f8')] + \
+                [(m, 'f8') for m in PERF_METRICS] + [('Light', 'f8')])
+
+# Columns as in csv files and DM entries
+PERF_COLUMNS = ['Acq Date', 'Acq Time', 'Time step'] + PERF_METRICS + ['Light']
+DATE_FORMAT = '%Y-%m-%d'
+TIME_FORMAT = '%H-%M-%S'
+
+# Empty perfData with n records
+def new_perf_data(n=0):
+    return np.zeros(n, dtype=PERF_DTYPE)
+
+# perfData from a (n x 6) array of metrics (ordered as PERF_METRICS)
+def make_perf_data(metrics, light, timestep=0., epoch=None):
+    metrics = np.atleast_2d(metrics)
+    perfData = new_perf_data(metrics.shape[0])
+    perfData['Acq Epoch'] = time.time() if epoch is None else epoch
+    perfData['Time step'] = timestep
+    for k, m in enumerate(PERF_METRICS):
+        perfData[m] = metrics[:,k]
+    perfData['Light'] = light
+    return perfData
+
+# Date and time strings for a single record
+def perf_date_time(record):
+    epoch = float(record['Acq Epoch'])
+    if not np.isfinite(epoch):
+        return '', ''
+    dt = datetime.fromtimestamp(epoch)
+    return dt.strftime(DATE_FORMAT), dt.strftime(TIME_FORMAT)
+
+# Epoch from date and time strings (NaN if they cannot be parsed)
+def perf_epoch(date, tm):
+    try:
+        return time.mktime(time.strptime(str(date)+' '+str(tm),
+                    DATE_FORMAT+' '+TIME_FORMAT))
+    except:
+        return np.nan
+
+# perfData from rows ordered as PERF_COLUMNS (csv or DM), values may be strings
+def perf_from_rows(rows):
+    perfData = new_perf_data(len(rows))
+    for k, row in enumerate(rows):
+        perfData[k] = (perf_epoch(row[0], row[1]),) + \
+                tuple(float(x) for x in row[2:len(PERF_COLUMNS)])
+    return perfData
+
+# perfData from a DataFrame with PERF_COLUMNS
+def perf_from_dataframe(df):
+    return perf_from_rows(df[PERF_COLUMNS].values.tolist())
+
+# DataFrame with PERF_COLUMNS, for saving csv and jsons.
+# With asStrings, values are strings as in DM documents (str of float)
+def perf_to_dataframe(perfData, asStrings=False):
+    dates = [perf_date_time(r) for r in perfData]
+    dfPerfData = pd.DataFrame({'Acq Date': [d[0] for d in dates],
+                    'Acq Time': [d[1] for d in dates]})
+    for c in PERF_COLUMNS[2:]:
+        if asStrings:
+            dfPerfData[c] = [str(float(x)) for x in perfData[c]]
+        else:
+            dfPerfData[c] = perfData[c]
+    return dfPerfData[PERF_COLUMNS]
+
+# Growable ring buffer of perfData records (tracking time series).
+# Storage doubles as needed up to maxlen records (unbounded if None),
+# after which the oldest records are overwritten and counted in dropped.
+# Appending is O(1) (amortized).
+class PerfDataBuffer():
+    def __init__(self, capacity=1024, maxlen=None):
+        self.maxlen = maxlen
+        if maxlen is not None:
+            capacity = min(capacity, maxlen)
+        self.buf = new_perf_data(max(capacity,1))
+        self.start = 0
+        self.size = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.start = 0
+        self.size = 0
+        self.dropped = 0
+
+    # Append one or more records (in chronological order)
+    def append(self, records):
+        for rec in np.atleast_1d(records):
+            cap = len(self.buf)
+            if self.size == cap:
+                if self.maxlen is None or cap < self.maxlen:
+                    self.__grow(cap*2 if self.maxlen is None else min(cap*2, self.maxlen))
+                else:
+                    self.buf[self.start] = rec
+                    self.start = (self.start+1) % cap
+                    self.dropped += 1
+                    continue
+            self.buf[(self.start+self.size) % len(self.buf)] = rec
+            self.size += 1
+
+    # Records in chronological order. With maxPoints, the series is
+    # decimated to at most maxPoints records (always including the last).
+    def data(self, maxPoints=None):
+        if maxPoints is not None and self.size > maxPoints:
+            ind = np.linspace(0, self.size-1, maxPoints).astype(int)
+        else:
+            ind = np.arange(self.size)
+        return self.buf[(self.start + ind) % len(self.buf)]
+
+    def __grow(self, capacity):
+        buf = new_perf_data(capacity)
+        buf[:self.size] = self.data()
+        self.buf = buf
+        self.start = 0
@@ -0,0 +1,295 @@
+'''
+persistence.py
+--------------
+Background worker for saving csv files and submitting data to DM
+
+Copyright (C) 2017-2019 Nicola Ferralis <ferralis@mit.edu>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+'''
+import os, glob, json, time, queue, requests
+from datetime import datetime
+from PyQt5.QtCore import (QThread, pyqtSignal)
+
+from .dataManagement import *
+from . import logger
+
+####################################################################
+#   Persistence worker
+####################################################################
+# Jobs are queued from the GUI thread and processed in order:
+#   ('csv', filename, dfTot)
+#   ('dm', deviceID, documents, csvFallback)
+#   ('flush',)
+# With batchSubmit, DM documents are collected per substrate and written
+# in one round-trip when the substrate changes, on flush (end of the
+# acquisition) or after batchTimeout s without new documents.
+# DM submissions are retried with exponential backoff, only for the
+# documents that failed. Documents that cannot be delivered are written to
+# the spool folder and retried periodically, also across restarts.
+class PersistenceWorker(QThread):
+    Msg = pyqtSignal(str)
+    status = pyqtSignal(int, int)
+
+    def __init__(self, spoolFolder, maxQueue=100, maxRetries=5, backoff=2.,
+                 spoolRetryInterval=60., batchSubmit=True, batchTimeout=120.,
+                 parent=None):
+        super(PersistenceWorker, self).__init__(parent)
+        self.spoolFolder = spoolFolder
+        self.queue = queue.Queue(maxsize=maxQueue)
+        self.maxRetries = maxRetries
+        self.backoff = backoff
+        self.spoolRetryInterval = spoolRetryInterval
+        self.batchSubmit = batchSubmit
+        self.batchTimeout = batchTimeout
+        self.batch = []
+        self.batchSubstrate = None
+        self.batchTime = 0.
+        self.dbConnectInfo = None
+        self.dmOnline = True
+        self.lastSpoolRetry = 0.
+        self.stopFlag = False
+
+    def __del__(self):
+        self.wait()
+
+    # Stop after the current job. Jobs left in the queue are written
+    # (csv) or spooled (DM) so that nothing is lost.
+    def stop(self):
+        self.stopFlag = True
+        self.wait()
+
+    # Queue a job, never blocks. If the queue is full, DM documents are
+    # spooled to disk and csv files are written directly.
+    def enqueue(self, job):
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            self.Msg.emit(" Persistence queue full: saving directly")
+            self.flushJob(job)
+        self.emitStatus()
+
+    def saveCsv(self, filename, dfTot):
+        self.enqueue(('csv', filename, dfTot))
+
+    def submitDM(self, deviceID, documents, dbConnectInfo, csvFallback=None):
+        self.dbConnectInfo = dbConnectInfo
+        self.enqueue(('dm', deviceID, documents, csvFallback))
+
+    # Submit the current batch of DM documents
+    def flushDM(self):
+        self.enqueue(('flush',))
+
+    def run(self):
+        while not self.stopFlag:
+            try:
+                job = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                if len(self.batch) > 0 and time.time() - self.batchTime > self.batchTimeout:
+                    self.submitBatch()
+                self.retrySpool()
+                continue
+            self.processJob(job)
+            self.emitStatus()
+        while not self.queue.empty():
+            self.flushJob(self.queue.get_nowait())
+        if len(self.batch) > 0:
+            self.spool(self.batchLabel(), [d for b in self.batch for d in b[1]],
+                [b[2] for b in self.batch])
+            self.batch = []
+        self.emitStatus()
+
+    def processJob(self, job):
+        if job[0] == 'csv':
+            self.writeCsv(job[1], job[2])
+        elif job[0] == 'flush':
+            self.submitBatch()
+        elif job[0] == 'dm':
+            _, deviceID, documents, csvFallback = job
+            if not self.batchSubmit:
+                self.deliver(deviceID, documents, [(deviceID, len(documents), csvFallback)])
+                return
+            if len(self.batch) > 0 and self.batchSubstrate != deviceID[:-1]:
+                self.submitBatch()
+            self.batchSubstrate = deviceID[:-1]
+            self.batch.append((deviceID, documents, csvFallback))
+            self.batchTime = time.time()
+
+    def batchLabel(self):
+        return "Substrate " + str(self.batchSubstrate)
+
+    def submitBatch(self):
+        if len(self.batch) == 0:
+            return
+        documents = [d for b in self.batch for d in b[1]]
+        owners = [(b[0], len(b[1]), b[2]) for b in self.batch]
+        label = self.batchLabel()
+        self.batch = []
+        self.deliver(label, documents, owners)
+
+    # Deliver documents, retrying those that failed. owners lists
+    # (deviceID, number of documents, csvFallback) in document order,
+    # to save the csv fallback of devices whose documents were not delivered.
+    def deliver(self, label, documents, owners):
+        pending = list(range(len(documents)))
+        if self.dmOnline:
+            for attempt in range(self.maxRetries):
+                status = submit_documents_DM([documents[k] for k in pending], self.dbConnectInfo)
+                self.Msg.emit(format_status_DM(label, [documents[k] for k in pending], status))
+                pending = [k for k, st in zip(pending, status) if not st[0]]
+                if len(pending) == 0:
+                    return
+                wait = min(self.backoff*2**attempt, 60.)
+                if attempt < self.maxRetries-1:
+                    self.Msg.emit(" "+label+": {0:d} document(s) not submitted to DM. ".format(len(pending))+ \
+                            "Retrying in {0:0.0f} s".format(wait))
+                    if self.sleepInterruptible(wait):
+                        break
+            self.dmOnline = False
+            self.lastSpoolRetry = time.time()
+            self.Msg.emit(" Connection to DM server: failed. Saving local file")
+        failed, start = [], 0
+        for deviceID, num, csvFallback in owners:
+            if any(start <= k < start+num for k in pending):
+                failed.append(csvFallback)
+            start += num
+        self.spool(label, [documents[k] for k in pending], failed)
+
+    # Save without further delivery attempts (queue full or quitting)
+    def flushJob(self, job):
+        if job[0] == 'csv':
+            self.writeCsv(job[1], job[2])
+        elif job[0] == 'dm':
+            self.spool(job[1], job[2], [job[3]])
+
+    def writeCsv(self, filename, dfTot):
+        try:
+            dfTot.to_csv(filename, sep=',', index=False)
+            msg=" Device data saved on: "+filename
+        except:
+            msg=" Device data NOT saved. Check File saving folder in INI file"
+        self.Msg.emit(msg)
+
+    # Write DM documents to the spool folder, and local csv as fallback
+    def spool(self, label, documents, csvFallbacks=[]):
+        filename = os.path.join(self.spoolFolder, label.replace(" ","_")+"_"+ \
+                datetime.now().strftime('%Y%m%d-%H%M%S-%f')+".json")
+        try:
+            with open(filename, 'w') as f:
+                json.dump({'label': label, 'documents': documents}, f,
+                    default=json_default)
+            self.Msg.emit(" "+label+": DM submission spooled in "+filename)
+        except:
+            self.Msg.emit(" "+label+": DM submission could not be spooled")
+        for csvFallback in csvFallbacks:
+            if csvFallback is not None:
+                self.writeCsv(*csvFallback)
+
+    # Try to deliver spooled documents, oldest first. Stops at the first failure.
+    def retrySpool(self):
+        if self.dbConnectInfo is None or \
+                time.time() - self.lastSpoolRetry < self.spoolRetryInterval:
+            return
+        self.lastSpoolRetry = time.time()
+        for filename in self.spoolFiles():
+            if self.stopFlag or not self.queue.empty():
+                return
+            try:
+                with open(filename) as f:
+                    entry = json.load(f)
+            except:
+                continue
+            label = entry.get('label', entry.get('deviceID', ''))+" (from spool)"
+            documents = entry['documents']
+            status = submit_documents_DM(documents, self.dbConnectInfo)
+            self.Msg.emit(format_status_DM(label, documents, status))
+            failed = [d for d, st in zip(documents, status) if not st[0]]
+            if len(failed) == len(documents):
+                self.dmOnline = False
+                self.emitStatus()
+                return
+            if len(failed) > 0:
+                with open(filename, 'w') as f:
+                    json.dump({'label': entry.get('label', ''), 'documents': failed}, f,
+                        default=json_default)
+            else:
+                os.remove(filename)
+            self.dmOnline = True
+            self.emitStatus()
+        self.dmOnline = True
+
+    def spoolFiles(self):
+        return sorted(glob.glob(os.path.join(self.spoolFolder, "*.json")), key=os.path.getmtime)
+
+    def emitStatus(self):
+        self.status.emit(self.queue.qsize(), len(self.spoolFiles()))
+
+    # Returns True if interrupted by stop()
+    def sleepInterruptible(self, wait):
+        end = time.time() + wait
+        while time.time() < end:
+            if self.stopFlag:
+                return True
+            time.sleep(0.1)
+        return False
+
+# Submit a list of documents to DM in one round-trip: insert_many via
+# pymongo, or a single HTTP POST of an array as fallback.
+# Returns the status of each document as (flag, id or error message).
+def submit_documents_DM(documents, dbConnectInfo):
+    if len(documents) == 0:
+        return []
+    docs = json.loads(json.dumps(documents, default=json_default))
+    try:
+        # This is for direct submission via pymongo
+        from pymongo.errors import BulkWriteError
+        db, flag = DataManagement(dbConnectInfo).getDB()
+        if flag is False:
+            raise Exception("No connection to DM via Mongo")
+        try:
+            res = db.Measurement.insert_many(docs, ordered=False)
+            return [(True, str(i)) for i in res.inserted_ids]
+        except BulkWriteError as e:
+            errors = {err['index']: err.get('errmsg', 'write error') for err in e.details.get('writeErrors', [])}
+            return [(k not in errors, errors.get(k, "inserted")) for k in range(len(docs))]
+    except:
+        msg = " Submission to DM via Mongo: failed. Trying via HTTP POST"
+        print(msg)
+        logger.info(msg)
+    try:
+        #This is for using POST HTTP
+        url = "http://"+dbConnectInfo[0]+":"+dbConnectInfo[5]+dbConnectInfo[6]
+        docs = json.loads(json.dumps(documents, default=json_default))
+        req = requests.post(url, json=docs, timeout=30)
+        req.raise_for_status()
+        etag = str(req.headers.get('ETag',''))
+        try:
+            res = req.json()
+        except ValueError:
+            res = None
+        # Ids per document only if the reply has one entry per document,
+        # otherwise the same status for all (none is dropped by zip)
+        if isinstance(res, list) and len(res) == len(docs):
+            return [(True, str(r.get('id', etag)) if isinstance(r, dict) else etag) for r in res]
+        return [(True, etag)]*len(docs)
+    except Exception as e:
+        return [(False, str(e))]*len(docs)
+
+# Message with the status of each submitted document
+def format_status_DM(label, documents, status):
+    numOk = sum([1 for st in status if st[0]])
+    msg = " "+label+": {0:d}/{1:d} document(s) submitted to DM".format(numOk, len(status))
+    for doc, st in zip(documents, status):
+        msg += "\n  "+str(doc.get('substrate',''))+str(doc.get('itemId',''))+ \
+            " "+str(doc.get('name',''))+": "+("OK (" if st[0] else "FAILED (")+st[1]+")"
+    return msg
+
+# numpy scalars are not serializable by json
+def json_default(obj):
+    if hasattr(obj, 'item'):
+        return obj.item()
+    return str(obj)
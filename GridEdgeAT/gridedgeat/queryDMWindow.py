@@ -25,6 +25,7 @@ from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 
 from .dataManagement import *
+from .perfData import *
 from . import logger
 
 ####################################################################
@@ -83,28 +84,24 @@ class DataLoadDMWindow(QMainWindow):
         self.textbox.setText("")
         self.textDatabox.setText("")
         self.resTableDMWidget.setRowCount(0)
-        db, connFlag = self.connectDM()
-        if connFlag == False:
-            print("Abort")
-            return
+        # Without connection, listMeasurements falls back to the local cache
+        self.dbConnectInfo = self.parent().parent().dbconnectionwind.getDbConnectionInfo()
 
         # Enable this to show JSON for a substrate
         #self.showLotJson()
         try:
-            if db.Measurement.find({'substrate':self.deviceID}).count() == 0:
+            rows = self.listDMRows(DataManagement(self.dbConnectInfo).listMeasurements(self.deviceID))
+            if len(rows) == 0:
                 self.resTableDMWidget.insertRow(0)
                 self.resTableDMWidget.setItem(0, 0,QTableWidgetItem("None found"))
-            for cursor in db.Measurement.find({'substrate':self.deviceID}):
-                if cursor['name']=="JV_r" or cursor['name']=="JV_dark_r" or cursor['name']=="tracking":
-                    self.resTableDMWidget.insertRow(0)
-                    self.resTableDMWidget.setItem(0, 0,QTableWidgetItem(self.deviceID))
-                    self.resTableDMWidget.setItem(0, 1,QTableWidgetItem(cursor['itemId']))
-                    if cursor['measType'] == "JV":
-                        self.resTableDMWidget.setItem(0, 2,QTableWidgetItem("JV"))
-                    elif cursor['measType'] == "JV_dark":
-                        self.resTableDMWidget.setItem(0, 2,QTableWidgetItem("JV_dark"))
-                    elif cursor['measType'] == "tracking":
-                        self.resTableDMWidget.setItem(0, 2,QTableWidgetItem("tracking"))
+            else:
+                # Latest entries on top
+                self.resTableDMWidget.setRowCount(len(rows))
+            for k, (itemId, measType, ids) in enumerate(rows[::-1]):
+                self.resTableDMWidget.setItem(k, 0,QTableWidgetItem(self.deviceID))
+                self.resTableDMWidget.setItem(k, 1,QTableWidgetItem(itemId))
+                self.resTableDMWidget.setItem(k, 2,QTableWidgetItem(measType))
+                self.resTableDMWidget.item(k,0).setData(Qt.UserRole, ids)
             try:
                 self.resTableDMWidget.item(0,0).setToolTip("Double click to plot data")
             except:
@@ -134,14 +131,14 @@ class DataLoadDMWindow(QMainWindow):
             try:
                 text = "Substrate: "+substrate+"  Device: "+device+ \
                     "\nDevice Arch: "+acqParams.iloc[0]['DevArchitecture']+\
-                    "\nDate/Time: "+perfData[0,0]+"  "+perfData[0,1]+\
-                    "\nVoc F, Voc R: {0:0.2f}  {1:0.2f}".format(float(perfData[0,3]),float(perfData[1,3]))+ \
-                    "\nJsc F, Jsc R: {0:0.2f}  {1:0.2f}".format(float(perfData[0,4]),float(perfData[1,4]))+ \
-                    "\nVPP F, VPP R: {0:0.2f}  {1:0.2f}".format(float(perfData[0,5]),float(perfData[1,5]))+ \
-                    "\nMPP F, MPP R: {0:0.2f}  {1:0.2f}".format(float(perfData[0,6]),float(perfData[1,6]))+ \
-                    "\nFF F, FF R: {0:0.2f}  {1:0.2f}".format(float(perfData[0,7]),float(perfData[1,7]))+ \
-                    "\nPCE F, PCE R: {0:0.2f}  {1:0.2f}".format(float(perfData[0,8]),float(perfData[1,8]))+ \
-                    "\nIllumination: "+perfData[0,9]+ \
+                    "\nDate/Time: {0}  {1}".format(*perf_date_time(perfData[0]))+\
+                    "\nVoc F, Voc R: {0:0.2f}  {1:0.2f}".format(perfData['Voc'][0],perfData['Voc'][1])+ \
+                    "\nJsc F, Jsc R: {0:0.2f}  {1:0.2f}".format(perfData['Jsc'][0],perfData['Jsc'][1])+ \
+                    "\nVPP F, VPP R: {0:0.2f}  {1:0.2f}".format(perfData['VPP'][0],perfData['VPP'][1])+ \
+                    "\nMPP F, MPP R: {0:0.2f}  {1:0.2f}".format(perfData['MPP'][0],perfData['MPP'][1])+ \
+                    "\nFF F, FF R: {0:0.2f}  {1:0.2f}".format(perfData['FF'][0],perfData['FF'][1])+ \
+                    "\nPCE F, PCE R: {0:0.2f}  {1:0.2f}".format(perfData['PCE'][0],perfData['PCE'][1])+ \
+                    "\nIllumination: "+str(perfData['Light'][0])+ \
                     "\nAcq Soak Voltage: {0:0.2f}".format(float(acqParams.iloc[0]['Acq Soak Voltage']))+ \
                     "\nAcq Soak Time: {0:0.2f}".format(float(acqParams.iloc[0]['Acq Soak Time'])) + \
                     "\nAcq Hold Time: {0:0.2f}".format(float(acqParams.iloc[0]['Acq Hold Time'])) + \
@@ -168,24 +165,20 @@ class DataLoadDMWindow(QMainWindow):
         device = self.resTableDMWidget.item(row,1).text()
         type = self.resTableDMWidget.item(row,2).text()
         
-        db, connFlag = self.connectDM()
-        if connFlag == False:
+        self.dbConnectInfo = self.parent().parent().dbconnectionwind.getDbConnectionInfo()
+        try:
+            entries = DataManagement(self.dbConnectInfo).getDocuments(self.resTableDMWidget.item(row,0).data(Qt.UserRole))
+        except:
             print("Abort")
             return
         if type == "JV" or type == "JV_dark":
-            for entry in db.Measurement.find({'substrate':substrate, 'itemId':device}):
-                if entry['measType'] == "JV":
-                    if entry['name'] == "JV_r":
-                        entryR = entry
-                    if entry['name'] == "JV_f":
-                        entryF = entry
-                elif entry['measType'] == "JV_dark":
-                    if entry['name'] == "JV_dark_r":
-                        entryR = entry
-                    if entry['name'] == "JV_dark_f":
-                        entryF = entry
+            for entry in entries:
+                if entry['name'] == "JV_r" or entry['name'] == "JV_dark_r":
+                    entryR = entry
+                if entry['name'] == "JV_f" or entry['name'] == "JV_dark_f":
+                    entryF = entry
         
-            perfData = np.array([self.getPerfData(entryR),self.getPerfData(entryF)])
+            perfData = perf_from_rows([self.getPerfData(entryR),self.getPerfData(entryF)])
 
             JV_r = self.getJV(entryR)
             JV_f = self.getJV(entryF)
@@ -193,13 +186,32 @@ class DataLoadDMWindow(QMainWindow):
             acqParams = self.getAcqParams(entryR)
 
         elif type == "tracking":
-            for entry in db.Measurement.find({'substrate':substrate, 'itemId':device, 'measType':'tracking'}):
-                perfData = np.array(entry['output'])
+            for entry in entries:
+                perfData = perf_from_rows(entry['output'])
                 JV = np.array([[0., 0., 0., 0.]])
                 acqParams = self.getAcqParams(entry)
 
         return substrate, device, perfData, JV, acqParams
 
+    # Rows for the table from the listing of measurements of a substrate:
+    # (itemId, measType, [_id of documents]), one per JV_r, JV_dark_r or
+    # tracking entry. JV_r is paired with the latest JV_f submitted before it.
+    def listDMRows(self, entries):
+        rows = []
+        entries = sorted(entries, key=lambda e: e['_id'])
+        for k, entry in enumerate(entries):
+            name = entry.get('name')
+            if name == "tracking":
+                rows.append((entry['itemId'], entry['measType'], [entry['_id']]))
+            elif name == "JV_r" or name == "JV_dark_r":
+                ids = [entry['_id']]
+                for prev in entries[k::-1]:
+                    if prev['itemId'] == entry['itemId'] and prev.get('name') == name[:-1]+"f":
+                        ids.append(prev['_id'])
+                        break
+                rows.append((entry['itemId'], entry['measType'], ids))
+        return rows
+
     # Process entry from DM into perfData
     def getPerfData(self,entry):
         perfData = np.append(entry['Acq Date'],entry['Acq Time'])
@@ -318,11 +330,10 @@ class DataLoadDMWindow(QMainWindow):
     def connectDM(self):
         self.dbConnectInfo = self.parent().parent().dbconnectionwind.getDbConnectionInfo()
         try:
-            conn = DataManagement(self.dbConnectInfo)
-            client, _ = conn.connectDB()
-            db = client[self.dbConnectInfo[2]]
-            #print(" Connected to DM")
-            return db, True
+            db, flag = DataManagement(self.dbConnectInfo).getDB()
+            if flag is False:
+                print(" Connection to DM failed")
+            return db, flag
         except:
             print(" Connection to DM failed")
             return None, False
@@ -0,0 +1,102 @@
+'''
+queryIndexWindow.py
+-------------------
+Class for providing a graphical user interface for
+searching the index of local data
+
+Copyright (C) 2017-2019 Nicola Ferralis <ferralis@mit.edu>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+'''
+import numpy as np
+import pandas as pd
+from PyQt5.QtWidgets import (QMainWindow,QPushButton,QAbstractItemView,
+                             QLineEdit,QTableWidget,QTableWidgetItem,
+                             QHeaderView,QComboBox)
+from PyQt5.QtCore import (QRect,pyqtSlot,pyqtSignal,Qt)
+
+from .bulkLoader import parse_csv_file
+from . import logger
+
+####################################################################
+#   Window for searching the index of local data
+####################################################################
+class DataIndexWindow(QMainWindow):
+    deviceData = pyqtSignal(str, np.ndarray, pd.DataFrame, np.ndarray)
+
+    def __init__(self, dataIndex, parent=None):
+        super(DataIndexWindow, self).__init__(parent)
+        self.title = 'Search Local Data'
+        self.dataIndex = dataIndex
+        self.initUI()
+
+    def initUI(self):
+        self.setWindowTitle(self.title)
+        self.setGeometry(QRect(10, 30, 700, 500))
+        self.textbox = QLineEdit(self)
+        self.textbox.setGeometry(QRect(15, 15, 180, 30))
+        self.textbox.setToolTip("Device or substrate. Ex: NF190203AA")
+        self.typeCBox = QComboBox(self)
+        self.typeCBox.setGeometry(QRect(205, 15, 100, 30))
+        self.typeCBox.addItems(["All", "JV", "JV_dark", "tracking"])
+        self.button = QPushButton('Search', self)
+        self.button.setGeometry(QRect(315, 15, 100, 30))
+
+        self.columns = ['deviceID', 'measType', 'acqDate', 'acqTime', 'Voc', 'Jsc', 'VPP', 'MPP', 'FF', 'PCE']
+        self.resTableIndexWidget = QTableWidget(self)
+        self.resTableIndexWidget.setGeometry(QRect(10, 60, 680, 430))
+        self.resTableIndexWidget.setToolTip("Double click to plot data")
+        self.resTableIndexWidget.setColumnCount(len(self.columns))
+        self.resTableIndexWidget.setHorizontalHeaderLabels(["Device ID", "Type", "Date", "Time",
+            "Voc [V]", "Jsc [mA/cm^2]", "VPP [V]", "MPP [mW/cm^2]", "FF", "PCE"])
+        self.resTableIndexWidget.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.resTableIndexWidget.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.resTableIndexWidget.setEditTriggers(QAbstractItemView.NoEditTriggers)
+
+        self.button.clicked.connect(self.onSearchButtonClick)
+        self.resTableIndexWidget.itemDoubleClicked.connect(self.onTableEntryDoubleClick)
+        self.show()
+
+    # Process Key Events
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Return:
+            self.onSearchButtonClick()
+
+    # Search the index (the csv files are not read)
+    @pyqtSlot()
+    def onSearchButtonClick(self):
+        measType = self.typeCBox.currentText()
+        rows = self.dataIndex.query(deviceID=self.textbox.text(),
+            measType=None if measType == "All" else measType)
+        self.resTableIndexWidget.setRowCount(len(rows))
+        for k, r in enumerate(rows):
+            for i, c in enumerate(self.columns):
+                if isinstance(r[c], float):
+                    self.resTableIndexWidget.setItem(k, i, QTableWidgetItem("{0:0.3f}".format(r[c])))
+                else:
+                    self.resTableIndexWidget.setItem(k, i, QTableWidgetItem(str(r[c])))
+            self.resTableIndexWidget.item(k,0).setData(Qt.UserRole, r['path'])
+            self.resTableIndexWidget.item(k,0).setToolTip(r['path'])
+        if len(rows) == 0:
+            self.resTableIndexWidget.setRowCount(1)
+            self.resTableIndexWidget.setItem(0, 0,QTableWidgetItem("None found"))
+
+    # Push data back to parent for plotting (double click)
+    @pyqtSlot()
+    def onTableEntryDoubleClick(self):
+        selectedRows = sorted(set([i.row() for i in self.resTableIndexWidget.selectedItems()]))
+        for row in selectedRows:
+            path = self.resTableIndexWidget.item(row,0).data(Qt.UserRole)
+            if path is None:
+                continue
+            try:
+                deviceID, perfData, dfAcqParams, JV = parse_csv_file(path)
+                self.deviceData.emit(deviceID, perfData, dfAcqParams, JV)
+            except:
+                msg = " Failed to load file: "+str(path)
+                print(msg)
+                logger.info(msg)
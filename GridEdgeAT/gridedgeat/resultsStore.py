@@ -0,0 +1,197 @@
+'''
+resultsStore.py
+---------------
+In-memory store for device results (perfData, acquisition parameters, JV)
+
+Copyright (C) 2017-2019 Nicola Ferralis <ferralis@mit.edu>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+'''
+import json
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+from .perfData import *
+
+ResultsEntry = namedtuple('ResultsEntry', ['deviceID', 'measType', 'perfData', 'acqParams', 'JV'])
+
+# Measurement type from perfData, as used in DM
+def meas_type(perfData):
+    if len(perfData) > 0 and perfData['Time step'][0] != 0:
+        return 'tracking'
+    if len(perfData) > 0 and perfData['Light'][0] == 0:
+        return 'JV_dark'
+    return 'JV'
+
+ARCHIVE_VERSION = 1
+
+# Acquisition parameters (DataFrame) to and from json
+def acq_params_to_json(acqParams):
+    if acqParams is None:
+        return "null"
+    d = acqParams.to_dict(orient='split')
+    return json.dumps({'columns': list(d['columns']), 'data': d['data']}, default=str)
+
+def acq_params_from_json(text):
+    d = json.loads(text)
+    if d is None:
+        return None
+    return pd.DataFrame(d['data'], columns=d['columns'])
+
+####################################################################
+#   Results store
+####################################################################
+# JV curves and perfData of all entries are kept in contiguous arrays,
+# which grow by doubling; each entry holds the offsets to its rows.
+# Entries are indexed by key, by device ID and by measurement type.
+# Removed entries leave gaps, which are compacted when they exceed
+# half of the JV or of the perfData storage.
+class ResultsStore():
+    def __init__(self, jvColumns=4):
+        self.jvColumns = jvColumns
+        self.clear()
+
+    def clear(self):
+        self.jv = np.zeros((1024, self.jvColumns))
+        self.jvUsed = 0
+        self.perf = new_perf_data(256)
+        self.perfUsed = 0
+        self.jvUnused = 0
+        self.perfUnused = 0
+        self.entries = {}
+        self.deviceIndex = {}
+        self.typeIndex = {}
+        self.nextKey = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    # Add results for a device, returns the key of the new entry
+    def add(self, deviceID, perfData, acqParams, JV):
+        JV = np.asarray(JV, dtype=float).reshape(-1, self.jvColumns)
+        self.jv, jvStart = self.__append(self.jv, self.jvUsed, JV)
+        self.jvUsed = jvStart + len(JV)
+        self.perf, perfStart = self.__append(self.perf, self.perfUsed, perfData)
+        self.perfUsed = perfStart + len(perfData)
+
+        key = self.nextKey
+        self.nextKey += 1
+        measType = meas_type(perfData)
+        self.entries[key] = (str(deviceID), measType, acqParams,
+                    jvStart, len(JV), perfStart, len(perfData))
+        self.deviceIndex.setdefault(str(deviceID), []).append(key)
+        self.typeIndex.setdefault(measType, []).append(key)
+        return key
+
+    # Entry for a key (None if not present). perfData and JV are views
+    # into the store, copy them before modifying.
+    def get(self, key):
+        if key not in self.entries:
+            return None
+        deviceID, measType, acqParams, jvStart, jvLen, perfStart, perfLen = self.entries[key]
+        return ResultsEntry(deviceID, measType,
+                    self.perf[perfStart:perfStart+perfLen], acqParams,
+                    self.jv[jvStart:jvStart+jvLen])
+
+    # Keys for a device, optionally for a given measurement type only
+    def find(self, deviceID, measType=None):
+        keys = self.deviceIndex.get(str(deviceID), [])
+        if measType is None:
+            return list(keys)
+        return [k for k in keys if self.entries[k][1] == measType]
+
+    # Keys for a measurement type ('JV', 'JV_dark', 'tracking')
+    def findType(self, measType):
+        return list(self.typeIndex.get(measType, []))
+
+    def remove(self, key):
+        if key not in self.entries:
+            return
+        deviceID, measType, _, _, jvLen, _, perfLen = self.entries.pop(key)
+        self.deviceIndex[deviceID].remove(key)
+        if len(self.deviceIndex[deviceID]) == 0:
+            del self.deviceIndex[deviceID]
+        self.typeIndex[measType].remove(key)
+        self.jvUnused += jvLen
+        self.perfUnused += perfLen
+        if self.jvUnused > self.jvUsed/2 or self.perfUnused > self.perfUsed/2:
+            self.__compact()
+
+    # Save all entries in one uncompressed NPZ archive. perfData and JV of
+    # all devices are written as single contiguous arrays with per-entry
+    # offsets; acquisition parameters and meta data are stored as json.
+    def saveArchive(self, filename, meta={}):
+        keys = sorted(self.entries)
+        entries = [self.get(k) for k in keys]
+        perfLen = np.array([len(e.perfData) for e in entries], dtype=np.int64)
+        jvLen = np.array([len(e.JV) for e in entries], dtype=np.int64)
+        np.savez(filename,
+            version = np.array([ARCHIVE_VERSION]),
+            meta = np.array([json.dumps(meta, default=str)]),
+            deviceID = np.array([e.deviceID for e in entries], dtype=str),
+            measType = np.array([e.measType for e in entries], dtype=str),
+            acqParams = np.array([acq_params_to_json(e.acqParams) for e in entries], dtype=str),
+            perfOffsets = np.concatenate(([0], np.cumsum(perfLen))),
+            jvOffsets = np.concatenate(([0], np.cumsum(jvLen))),
+            perfData = np.concatenate([e.perfData for e in entries]) if entries else new_perf_data(),
+            JV = np.concatenate([e.JV for e in entries]) if entries else np.zeros((0, self.jvColumns)))
+
+    # Add all entries from an NPZ archive, returns the new keys and the meta
+    # data. The perfData and JV arrays are appended to the store at once.
+    def loadArchive(self, filename):
+        with np.load(filename) as arch:
+            deviceIDs = arch['deviceID']
+            acqParams = arch['acqParams']
+            perfOffsets = arch['perfOffsets']
+            jvOffsets = arch['jvOffsets']
+            self.jv, jvStart = self.__append(self.jv, self.jvUsed,
+                    arch['JV'].reshape(-1, self.jvColumns))
+            self.perf, perfStart = self.__append(self.perf, self.perfUsed, arch['perfData'])
+            meta = json.loads(str(arch['meta'][0]))
+        self.jvUsed = jvStart + jvOffsets[-1]
+        self.perfUsed = perfStart + perfOffsets[-1]
+        keys = []
+        for k, deviceID in enumerate(deviceIDs):
+            key = self.nextKey
+            self.nextKey += 1
+            deviceID = str(deviceID)
+            perfData = self.perf[perfStart+perfOffsets[k]:perfStart+perfOffsets[k+1]]
+            measType = meas_type(perfData)
+            self.entries[key] = (deviceID, measType, acq_params_from_json(str(acqParams[k])),
+                    jvStart+jvOffsets[k], jvOffsets[k+1]-jvOffsets[k],
+                    perfStart+perfOffsets[k], len(perfData))
+            self.deviceIndex.setdefault(deviceID, []).append(key)
+            self.typeIndex.setdefault(measType, []).append(key)
+            keys.append(key)
+        return keys, meta
+
+    # Append rows to a growable array, returns the array and the start offset
+    def __append(self, buf, used, rows):
+        if used + len(rows) > len(buf):
+            newBuf = np.zeros((max(2*len(buf), used+len(rows)),)+buf.shape[1:], dtype=buf.dtype)
+            newBuf[:used] = buf[:used]
+            buf = newBuf
+        buf[used:used+len(rows)] = rows
+        return buf, used
+
+    def __compact(self):
+        entries = [(k, self.get(k)) for k in sorted(self.entries)]
+        jv = np.concatenate([e.JV for _, e in entries]) if entries else np.zeros((0, self.jvColumns))
+        perf = np.concatenate([e.perfData for _, e in entries]) if entries else new_perf_data()
+        jvStart, perfStart = 0, 0
+        for k, e in entries:
+            self.entries[k] = (e.deviceID, e.measType, e.acqParams,
+                    jvStart, len(e.JV), perfStart, len(e.perfData))
+            jvStart += len(e.JV)
+            perfStart += len(e.perfData)
+        self.jv, self.jvUsed = jv, jvStart
+        self.perf, self.perfUsed = perf, perfStart
+        self.jvUnused = 0
+        self.perfUnused = 0
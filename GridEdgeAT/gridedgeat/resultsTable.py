@@ -0,0 +1,177 @@
+'''
+resultsTable.py
+---------------
+Model and delegate for the table of results in the results panel
+
+Copyright (C) 2017-2019 Nicola Ferralis <ferralis@mit.edu>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+'''
+import numpy as np
+from PyQt5.QtWidgets import (QStyledItemDelegate)
+from PyQt5.QtCore import (Qt, QAbstractTableModel, QModelIndex, QVariant)
+from PyQt5.QtGui import (QColor, QBrush)
+
+from .perfData import *
+
+RESULTS_HEADERS = ["Device ID", "Av Voc [V]", u"Av Jsc [mA/cm²]", "Av VPP [V]",
+                u"Av MPP [mW/cm²]", "Av FF", "Av PCE [%]", "Illumination",
+                "Tracking time [s]", "Acq Date", "Acq Time"]
+
+####################################################################
+#   Results table model
+####################################################################
+# Each row refers to an entry of the results store by key. Rows of
+# devices being acquired have no key yet and hold their latest perfData,
+# until the results are stored (setRowKey).
+# Cell texts are formatted when first displayed and cached per row;
+# tooltips are formatted only when requested.
+class ResultsTableModel(QAbstractTableModel):
+    def __init__(self, results, parent=None):
+        super(ResultsTableModel, self).__init__(parent)
+        self.results = results
+        self.rows = []
+        self.highlightedRow = -1
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(RESULTS_HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return RESULTS_HEADERS[section]
+        return QVariant()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return QVariant()
+        row = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            if row['text'] is None:
+                row['text'] = self.formatRow(row)
+            return row['text'][index.column()]
+        if role == Qt.ToolTipRole and 1 <= index.column() <= len(PERF_METRICS):
+            perfData = self.rowPerfData(row)
+            if perfData is not None and len(perfData) > 1:
+                m = PERF_METRICS[index.column()-1]
+                return "F:{0:0.3f}".format(perfData[m][0])+" / B:{0:0.3f}".format(perfData[m][1])
+        return QVariant()
+
+    # Add an empty row on top, for a device being acquired
+    def insertDevice(self, deviceID=""):
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self.rows.insert(0, self.newRow(None, deviceID, None))
+        self.endInsertRows()
+        self.shiftHighlight(1)
+
+    # Add rows on top for entries already in the store (latest key on top)
+    def insertKeys(self, keys):
+        if len(keys) == 0:
+            return
+        self.beginInsertRows(QModelIndex(), 0, len(keys)-1)
+        self.rows[0:0] = [self.newRow(k, None, None) for k in keys[::-1]]
+        self.endInsertRows()
+        self.shiftHighlight(len(keys))
+
+    # Show the latest perfData for a row
+    def setRowData(self, row, deviceID, perfData):
+        self.rows[row]['deviceID'] = deviceID
+        self.rows[row]['perfData'] = np.array(perfData, copy=True)
+        self.rowChanged(row)
+
+    # Refer a row to an entry of the store
+    def setRowKey(self, row, key):
+        self.rows[row]['key'] = key
+        self.rows[row]['perfData'] = None
+        self.rowChanged(row)
+
+    def rowKey(self, row):
+        if 0 <= row < len(self.rows):
+            return self.rows[row]['key']
+        return None
+
+    def rowDeviceID(self, row):
+        entry = self.results.get(self.rows[row]['key'])
+        return self.rows[row]['deviceID'] if entry is None else entry.deviceID
+
+    def removeRow(self, row, parent=QModelIndex()):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.rows[row]
+        self.endRemoveRows()
+        if row == self.highlightedRow:
+            self.highlightedRow = -1
+        elif row < self.highlightedRow:
+            self.highlightedRow -= 1
+        return True
+
+    def clear(self):
+        self.beginResetModel()
+        self.rows = []
+        self.highlightedRow = -1
+        self.endResetModel()
+
+    # Highlight a single row, only the old and new rows are repainted
+    def highlight(self, row):
+        old = self.highlightedRow
+        self.highlightedRow = row
+        if 0 <= old < len(self.rows):
+            self.rowChanged(old, False)
+        self.rowChanged(row, False)
+
+    def isHighlighted(self, row):
+        return row == self.highlightedRow
+
+    def newRow(self, key, deviceID, perfData):
+        return {'key': key, 'deviceID': deviceID, 'perfData': perfData, 'text': None}
+
+    # perfData shown in a row: the latest one set, otherwise from the store
+    def rowPerfData(self, row):
+        entry = self.results.get(row['key'])
+        if row['perfData'] is not None or entry is None:
+            return row['perfData']
+        return entry.perfData
+
+    # Texts of all columns of a row
+    def formatRow(self, row):
+        entry = self.results.get(row['key'])
+        deviceID = row['deviceID'] if entry is None else entry.deviceID
+        obj = self.rowPerfData(row)
+        if obj is None or len(obj) == 0:
+            return [str(deviceID)] + [""]*(len(RESULTS_HEADERS)-1)
+        text = [str(deviceID)]
+        text += ["{0:0.3f}".format(np.mean(obj[m])) for m in PERF_METRICS]
+        text.append("ON" if obj['Light'][0] == 1 else "OFF")
+        if obj['Time step'][0] == 0.:
+            text.append("None")
+        else:
+            text.append("{0:0.3f}".format(obj['Time step'][0]))
+        text += list(perf_date_time(obj[0]))
+        return text
+
+    def rowChanged(self, row, clearText=True):
+        if clearText:
+            self.rows[row]['text'] = None
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(RESULTS_HEADERS)-1))
+
+    def shiftHighlight(self, num):
+        if self.highlightedRow >= 0:
+            self.highlightedRow += num
+
+####################################################################
+#   Delegate for highlighting the selected device
+####################################################################
+class ResultsDelegate(QStyledItemDelegate):
+    def __init__(self, color=QColor(0,255,0), parent=None):
+        super(ResultsDelegate, self).__init__(parent)
+        self.color = color
+
+    def initStyleOption(self, option, index):
+        super(ResultsDelegate, self).initStyleOption(option, index)
+        if index.model().isHighlighted(index.row()):
+            option.backgroundBrush = QBrush(self.color)
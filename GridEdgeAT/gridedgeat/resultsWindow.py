@@ -12,7 +12,7 @@ the Free Software Foundation; either version 2 of the License, or
 (at your option) any later version.
 
 '''
-import sys, random, math, json, requests, webbrowser
+import sys, random, math, json, requests, webbrowser, time
 import numpy as np
 import pandas as pd
 from datetime import datetime
@@ -20,8 +20,8 @@ from PyQt5.QtWidgets import (QMainWindow,QPushButton,QVBoxLayout,QFileDialog,QWi
                              QGridLayout,QGraphicsView,QLabel,QComboBox,QLineEdit,
                              QTextEdit, QMenuBar,QStatusBar, QApplication,QTableWidget,
                              QTableWidgetItem,QAction,QHeaderView,QMenu,QHBoxLayout,
-                             QAbstractItemView)
-from PyQt5.QtCore import (QRect,pyqtSlot,pyqtSignal,Qt)
+                             QAbstractItemView,QProgressDialog,QTableView)
+from PyQt5.QtCore import (QRect,pyqtSlot,pyqtSignal,Qt,QTimer,QFileSystemWatcher)
 from PyQt5.QtGui import (QColor,QCursor)
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
@@ -30,6 +30,13 @@ import matplotlib.pyplot as plt
 from .dataManagement import *
 from .queryDMWindow import *
 from .fitMethods import *
+from .perfData import *
+from .resultsStore import *
+from .persistence import *
+from .bulkLoader import *
+from .dataIndex import *
+from .queryIndexWindow import *
+from .resultsTable import *
 from . import logger
 
 ####################################################################
@@ -39,11 +46,14 @@ class ResultsWindow(QMainWindow):
     def __init__(self, parent=None):
         super(ResultsWindow, self).__init__(parent)
         self.deviceID = np.zeros((0,1))
-        self.perfData = np.zeros((0,9))
+        self.perfData = new_perf_data()
+        self.trackBuffer = PerfDataBuffer(maxlen=self.parent().config.trackMaxSamples)
         self.JV = np.array([])
-        self.setupDataFrame()
+        self.setupResultsStore()
         self.csvFolder = self.parent().config.csvSavingFolder
         self.initUI()
+        # Created once in the GUI thread, the MPP line is set in initPlots
+        self.blitMPP = BlitManager(self.canvasMPP, [], self.parent().config.plotMaxFPS)
         self.initPlots(self.perfData)
         self.initJVPlot()
         self.show()
@@ -107,27 +117,17 @@ class ResultsWindow(QMainWindow):
 
         self.resTableW = 1160
         self.resTableH = 145
-        self.resTableWidget = QTableWidget(self.centralwidget)
+        self.resTableModel = ResultsTableModel(self.results, self)
+        self.resTableWidget = QTableView(self.centralwidget)
+        self.resTableWidget.setModel(self.resTableModel)
+        self.resTableWidget.setItemDelegate(ResultsDelegate(QColor(0,255,0), self))
         self.resTableWidget.setGeometry(QRect(10, 770, self.resTableW, self.resTableH))
         self.resTableWidget.setToolTip("Right click for more options")
-        self.resTableWidget.setColumnCount(11)
-        self.resTableWidget.setRowCount(0)
-        self.resTableWidget.setItem(0,0, QTableWidgetItem(""))
-        self.resTableWidget.setHorizontalHeaderItem(0,QTableWidgetItem("Device ID"))
-        self.resTableWidget.setHorizontalHeaderItem(1,QTableWidgetItem("Av Voc [V]"))
-        self.resTableWidget.setHorizontalHeaderItem(2,QTableWidgetItem(u"Av Jsc [mA/cm\u00B2]"))
-        self.resTableWidget.setHorizontalHeaderItem(3,QTableWidgetItem("Av VPP [V]"))
-        self.resTableWidget.setHorizontalHeaderItem(4,QTableWidgetItem("Av MPP [mW/cm\u00B2]"))
-        self.resTableWidget.setHorizontalHeaderItem(5,QTableWidgetItem("Av FF"))
-        self.resTableWidget.setHorizontalHeaderItem(6,QTableWidgetItem("Av PCE [%]"))
-        self.resTableWidget.setHorizontalHeaderItem(7,QTableWidgetItem("Illumination"))
-        self.resTableWidget.setHorizontalHeaderItem(8,QTableWidgetItem("Tracking time [s]"))
-        self.resTableWidget.setHorizontalHeaderItem(9,QTableWidgetItem("Acq Date"))
-        self.resTableWidget.setHorizontalHeaderItem(10,QTableWidgetItem("Acq Time"))
         self.resTableWidget.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.resTableWidget.verticalHeader().setDefaultSectionSize(24)
         self.resTableWidget.setSelectionBehavior(QAbstractItemView.SelectRows)
 
-        self.resTableWidget.itemClicked.connect(self.onCellClick)
+        self.resTableWidget.clicked.connect(self.onCellClick)
         self.setCentralWidget(self.centralwidget)
 
         # Make Menu for plot related calls
@@ -145,7 +145,21 @@ class ResultsWindow(QMainWindow):
         self.saveAllMenu = QAction("&Save All Data", self)
         self.saveAllMenu.setShortcut("Ctrl+Shift+s")
         self.saveAllMenu.setStatusTip('Save all data into csv')
-        self.saveAllMenu.triggered.connect(lambda: self.selectDeviceSaveLocally(list(range(self.resTableWidget.rowCount()))))
+        self.saveAllMenu.triggered.connect(lambda: self.selectDeviceSaveLocally(list(range(self.resTableModel.rowCount()))))
+        self.bulkLoadMenu = QAction("&Bulk Load Local Data Folder", self)
+        self.bulkLoadMenu.setStatusTip('Load all csv data from a folder and its subfolders')
+        self.bulkLoadMenu.triggered.connect(self.bulk_load_csv)
+        self.loadArchiveMenu = QAction("Load &Run Archive", self)
+        self.loadArchiveMenu.setStatusTip('Load all devices of a run from an archive file')
+        self.loadArchiveMenu.triggered.connect(self.load_archive)
+        self.saveArchiveMenu = QAction("Save Run &Archive", self)
+        self.saveArchiveMenu.setStatusTip('Save all data into a single archive file')
+        self.saveArchiveMenu.triggered.connect(lambda: self.save_archive(
+            QFileDialog.getSaveFileName(self, "Save run archive", self.csvFolder, "*.npz")[0]))
+        self.searchIndexMenu = QAction("Search Local &Data", self)
+        self.searchIndexMenu.setShortcut("Ctrl+f")
+        self.searchIndexMenu.setStatusTip('Search the index of local data')
+        self.searchIndexMenu.triggered.connect(self.openWindowIndex)
         self.directoryMenu = QAction("&Set directory for saved files", self)
         self.directoryMenu.setShortcut("Ctrl+d")
         self.directoryMenu.setStatusTip('Set directory for saved files')
@@ -158,9 +172,14 @@ class ResultsWindow(QMainWindow):
         
         fileMenu = self.menuBar.addMenu('&File')
         fileMenu.addAction(self.loadMenu)
+        fileMenu.addAction(self.bulkLoadMenu)
         fileMenu.addAction(self.loadDMMenu)
+        fileMenu.addAction(self.searchIndexMenu)
         fileMenu.addAction(self.saveAllMenu)
         fileMenu.addSeparator()
+        fileMenu.addAction(self.loadArchiveMenu)
+        fileMenu.addAction(self.saveArchiveMenu)
+        fileMenu.addSeparator()
         fileMenu.addAction(self.directoryMenu)
         plotMenu = self.menuBar.addMenu('&Plot')
         plotMenu.addAction(self.clearMenu)
@@ -170,6 +189,29 @@ class ResultsWindow(QMainWindow):
         self.statusbar = QStatusBar(self)
         self.statusbar.setObjectName("statusbar")
         self.setStatusBar(self.statusbar)
+        self.persistenceLabel = QLabel(self)
+        self.statusbar.addPermanentWidget(self.persistenceLabel)
+
+        # Saving csv and submitting to DM run in the background
+        config = self.parent().config
+        self.persistence = PersistenceWorker(config.spoolFolder, config.DbQueueSize,
+            config.DbMaxRetries, config.DbRetryBackoff, config.DbSpoolRetryInterval,
+            config.DbBatchSubmit, config.DbBatchTimeout, self)
+        self.persistence.Msg.connect(self.printMsg)
+        self.persistence.status.connect(self.updatePersistenceStatus)
+        self.persistence.start()
+        self.persistence.emitStatus()
+
+        # Index of local data, updated as files are saved
+        self.dataIndexer = None
+        self.searchIndexMenu.setEnabled(config.dataIndexEnabled)
+        if config.dataIndexEnabled == True:
+            self.dataWatcher = QFileSystemWatcher(self)
+            self.dataIndexer = DataIndexer(config.dataIndexFile, self.csvFolder, self)
+            self.dataIndexer.Msg.connect(self.printMsg)
+            self.dataIndexer.folders.connect(self.watchDataFolders)
+            self.dataWatcher.directoryChanged.connect(self.dataIndexer.rescan)
+            self.dataIndexer.start()
 
     # Set directory for saved data
     def set_dir_saved(self):
@@ -180,6 +222,14 @@ class ResultsWindow(QMainWindow):
         msg = "CSV Files will be saved in: "+self.csvFolder
         print(msg)
         logger.info(msg)
+        if self.dataIndexer is not None:
+            self.dataIndexer.setFolder(self.csvFolder)
+
+    # Watch the folders of the local data tree (for the index)
+    def watchDataFolders(self, folders):
+        if len(self.dataWatcher.directories()) > 0:
+            self.dataWatcher.removePaths(self.dataWatcher.directories())
+        self.dataWatcher.addPaths(folders)
     
     # Define axis parametrs for plots
     def plotSettings(self, ax):
@@ -195,8 +245,9 @@ class ResultsWindow(QMainWindow):
         self.axMPP.set_ylabel('Max power point \n[mW/cm$^2$]',fontsize=8)
         self.axMPP.set_autoscale_on(True)
         self.axMPP.autoscale_view(True,True,True)
+        self.lineMPP, = self.axMPP.plot(data['Time step'],data['MPP'], '.-',linewidth=0.5)
+        self.blitMPP.setArtists([self.lineMPP])
         self.canvasMPP.draw()
-        self.lineMPP, = self.axMPP.plot(data[:,0],data[:,4], '.-',linewidth=0.5)
     
     # Initialize JV and PV plots
     def initJVPlot(self):
@@ -215,77 +266,109 @@ class ResultsWindow(QMainWindow):
         self.axPVresp.set_ylabel('Power density [mW/cm$^2$]',fontsize=8)
         self.axPVresp.axvline(x=0, linewidth=0.5)
         self.axPVresp.axhline(y=0, linewidth=0.5)
+
+        # Lines are created once and their data updated in place
+        self.linesJV = self.axJVresp.plot([],[], '.-',linewidth=0.5, label="Forw") + \
+                self.axJVresp.plot([],[], '.-',linewidth=0.5, label="Back")
+        self.linesPV = self.axPVresp.plot([],[], '.-',linewidth=0.5, label="Forw") + \
+                self.axPVresp.plot([],[], '.-',linewidth=0.5, label="Back")
+        self.fitLines = []
+        self.figureJVresp.tight_layout()
+        self.figurePVresp.tight_layout()
         self.canvasJVresp.draw()
         self.canvasPVresp.draw()
 
     # Plot MPP with tracking
+    # Axes are only rescaled (full redraw) when data leave the view,
+    # otherwise the line is blitted on the cached background.
     def plotMPP(self, data):
-        self.toolbarMPP.update()
-        self.lineMPP.set_data(data[:,2].astype(float), abs(data[:,6].astype(float)))
-        self.axMPP.relim()
-        self.axMPP.autoscale_view(True,True,True)
-        self.canvasMPP.draw()
+        x, y = data['Time step'], abs(data['MPP'])
+        self.lineMPP.set_data(x, y)
+        fullRedraw = self.rescaleAxes(self.axMPP, x, y)
+        if fullRedraw:
+            self.toolbarMPP.update()
+        self.blitMPP.update(fullRedraw)
+
+    # Rescale axes with headroom when data fall outside the current view,
+    # so that a growing time series only rarely needs a full redraw.
+    # Returns True when the view has changed.
+    def rescaleAxes(self, ax, x, y, headroom=0.2):
+        ind = np.isfinite(x) & np.isfinite(y)
+        x, y = x[ind], y[ind]
+        if len(x) == 0:
+            return False
+        (x0, x1), (y0, y1) = ax.get_xlim(), ax.get_ylim()
+        if x.min() >= x0 and x.max() <= x1 and y.min() >= y0 and y.max() <= y1:
+            return False
+        dx = (x.max()-x.min()) or 1.
+        dy = (y.max()-y.min()) or abs(y.max()) or 1.
+        ax.set_xlim(x.min()-0.02*dx, x.max()+headroom*dx)
+        ax.set_ylim(y.min()-headroom*dy, y.max()+headroom*dy)
+        return True
     
     # Plot JV response
     def plotJVresp(self, JV, clearFlag):
         if clearFlag:
-            self.initJVPlot()
+            for l in self.fitLines:
+                l.remove()
+            self.fitLines = []
             self.toolbarJVresp.update()
             self.toolbarPVresp.update()
-            labelF = "Forw"
-            labelR = "Back"
+            self.linesJV[0].set_data(JV[:,0],JV[:,1])
+            self.linesJV[1].set_data(JV[:,2],JV[:,3])
+            self.linesPV[0].set_data(JV[:,0],JV[:,0]*JV[:,1])
+            self.linesPV[1].set_data(JV[:,2],JV[:,2]*JV[:,3])
         else:
-            labelF = "Forw-Fit"
-            labelR = "Back-Fit"
-        self.axJVresp.plot(JV[:,0],JV[:,1], '.-',linewidth=0.5, label=labelF)
-        self.axJVresp.plot(JV[:,2],JV[:,3], '.-',linewidth=0.5, label=labelR)
-        self.axPVresp.plot(JV[:,0],JV[:,0]*JV[:,1], '.-',linewidth=0.5, label=labelF)
-        self.axPVresp.plot(JV[:,2],JV[:,2]*JV[:,3], '.-',linewidth=0.5, label=labelR)
+            self.fitLines += self.axJVresp.plot(JV[:,0],JV[:,1], '.-',linewidth=0.5, label="Forw-Fit")
+            self.fitLines += self.axJVresp.plot(JV[:,2],JV[:,3], '.-',linewidth=0.5, label="Back-Fit")
+            self.fitLines += self.axPVresp.plot(JV[:,0],JV[:,0]*JV[:,1], '.-',linewidth=0.5, label="Forw-Fit")
+            self.fitLines += self.axPVresp.plot(JV[:,2],JV[:,2]*JV[:,3], '.-',linewidth=0.5, label="Back-Fit")
+        for ax in [self.axJVresp, self.axPVresp]:
+            ax.relim()
+            ax.autoscale_view(True,True,True)
+            if self.parent().config.logPlotJV:
+                ax.set_yscale('log')
         self.axJVresp.legend(loc='lower left')
         self.axPVresp.legend(loc='upper left')
-        if self.parent().config.logPlotJV:
-            self.axJVresp.set_yscale('log')
-            self.axPVresp.set_yscale('log')
-        self.figureJVresp.tight_layout()
-        self.figurePVresp.tight_layout()
-        self.canvasJVresp.draw()
-        self.canvasPVresp.draw()
+        self.canvasJVresp.draw_idle()
+        self.canvasPVresp.draw_idle()
     
     # Clear all plots and fields
     def clearPlots(self, includeTable):
         self.setWindowTitle('Results Panel')
         self.deviceID = np.zeros((0,1))
-        self.perfData = np.zeros((0,8))
+        self.perfData = new_perf_data()
         self.JV = np.array([])
         self.initPlots(self.perfData)
         self.initJVPlot()
         if includeTable is True:
-            self.resTableWidget.setRowCount(0)
+            self.resTableModel.clear()
+            self.results.clear()
         QApplication.processEvents()
     
     # Action upon selecting a row in the table.
-    @pyqtSlot()
-    def onCellClick(self):
-        row = self.resTableWidget.selectedItems()[0].row()
-        for j in range(self.resTableWidget.columnCount()):
-            for i in range(self.resTableWidget.rowCount()):
-                self.resTableWidget.item(i,j).setBackground(QColor(255,255,255))
-        for j in range(self.resTableWidget.columnCount()):
-            self.resTableWidget.item(row,j).setBackground(QColor(0,255,0))
-        try:
-            self.setWindowTitle('Results Panel - Device: '+ str(self.dfTotDeviceID.iat[0,self.resTableWidget.rowCount()-1-row][0][0]))
-            self.plotData(self.dfTotDeviceID.iat[0,self.resTableWidget.rowCount()-1-row],
-                self.dfTotPerfData.iat[0,self.resTableWidget.rowCount()-1-row],
-                self.dfTotJV.iat[0,self.resTableWidget.rowCount()-1-row])
-        except:
-            pass
+    def onCellClick(self, index):
+        row = index.row()
+        # Only the previously highlighted row and the new one are repainted
+        self.resTableModel.highlight(row)
+        entry = self.results.get(self.getRowKey(row))
+        if entry is not None:
+            self.setWindowTitle('Results Panel - Device: '+ entry.deviceID)
+            self.plotData(entry.deviceID, entry.perfData, entry.JV)
+
+    # Key in the results store for a table row (None if not stored)
+    def getRowKey(self, row):
+        return self.resTableModel.rowKey(row)
+
+    # Rows currently selected in the table
+    def getSelectedRows(self):
+        return sorted([i.row() for i in self.resTableWidget.selectionModel().selectedRows()])
 
     # Process Key Events
     def keyPressEvent(self, event):
-        if self.resTableWidget.rowCount() > 0:
+        if self.resTableModel.rowCount() > 0:
             if event.key() == Qt.Key_Delete:
-                selectedRows = list(set([ i.row() for i in self.resTableWidget.selectedItems()]))
-                self.selectDeviceRemove(selectedRows)
+                self.selectDeviceRemove(self.getSelectedRows())
 
     # Enable right click on substrates for saving locally and delete
     def contextMenuEvent(self, event):
@@ -293,7 +376,7 @@ class ResultsWindow(QMainWindow):
         rPos = self.resTableWidget.mapFromGlobal(QCursor.pos())
         if rPos.x()>0 and rPos.x()<self.resTableW and \
                 rPos.y()>0 and rPos.y()<self.resTableH and \
-                self.resTableWidget.rowCount() > 0 :
+                self.resTableModel.rowCount() > 0 :
         
             selectCellLoadAction = QAction('Load from csv...', self)
             selectCellLoadAction.setShortcut("Ctrl+o")
@@ -327,16 +410,14 @@ class ResultsWindow(QMainWindow):
             QApplication.processEvents()
             
             selectCellLoadAction.triggered.connect(self.load_csv)
-            selectedRows = [self.resTableWidget.rowCount()-j-1 for j in list(set([ i.row() for i in self.resTableWidget.selectedItems()]))]
-            #selectedRows = list(set([ i.row() for i in self.resTableWidget.selectedItems()]))
-            #for row in selectedRows[::-1]:
+            selectedRows = self.getSelectedRows()
             selectCellSaveAction.triggered.connect(lambda: self.selectDeviceSaveLocally(selectedRows))
-            selectCellSaveAllAction.triggered.connect(lambda: self.selectDeviceSaveLocally(list(range(self.resTableWidget.rowCount()))))
+            selectCellSaveAllAction.triggered.connect(lambda: self.selectDeviceSaveLocally(list(range(self.resTableModel.rowCount()))))
             selectCellRemoveAction.triggered.connect(lambda: self.selectDeviceRemove(selectedRows))
             selectRemoveAllAction.triggered.connect(lambda: self.clearPlots(True))
             fitDiodeEquationAction.triggered.connect(lambda: self.fitDiodeEquation(selectedRows))
             fitInterpolateAction.triggered.connect(lambda: self.fitInterpolate(selectedRows))
-            viewDMEntryAction.triggered.connect(lambda: self.parent().samplewind.viewOnDM(self.resTableWidget.selectedItems()[0].text()))
+            viewDMEntryAction.triggered.connect(lambda: self.parent().samplewind.viewOnDM(self.resTableModel.rowDeviceID(selectedRows[0])))
 
     # Logic to save locally devices selected from results table
     def selectDeviceSaveLocally(self, selectedRows):
@@ -344,29 +425,27 @@ class ResultsWindow(QMainWindow):
             folder = str(QFileDialog.getExistingDirectory(self, "Select directory where to save..."))
             #print(selectedRows)
             for row in selectedRows:
-                #print(self.dfTotDeviceID.iat[0,row][0][0],self.dfTotPerfData.iat[0,row])
-                self.save_csv(self.dfTotDeviceID.iat[0,row][0][0],
-                    self.dfTotAcqParams.iloc[[row]],
-                    self.dfTotPerfData.iat[0,row],
-                    self.dfTotJV.iat[0,row],folder)
+                entry = self.results.get(self.getRowKey(row))
+                if entry is not None:
+                    self.save_csv(entry.deviceID, entry.acqParams,
+                        entry.perfData, entry.JV, folder)
         
         except:
             print("Error: data cannot be saved")
     
     # Logic to remove data from devices selected from results table
     def selectDeviceRemove(self, selectedRows):
-        for row in selectedRows:
-            self.dfTotDeviceID.drop(self.dfTotDeviceID.columns[row], axis=1)
-            self.dfTotPerfData.drop(self.dfTotPerfData.columns[row], axis=1)
-            self.dfTotJV.drop(self.dfTotJV.columns[row], axis=1)
-            for l in self.axJVresp.get_lines():
-                l.remove()
-            for l in self.axPVresp.get_lines():
-                l.remove()
-            #print(" Removed data from table: ",str(self.dfTotDeviceID.iat[0,row]))
-            self.canvasJVresp.draw()
-            self.canvasPVresp.draw()
-            self.resTableWidget.removeRow(row)
+        # Remove from the bottom, so that the indexes of remaining rows do not change
+        for row in sorted(selectedRows, reverse=True):
+            self.results.remove(self.getRowKey(row))
+            self.resTableModel.removeRow(row)
+        for l in self.fitLines:
+            l.remove()
+        self.fitLines = []
+        for l in self.linesJV + self.linesPV:
+            l.set_data([],[])
+        self.canvasJVresp.draw_idle()
+        self.canvasPVresp.draw_idle()
     
     # Logic to Fit the JV curve using the Diode Equation
     def fitDiodeEquation(self, selectedRows):
@@ -375,7 +454,7 @@ class ResultsWindow(QMainWindow):
         FM.results.connect(lambda msg: logger.info(msg))
         #DE.func.connect(lambda func: [FM.fitDE(func,self.dfTotJV.iat[0,row]) for row in selectedRows])
         FM.JV_fit.connect(lambda JV: self.plotJVresp(JV,False))
-        [FM.fitDE(self.dfTotJV.iat[0,row]) for row in selectedRows]
+        [FM.fitDE(self.results.get(self.getRowKey(row)).JV) for row in selectedRows]
         #FM.start()
         
     # Logic to Fit the JV curve using scipy.interpolate.interp1d
@@ -385,32 +464,22 @@ class ResultsWindow(QMainWindow):
         FM.results.connect(lambda msg: logger.info(msg))
         #DE.func.connect(lambda func: [FM.fitDE(func,self.dfTotJV.iat[0,row]) for row in selectedRows])
         FM.JV_fit.connect(lambda JV: self.plotJVresp(JV,False))
-        [FM.fitInterp(self.dfTotJV.iat[0,row]) for row in selectedRows]
+        [FM.fitInterp(self.results.get(self.getRowKey(row)).JV) for row in selectedRows]
         #FM.start()
 
-    # Add row and initialize it within the table
+    # Add row on top of the table for a new device
     def setupResultTable(self):
-        self.resTableWidget.insertRow(0)
+        self.resTableModel.insertDevice()
         self.lastRowInd = 0
 
-        ### Uncomment this to display latest acquisition last 
-        #self.resTableWidget.insertRow(self.resTableWidget.rowCount())
-        #self.resTableWidget.setItem(self.resTableWidget.rowCount()-1,0,
-        #                                QTableWidgetItem())
-        #for j in range(self.resTableWidget.columnCount()):
-        #    self.resTableWidget.setItem(self.resTableWidget.rowCount(),j,
-        #                                QTableWidgetItem())
-        #self.lastRowInd = self.resTableWidget.rowCount()-1
-        #for f in range(9):
-        #    self.resTableWidget.setItem(self.lastRowInd, 0,QTableWidgetItem())
-
-    # Create internal dataframe with all the data.
-    # This is needed for plotting data after acquisition
-    def setupDataFrame(self):
-        self.dfTotDeviceID = pd.DataFrame()
-        self.dfTotPerfData = pd.DataFrame()
-        self.dfTotAcqParams = pd.DataFrame()
-        self.dfTotJV = pd.DataFrame()
+    # Create internal store with all the data.
+    # This is needed for plotting data after acquisition.
+    # The store is shared with the table model, so it is cleared in place.
+    def setupResultsStore(self):
+        if hasattr(self, 'results'):
+            self.results.clear()
+        else:
+            self.results = ResultsStore()
     
     # Process data from devices
     def processDeviceData(self, deviceID, dfAcqParams, perfData, JV, flag, track_flag):
@@ -418,6 +487,9 @@ class ResultsWindow(QMainWindow):
         self.deviceID = np.vstack((self.deviceID, np.array([deviceID])))
         self.perfData = perfData
         self.JV = JV
+        if track_flag is True and flag is False:
+            self.trackBuffer.clear()
+            self.trackBuffer.append(perfData)
         
         # Populate table.
         if flag is False and track_flag is False:
@@ -430,42 +502,43 @@ class ResultsWindow(QMainWindow):
         QApplication.processEvents()
         
         if flag is True:
-            # Save to internal dataFrame
-            self.makeInternalDataFrames(self.lastRowInd+self.resTableWidget.rowCount() ,
-                self.deviceID,self.perfData, dfAcqParams, self.JV)
+            # Save to internal store
+            self.storeResults(deviceID, self.perfData, dfAcqParams, self.JV)
 
             # Enable/disable saving to file
             # Using ALT with Start Acquisition button overrides the config settings.
             if self.parent().config.saveLocalCsv == True or \
                     self.parent().acquisition.modifiers == Qt.AltModifier:
-                self.save_csv(deviceID, dfAcqParams, self.perfData, self.JV,self.csvFolder)
+                self.persistence.saveCsv(*self.make_csv(deviceID, dfAcqParams, self.perfData, self.JV,self.csvFolder))
             if self.parent().config.submitToDb == True:
                 self.submit_DM(deviceID, dfAcqParams, self.perfData, self.JV)
 
+    # Process new samples from tracking: only the latest sample is shown in
+    # the table, the MPP plot is decimated to a constant number of points.
+    # The plot keeps at most trackMaxSamples samples, the saved data all.
+    def processTrackingData(self, deviceID, perfData):
+        dropped = self.trackBuffer.dropped
+        self.trackBuffer.append(perfData)
+        if dropped == 0 and self.trackBuffer.dropped > 0:
+            self.printMsg(" Tracking "+deviceID+": plotting the latest {0:d} samples only (all samples are saved)".format(len(self.trackBuffer)))
+        self.fillTableData(deviceID, perfData)
+        self.plotMPP(self.trackBuffer.data(self.parent().config.trackMaxPlotPoints))
+
     # Plot data from devices
     def plotData(self, deviceID, perfData, JV):
         self.plotJVresp(JV,True)
         self.plotMPP(perfData)
         self.show()
     
-    # Create internal dataframe with all the data.
+    # Add data to the internal store, the key is kept in the table row.
     # This is needed for plotting data after acquisition
-    def makeInternalDataFrames(self, index,deviceID,perfData,dfAcqParams,JV):
-        self.dfTotDeviceID[index] = [deviceID]
-        self.dfTotPerfData[index] = [perfData]
-        self.dfTotAcqParams = self.dfTotAcqParams.append(dfAcqParams)
-        self.dfTotJV[index] = [JV]
+    def storeResults(self, deviceID, perfData, dfAcqParams, JV):
+        key = self.results.add(deviceID, perfData, dfAcqParams, JV)
+        self.resTableModel.setRowKey(self.lastRowInd, key)
     
     # Create DataFrames for saving csv and jsons
-    def makeDFPerfData(self,perfData):
-        dfPerfData = pd.DataFrame({'Time step': perfData[:,2], 'Voc': perfData[:,3],
-                        'Jsc': perfData[:,4], 'VPP' : perfData[:,5], 'MPP': perfData[:,6],
-                        'FF': perfData[:,7], 'PCE': perfData[:,8], 'Light' : perfData[:,9],
-                        'Acq Date': perfData[:,0], 'Acq Time': perfData[:,1],
-                                  })
-        dfPerfData = dfPerfData[['Acq Date','Acq Time','Time step', 'Voc',
-                                     'Jsc', 'VPP', 'MPP','FF','PCE', 'Light']]
-        return dfPerfData
+    def makeDFPerfData(self,perfData,asStrings=False):
+        return perf_to_dataframe(perfData, asStrings)
 
     def makeDFJV(self,JV,set):
         dfJV = pd.DataFrame({'V':JV[:,2*set+0], 'J':JV[:,2*set+1]})
@@ -476,9 +549,17 @@ class ResultsWindow(QMainWindow):
         del listJV['index']
         return dfJV, listJV
     
-    ### Submit json for device data to Data-Management
+    ### Submit json for device data to Data-Management (in the background)
     def submit_DM(self,deviceID, dfAcqParams, perfData, JV):
-        dfPerfData = self.makeDFPerfData(perfData)
+        documents = self.makeDocumentsDM(deviceID, dfAcqParams, perfData, JV)
+        self.dbConnectInfo = self.parent().dbconnectionwind.getDbConnectionInfo()
+        self.persistence.submitDM(deviceID, documents, self.dbConnectInfo,
+            self.make_csv(deviceID, dfAcqParams, perfData, JV, self.csvFolder))
+
+    ### Prepare json documents for device data for Data-Management
+    # perfData values are submitted as strings, as expected by DM consumers
+    def makeDocumentsDM(self,deviceID, dfAcqParams, perfData, JV):
+        dfPerfData = self.makeDFPerfData(perfData, True)
         
         # Prepare json-data
         jsonData = {'itemId' : deviceID[-1]}
@@ -492,7 +573,7 @@ class ResultsWindow(QMainWindow):
 
         _, listJV0 = self.makeDFJV(JV,0)
         jsonData.update(listJV0)
-        if float(perfData[0,2]) == 0:
+        if perfData['Time step'][0] == 0:
             if int(float(dfPerfData.at[0,'Light'])) == 0:
                 listMeasType = {'measType' : 'JV_dark'}
                 listName = {'name': 'JV_dark_f'}
@@ -512,6 +593,7 @@ class ResultsWindow(QMainWindow):
             jsonData1.update(listPerfData1)
             _, listJV1 = self.makeDFJV(JV,1)
             jsonData1.update(listJV1)
+            return [jsonData, jsonData1]
 
         else:
             listName = {'name': 'tracking'}
@@ -523,51 +605,16 @@ class ResultsWindow(QMainWindow):
             jsonData.update(listPerfData)
             jsonData.update(listName)
             jsonData.update(listMeasType)
+            return [jsonData]
 
-        self.dbConnectInfo = self.parent().dbconnectionwind.getDbConnectionInfo()
-        try:
-            # This is for direct submission via pymongo
-            conn = DataManagement(self.dbConnectInfo)
-            client, _ = conn.connectDB()
-            db = client[self.dbConnectInfo[2]]
-            db_entry = db.Measurement.insert_one(json.loads(json.dumps(jsonData)))
-            msg = " Device " + deviceID + \
-                    ": submission to DM via Mongo successful\n  (ids: " + \
-                    str(db_entry.inserted_id)
-            if float(perfData[0,2]) == 0:
-                db_entry1 = db.Measurement.insert_one(json.loads(json.dumps(jsonData1)))
-                msg += ", "+str(db_entry1.inserted_id)
-            msg += ")"
-        except:
-            try:
-                msg = " Submission to DM via Mongo: failed. Trying via HTTP POST"
-                print(msg)
-                logger.info(msg)
-                #This is for using POST HTTP
-                url = "http://"+self.dbConnectInfo[0]+":"+self.dbConnectInfo[5]+self.dbConnectInfo[6]
-                if float(perfData[0,2]) == 0:
-                    req = requests.post(url, json=jsonData)
-                    req1 = requests.post(url, json=jsonData1)
-                    if req.status_code == 200 and req1.status_code == 200:
-                        msg = " Device " + deviceID + \
-                          ", submission to DM via HTTP POST successful\n  (ETag: " + \
-                          str(req.headers['ETag'])+", "+str(req1.headers['ETag'])+")"
-                    else:
-                        req.raise_for_status()
-                        req1.raise_for_status()
-                else:
-                    if req.status_code == 200:
-                        req = requests.post(url, json=jsonData)
-                        msg = " Device " + deviceID + \
-                          ", submission to DM via HTTP POST successful\n  (ETag: " + \
-                          str(req.headers['ETag'])+")"
-                    else:
-                        req.raise_for_status()
-            except:
-                msg = " Connection to DM server: failed. Saving local file"
-                self.save_csv(deviceID, dfAcqParams, perfData, JV, self.csvFolder)
+    # Display status of the persistence queue
+    def updatePersistenceStatus(self, pending, spooled):
+        self.persistenceLabel.setText("DM/csv queue: {0:d}  Spooled: {1:d}".format(pending, spooled))
+
+    def printMsg(self, msg):
         print(msg)
         logger.info(msg)
+        self.statusbar.showMessage(msg.strip().split("\n")[0], 5000)
         
     # Open DM window for searching for data in DM
     def openWindowDM(self, deviceID):
@@ -576,13 +623,20 @@ class ResultsWindow(QMainWindow):
         deviceID = self.loadDMWindow.deviceData.connect(lambda deviceID, perfData, acqParams, JV:\
             self.loadDeviceDM(deviceID, perfData, acqParams, JV))
     
+    # Open window for searching the index of local data
+    def openWindowIndex(self):
+        self.indexWindow = DataIndexWindow(self.dataIndexer.index, parent=self)
+        self.indexWindow.show()
+        self.indexWindow.deviceData.connect(lambda deviceID, perfData, acqParams, JV:\
+            self.loadDeviceDM(deviceID, perfData, acqParams, JV))
+
     # Once data is retrieved from DM, plot it and populate table
     def loadDeviceDM(self, deviceID, perfData, dfAcqParams, JV):
         print(" Plotting data for:",deviceID)
         self.plotData(deviceID, perfData, JV)
         self.setupResultTable()
         self.fillTableData(deviceID, perfData)
-        self.makeInternalDataFrames(self.resTableWidget.rowCount()-1, [[deviceID]], perfData, dfAcqParams, np.array(JV))
+        self.storeResults(deviceID, perfData, dfAcqParams, np.array(JV))
     
     # Load data from saved CSV
     def load_csv(self):
@@ -591,20 +645,104 @@ class ResultsWindow(QMainWindow):
         try:
             for filename in filenames[0]:
                 print("Open saved device data from: ", filename)
-                dftot = pd.read_csv(filename, na_filter=False)
-                deviceID = dftot.at[0,'Device']
-                perfData = dftot.to_numpy()[range(0,np.count_nonzero(dftot['Acq Date']))][:,range(1,11)]
-                JV = dftot.values[range(0,np.count_nonzero(dftot['V_r']))][:,np.arange(11,15)].astype(float)
-                dfAcqParams = dftot.loc[0:1, 'Acq Soak Voltage':'Comments']
+                deviceID, perfData, dfAcqParams, JV = parse_csv_file(filename)
                 self.plotData(deviceID, perfData, JV)
                 self.setupResultTable()
                 self.fillTableData(deviceID, perfData)
-                self.makeInternalDataFrames(self.resTableWidget.rowCount()-1, [[deviceID]], perfData, dfAcqParams, np.array(JV))
+                self.storeResults(deviceID, perfData, dfAcqParams, np.array(JV))
         except:
             print("Loading files failed")
 
+    # Load all csv files in a folder tree in the background (process pool).
+    # The table is updated once per batch of loaded devices.
+    def bulk_load_csv(self):
+        folder = str(QFileDialog.getExistingDirectory(self,
+                        "Select folder with csv data", self.csvFolder))
+        if folder == "":
+            return
+        self.bulkLoader = BulkLoader(folder,
+            float(self.parent().config.conf['Instruments']['irradiance1Sun']), parent=self)
+        self.bulkProgress = QProgressDialog("Loading csv files...", "Cancel", 0, 0, self)
+        self.bulkProgress.setWindowTitle("Bulk load")
+        self.bulkProgress.setWindowModality(Qt.WindowModal)
+        self.bulkProgress.setMinimumDuration(0)
+        self.bulkProgress.canceled.connect(self.bulkLoader.stop)
+        self.bulkLoader.Msg.connect(self.printMsg)
+        self.bulkLoader.progress.connect(self.updateBulkProgress)
+        self.bulkLoader.loaded.connect(self.addResultsBatch)
+        self.bulkLoader.finished.connect(self.bulkLoadFinished)
+        self.bulkLoadMenu.setEnabled(False)
+        self.bulkLoader.start()
+
+    def updateBulkProgress(self, done, total):
+        self.bulkProgress.setMaximum(total)
+        self.bulkProgress.setValue(done)
+        self.bulkProgress.setLabelText("Loaded {0:d}/{1:d} csv files".format(done, total))
+
+    # Add a batch of (deviceID, perfData, dfAcqParams, JV) to the store
+    # and the table, with a single table update
+    def addResultsBatch(self, batch):
+        self.resTableModel.insertKeys([self.results.add(deviceID, perfData, dfAcqParams, JV) \
+            for deviceID, perfData, dfAcqParams, JV in batch])
+        self.lastBulkResult = batch[-1]
+
+    def bulkLoadFinished(self):
+        self.bulkProgress.close()
+        self.bulkLoadMenu.setEnabled(True)
+        if getattr(self, 'lastBulkResult', None) is not None:
+            deviceID, perfData, _, JV = self.lastBulkResult
+            self.plotData(deviceID, perfData, JV)
+            self.lastBulkResult = None
+
+    # Load all devices of a run from an archive, with a single file open
+    def load_archive(self):
+        filename = QFileDialog.getOpenFileName(self,
+                        "Open run archive", self.csvFolder, "*.npz")[0]
+        if filename == "":
+            return
+        try:
+            print("Open run archive: ", filename)
+            keys, meta = self.results.loadArchive(filename)
+            self.resTableModel.insertKeys(keys)
+            if len(keys) > 0:
+                entry = self.results.get(keys[-1])
+                self.plotData(entry.deviceID, entry.perfData, entry.JV)
+            msg = " Loaded {0:d} devices from run archive: ".format(len(keys))+filename
+        except:
+            msg = " Loading run archive failed: "+filename
+        self.printMsg(msg)
+
+    # Save all devices in the results store as a run archive.
+    # Without filename, the archive is saved in the csv folder.
+    def save_archive(self, filename=None):
+        if filename == "" or len(self.results) == 0:
+            return
+        if filename is None:
+            filename = self.csvFolder+"/run_"+ \
+                str(datetime.now().strftime('%Y%m%d-%H%M%S-%f'))+".npz"
+        meta = {'appVersion': self.parent().config.appVersion,
+                'created': str(datetime.now()),
+                'numDevices': len(self.results)}
+        try:
+            self.results.saveArchive(filename, meta)
+            msg = " Run archive saved on: "+filename
+        except:
+            msg = " Run archive NOT saved. Check File saving folder in INI file"
+        self.printMsg(msg)
+
     # Save device acquisition as csv
     def save_csv(self,deviceID, dfAcqParams, perfData, JV, folder):
+        filename, dfTot = self.make_csv(deviceID, dfAcqParams, perfData, JV, folder)
+        try:
+            dfTot.to_csv(filename, sep=',', index=False)
+            msg=" Device data saved on: "+filename
+        except:
+            msg=" Device data NOT saved. Check File saving folder in INI file"
+        print(msg)
+        logger.info(msg)
+
+    # Prepare filename and DataFrame for saving device acquisition as csv
+    def make_csv(self,deviceID, dfAcqParams, perfData, JV, folder):
         dfPerfData = self.makeDFPerfData(perfData)
         dfJV0,_ = self.makeDFJV(JV,0)
         dfJV1,_ = self.makeDFJV(JV,1)
@@ -621,40 +759,88 @@ class ResultsWindow(QMainWindow):
         if int(float(dfPerfData.at[0,'Light'])) == 0:
             csvFilename+="dark_"
         if int(float(dfPerfData.at[0,'Light'])) != 0:
-            if float(perfData[0,2]) != 0:
+            if perfData['Time step'][0] != 0:
                 csvFilename += "tracking_"
         csvFilename += dateTimeTag + ".csv"
-        try:
-            dfTot.to_csv(folder+"/"+csvFilename, sep=',', index=False)
-            msg=" Device data saved on: "+folder+"/"+csvFilename
-        except:
-            msg=" Device data NOT saved. Check File saving folder in INI file"
-        print(msg)
-        logger.info(msg)
+        return folder+"/"+csvFilename, dfTot
 
     # Populate result table.
     def fillTableData(self, deviceID, obj):
-        if str(obj[0,9]) == "1.0":
-            light = "ON"
+        self.resTableModel.setRowData(self.lastRowInd, deviceID, obj)
+
+####################################################################
+#   Blitting of animated artists on a cached background
+####################################################################
+class BlitManager():
+    def __init__(self, canvas, artists, maxFPS=10):
+        self.canvas = canvas
+        self.artists = artists
+        self.minInterval = 1./maxFPS if maxFPS > 0 else 0.
+        self.background = None
+        self.lastUpdate = 0.
+        self.pendingFullRedraw = False
+        self.blitDraw = False
+        # Updates coming faster than maxFPS are coalesced into one.
+        # The timer belongs to the canvas (GUI thread).
+        self.timer = QTimer(self.canvas)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(lambda: self.update())
+        self.cid = self.canvas.mpl_connect('draw_event', self.onDraw)
+
+    # Artists to be blitted (e.g. after the figure is cleared)
+    def setArtists(self, artists):
+        self.timer.stop()
+        self.artists = artists
+        self.background = None
+        self.pendingFullRedraw = False
+
+    # Artists are animated only while the background is drawn, so that
+    # any other draw (resize, zoom, saving the figure) includes them.
+    # The background is then cached again at the next update.
+    def onDraw(self, event):
+        if self.blitDraw:
+            self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+            self.drawArtists()
         else:
-            light = "OFF"
-        
-        self.resTableWidget.setItem(self.lastRowInd, 0,QTableWidgetItem(deviceID))
-        
-        for i in range(1,7,1):
-            self.resTableWidget.setItem(self.lastRowInd, i,QTableWidgetItem("{0:0.3f}".format(np.mean(obj[:,i+2].astype(float)))))
-            try:
-                self.resTableWidget.item(self.lastRowInd,i).setToolTip("F:{0:0.3f}".format(float(obj[0,i+2]))+" / B:{0:0.3f}".format(float(obj[1,i+2])))
-            except:
-                pass
-        self.resTableWidget.setItem(self.lastRowInd, 7,QTableWidgetItem(light)) #Light
-        self.resTableWidget.setItem(self.lastRowInd, 9,QTableWidgetItem(obj[0,0]))
-        self.resTableWidget.setItem(self.lastRowInd, 10,QTableWidgetItem(obj[0,1]))
-        
-        if float(obj[0,2]) == 0.:
-            self.resTableWidget.setItem(self.lastRowInd, 8,QTableWidgetItem("None")) #track_time
+            self.background = None
+
+    def drawArtists(self):
+        for a in self.artists:
+            self.canvas.figure.draw_artist(a)
+
+    def disconnect(self):
+        self.timer.stop()
+        self.canvas.mpl_disconnect(self.cid)
+
+    # Redraw the artists, at most maxFPS times per second
+    def update(self, fullRedraw=False):
+        self.pendingFullRedraw = self.pendingFullRedraw or fullRedraw
+        wait = self.lastUpdate + self.minInterval - time.time()
+        if wait > 0:
+            if not self.timer.isActive():
+                self.timer.start(int(1000*wait)+1)
+            return
+        self.timer.stop()
+        self.lastUpdate = time.time()
+        if self.pendingFullRedraw or self.background is None:
+            self.pendingFullRedraw = False
+            self.fullRedraw()
         else:
-            self.resTableWidget.setItem(self.lastRowInd, 8,QTableWidgetItem("{0:0.3f}".format(float(obj[0,2])))) #track_time
+            self.canvas.restore_region(self.background)
+            self.drawArtists()
+            self.canvas.blit(self.canvas.figure.bbox)
+
+    # Draw the figure without the artists, cache it and draw the artists
+    def fullRedraw(self):
+        for a in self.artists:
+            a.set_animated(True)
+        self.blitDraw = True
+        try:
+            self.canvas.draw()
+        finally:
+            self.blitDraw = False
+            for a in self.artists:
+                a.set_animated(False)
 
 ####################################################################
 #   Custom Toolbar with linear/log button
@@ -664,27 +664,15 @@ class SampleWindow(QMainWindow):
 
     # View entry in DM page for substrate/device
     def checkCreateLotDM(self, deviceID, row, col):
-        print("\nOpening entry in DM for Lot:",deviceID[:8])
-        db, connFlag = self.connectDM()
-        if connFlag == False:
-            print("Abort")
-            return
-        try:
-            entry = db.Lot.find_one({'label':deviceID[:8]})
-            if entry:
-                db.Lot.update_one({ '_id': entry['_id'] },{"$push": self.getArchConfig(deviceID, row, col)}, upsert=False)
-                msg = " Data entry for this batch found in DM. Created substrate: "+deviceID
-            else:
-                print(" No data entry for this substrate found in DM. Creating new one...")
-                jsonData = {'label' : deviceID[:8], 'date' : deviceID[2:8], 'description': '', 'notes': '', 'tags': [], 'substrates': []}
-                db_entry = db.Lot.insert_one(json.loads(json.dumps(jsonData)))
-                db.Lot.update_one({ '_id': db_entry.inserted_id },{"$push": self.getArchConfig(deviceID,row,col)}, upsert=False)
-                msg = " Created batch: " + deviceID[:8] + " and device: "+deviceID +"  with Architecture: "+\
-                self.deviceArchCBox.itemText(self.archSubs[row,col])
-            print(msg)
-            logger.info(msg)
-        except:
-            print(" Connection with DM via Mongo cannot be established.")
+        create_lot_DM(*self.getLotDMInfo(deviceID, row, col))
+
+    # Connection info and architecture of a substrate for create_lot_DM.
+    # Collected in the GUI thread, so that the DM entry can be created
+    # from a worker.
+    def getLotDMInfo(self, deviceID, row, col):
+        return (self.parent().dbconnectionwind.getDbConnectionInfo(), deviceID,
+                self.getArchConfig(deviceID, row, col),
+                self.deviceArchCBox.itemText(self.archSubs[row,col]))
 
     # Get architecture configuration files.
     def getArchConfig(self, deviceID, row, col):
@@ -702,11 +690,10 @@ class SampleWindow(QMainWindow):
     def connectDM(self):
         self.dbConnectInfo = self.parent().dbconnectionwind.getDbConnectionInfo()
         try:
-            conn = DataManagement(self.dbConnectInfo)
-            client, _ = conn.connectDB()
-            db = client[self.dbConnectInfo[2]]
-            #print(" Connected to DM")
-            return db, True
+            db, flag = DataManagement(self.dbConnectInfo).getDB()
+            if flag is False:
+                print(" Connection to DM failed")
+            return db, flag
         except:
             print(" Connection to DM failed")
             return None, False
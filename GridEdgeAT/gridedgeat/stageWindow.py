@@ -131,7 +131,8 @@ class StageWindow(QMainWindow):
             self.stageLabel.setText("Activating XY stage...")
             QApplication.processEvents()
             self.xystage = XYstage(self.parent().config.xDefStageOrigin,
-                            self.parent().config.yDefStageOrigin)
+                            self.parent().config.yDefStageOrigin,
+                            posTolerance=self.parent().config.stagePosTolerance)
             if self.xystage.xystageInit is False:
                 self.enableButtons(False)
                 self.stageLabel.setText("XY stage libraries or connection failed")
@@ -229,15 +230,17 @@ class StageWindow(QMainWindow):
         validDevNum = QIntValidator(0,6,self.devPosStageText)
         if validDevNum.validate(self.devPosStageText.text(),1)[0] == 2 \
            and validSubNum.validate(self.subPosStageText.text(),1)[0] == 2:
-            self.xystage.move_to_substrate_4x4(int(self.subPosStageText.text()))
+            moved = self.xystage.move_to_substrate_4x4(int(self.subPosStageText.text()))
             time.sleep(0.5)
-            if int(self.devPosStageText.text()) !=0:
-                self.xystage.move_to_device_3x2(int(self.subPosStageText.text()),
+            if int(self.devPosStageText.text()) !=0 and moved is not None:
+                moved = self.xystage.move_to_device_3x2(int(self.subPosStageText.text()),
                                         int(self.devPosStageText.text()))
                 msg = " Substrate #"+self.subPosStageText.text()+\
                                 " - Device #"+self.devPosStageText.text()
             else:
                 msg = " Substrate #"+self.subPosStageText.text()+" - Center"
+            if moved is None:
+                msg = " Stage move failed:"+msg
             self.showCurrentPos()
         else:
             msg = " Substrates/device indices out of range"
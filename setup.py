@@ -8,7 +8,8 @@ setup(
                       'sympy', 'lmfit', 'ftd2xx;platform_system=="Windows"',
                       'pywin32;platform_system=="Windows"',
                       'ThorlabsPM100;platform_system=="Windows"'],
-    entry_points={'gui_scripts' : ['gridedgeat=GridEdgeAT.__main__:main']},
+    entry_points={'gui_scripts' : ['gridedgeat=GridEdgeAT.__main__:main'],
+                  'console_scripts' : ['gridedgeat-index=GridEdgeAT.gridedgeat.dataIndex:main']},
     package_data={ 'GridEdgeAT': ['gridedgeat/rsrc/*',
                       'gridedgeat/modules/switchbox/*.scr','gridedgeat/modules/xystage/APT.*'],},
     include_package_data=True,
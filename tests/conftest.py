@@ -0,0 +1,39 @@
+'''
+conftest.py
+-----------
+Test setup: the gridedgeat package creates its folders and configuration
+in the home folder when imported, use a temporary one.
+
+Copyright (C) 2017-2019 Nicola Ferralis <ferralis@mit.edu>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+'''
+import os, sys, tempfile
+
+_home = tempfile.mkdtemp(prefix="gridedgeat-test-")
+os.environ['HOME'] = _home
+os.environ['USERPROFILE'] = _home
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+# Factory of device csv files laid out as ResultsWindow.make_csv:
+# Device, perfData columns, JV (V_f, J_f, V_r, J_r), acquisition parameters.
+# perfData is a dict of columns (PERF_COLUMNS), drop lists columns to leave out.
+@pytest.fixture
+def device_csv(tmpdir):
+    import numpy as np
+    import pandas as pd
+    def write(name, deviceID, perfData, JV, drop=[]):
+        dfPerfData = pd.DataFrame(perfData).drop(columns=drop)
+        dfJV = pd.DataFrame(JV, columns=['V_f', 'J_f', 'V_r', 'J_r'])
+        dfAcqParams = pd.DataFrame({'Acq Soak Voltage': [0.], 'Comments': ['']})
+        dfTot = pd.concat([pd.DataFrame({'Device': [deviceID]}), dfPerfData, dfJV, dfAcqParams], axis=1)
+        filename = str(tmpdir.join(name))
+        dfTot.to_csv(filename, sep=',', index=False)
+        return filename
+    return write
@@ -0,0 +1,59 @@
+'''
+test_bulkLoader.py
+------------------
+Tests for the csv bulk loader
+
+Copyright (C) 2017-2019 Nicola Ferralis <ferralis@mit.edu>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+'''
+import numpy as np
+from GridEdgeAT.gridedgeat.bulkLoader import *
+
+def light_jv():
+    V = np.arange(-0.2, 1.2, 0.01)
+    J = 1e-8*(np.exp(V/0.04)-1) - 20.
+    return np.column_stack((V, J, V[::-1], J[::-1]))
+
+def light_perf(pce=99.):
+    return {'Acq Date': ['2019-02-03']*2, 'Acq Time': ['10-00-00']*2, 'Time step': [0, 0],
+        'Voc': [0.7, 0.7], 'Jsc': [-20., -20.], 'VPP': [0.6, 0.6], 'MPP': [-11., -11.],
+        'FF': [0.8, 0.8], 'PCE': [pce, pce], 'Light': [1, 1]}
+
+def test_parse_csv_file(device_csv):
+    filename = device_csv("dev.csv", "NF190203AA1", light_perf(), light_jv())
+    deviceID, perfData, dfAcqParams, JV = parse_csv_file(filename)
+    assert deviceID == "NF190203AA1" and len(perfData) == 2
+    np.testing.assert_allclose(perfData['PCE'], [99., 99.])
+    np.testing.assert_allclose(JV, light_jv())
+    assert list(dfAcqParams.columns) == ['Acq Soak Voltage', 'Comments']
+
+def test_parse_csv_chunk_keeps_stored_metrics(device_csv):
+    filename = device_csv("dev.csv", "NF190203AA1", light_perf(), light_jv())
+    (_, (_, perfData, _, _), err), = parse_csv_chunk([filename], 50.)
+    assert err == ""
+    np.testing.assert_allclose(perfData['PCE'], [99., 99.])
+    np.testing.assert_allclose(perfData['FF'], [0.8, 0.8])
+
+def test_parse_csv_chunk_computes_missing_metrics(device_csv):
+    perf = light_perf()
+    perf['FF'] = ['', '']
+    files = [device_csv("blank.csv", "NF190203AA1", perf, light_jv()),
+             device_csv("missing.csv", "NF190203AA2", light_perf(), light_jv(), drop=['PCE'])]
+    results = parse_csv_chunk(files, 100.)
+    ref = analyse_jv(*stack_jv([light_jv()[:,2:4]]), 100.)[0]
+    blank, missing = [r[1][1] for r in results]
+    np.testing.assert_allclose(blank['FF'], [ref[4]]*2)
+    np.testing.assert_allclose(blank['PCE'], [99., 99.])
+    np.testing.assert_allclose(missing['PCE'], [ref[5]]*2)
+    np.testing.assert_allclose(missing['FF'], [0.8, 0.8])
+
+def test_parse_csv_chunk_reports_failures(tmpdir):
+    bad = tmpdir.join("bad.csv")
+    bad.write("not,a\ndevice,file\n")
+    (filename, data, err), = parse_csv_chunk([str(bad)], 100.)
+    assert data is None and err != ""
@@ -0,0 +1,80 @@
+'''
+test_camera.py
+--------------
+Tests for the camera alignment analysis
+
+Copyright (C) 2017-2019 Nicola Ferralis <ferralis@mit.edu>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+'''
+import numpy as np
+from GridEdgeAT.gridedgeat.modules.camera.camera import *
+
+# Contrast as computed by CameraFeed.check_alignment before vectorization
+def contrast_nditer(img, thresholdPerc):
+    threshold = thresholdPerc*np.amax(img)
+    count = 0
+    for i in np.nditer(img):
+        if i > threshold:
+            count = count + 1
+    return 100*count/img.size
+
+def test_analyse_alignment_matches_nditer():
+    img = np.random.RandomState(0).randint(0, 256, (60, 80)).astype(np.uint8)
+    for thresholdPerc in [0.1, 0.5, 0.9]:
+        res = analyse_alignment(img, thresholdPerc)[0]
+        assert abs(res.contrast - contrast_nditer(img, thresholdPerc)) < 1e-9
+        assert res.iMax == img.max()
+        assert res.histogram.sum() == img.size
+
+def test_analyse_alignment_rois():
+    img = np.zeros((60, 80), dtype=np.uint8)
+    img[10:20, 30:40] = 200
+    whole, roi, empty = analyse_alignment(img, 0.5, [(0, 80, 0, 60), (40, 25, 25, 5), (5, 5, 0, 10)])
+    assert abs(whole.contrast - 100*100/4800) < 1e-9
+    # ROI corners may be given in any order
+    assert abs(roi.contrast - 100*100/300) < 1e-9
+    np.testing.assert_allclose(roi.centroid, (34.5, 14.5))
+    assert empty.contrast == 0 and np.isnan(empty.centroid[0])
+
+def test_split_roi_device_order():
+    rois = split_roi(0, 20, 0, 30)
+    assert rois == [(0, 10, 0, 10), (0, 10, 10, 20), (0, 10, 20, 30),
+                    (10, 20, 0, 10), (10, 20, 10, 20), (10, 20, 20, 30)]
+
+# Frame with the device windows of a substrate shifted by (dx, dy) px
+# from the center of the frame (pitch 5 x 4 mm, 10 px/mm)
+def substrate_frame(dx, dy, skip=[]):
+    img = np.full((160, 200), 20, dtype=np.uint8)
+    centers = []
+    for c in range(2):
+        for r in range(3):
+            x = 100 + (c-0.5)*50 + dx
+            y = 80 + (r-1)*40 + dy
+            centers.append((x, y))
+            if len(centers)-1 not in skip:
+                img[int(y-8):int(y+8), int(x-10):int(x+10)] = 220
+    return img, centers
+
+def test_detect_device_windows():
+    img, centers = substrate_frame(12, -6)
+    res = detect_device_windows(img, 5., 4., 10.)
+    assert res.found == 6
+    np.testing.assert_allclose(res.offset, (1.2, 0.6), atol=0.1)
+    for (x1, x2, y1, y2), (x, y) in zip(res.rois, centers):
+        assert abs((x1+x2)/2 - x) <= 1 and abs((y1+y2)/2 - y) <= 1
+
+def test_detect_device_windows_missing_window():
+    img, centers = substrate_frame(-8, 4, skip=[4])
+    res = detect_device_windows(img, 5., 4., 10.)
+    assert res.found == 5
+    x1, x2, y1, y2 = res.rois[4]
+    assert abs((x1+x2)/2 - centers[4][0]) <= 2 and abs((y1+y2)/2 - centers[4][1]) <= 2
+
+def test_detect_device_windows_dark_frame():
+    res = detect_device_windows(np.zeros((160, 200), dtype=np.uint8), 5., 4., 10.)
+    assert res.found == 0 and len(res.rois) == 6 and np.isnan(res.offset[0])
@@ -0,0 +1,76 @@
+'''
+test_dataIndex.py
+-----------------
+Tests for the index of local data
+
+Copyright (C) 2017-2019 Nicola Ferralis <ferralis@mit.edu>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+'''
+import os, sys, sqlite3, subprocess
+import numpy as np
+from GridEdgeAT.gridedgeat.dataIndex import *
+
+JV = np.zeros((3, 4))
+
+def jv_perf(pce):
+    return {'Acq Date': ['2019-02-03']*2, 'Acq Time': ['10-00-00']*2, 'Time step': [0, 0],
+        'Voc': [0.7, 0.9], 'Jsc': [-20., -20.], 'VPP': [0.6, 0.6], 'MPP': [-11., -11.],
+        'FF': [0.8, 0.8], 'PCE': [pce, pce], 'Light': [1, 1]}
+
+# Tracking is saved latest first
+def tracking_perf():
+    return {'Acq Date': ['2019-02-04']*3, 'Acq Time': ['10-00-20', '10-00-10', '10-00-00'],
+        'Time step': [20, 10, 1], 'Voc': [0]*3, 'Jsc': [0]*3, 'VPP': [0.62, 0.61, 0.6],
+        'MPP': [-9., -10., -11.], 'FF': [0]*3, 'PCE': [0]*3, 'Light': [1]*3}
+
+def test_index_row(device_csv):
+    row = dict(zip(INDEX_COLUMNS, index_row(device_csv("jv.csv", "NF190203AA1", jv_perf(12.), JV))))
+    assert row['deviceID'] == "NF190203AA1" and row['substrate'] == "NF190203AA"
+    assert row['measType'] == 'JV' and row['acqDate'] == '2019-02-03'
+    assert abs(row['Voc'] - 0.8) < 1e-9 and row['PCE'] == 12.
+
+def test_index_row_tracking_latest(device_csv):
+    row = dict(zip(INDEX_COLUMNS, index_row(device_csv("tr.csv", "NF190203AA1", tracking_perf(), JV))))
+    assert row['measType'] == 'tracking'
+    assert row['VPP'] == 0.62 and row['MPP'] == -9.
+
+def test_update_and_query(device_csv, tmpdir):
+    device_csv("a.csv", "NF190203AA1", jv_perf(12.), JV)
+    device_csv("b.csv", "NF190203BB1", jv_perf(8.), JV)
+    device_csv("t.csv", "NF190203AA1", tracking_perf(), JV)
+    tmpdir.join("bad.csv").write("not,a\ndevice,file\n")
+    index = DataIndex(str(tmpdir.join("index.sqlite")))
+    numIndexed, numRemoved, failed = index.update(str(tmpdir))
+    assert numIndexed == 3 and numRemoved == 0
+    assert [os.path.basename(f[0]) for f in failed] == ["bad.csv"]
+    assert len(index) == 3
+    assert len(index.query(substrate="NF190203AA")) == 2
+    assert [r['deviceID'] for r in index.query(minPCE=10)] == ["NF190203AA1"]
+    assert index.query(measType='tracking')[0]['MPP'] == -9.
+    # Unchanged files (and failed ones) are not parsed again
+    assert index.update(str(tmpdir)) == (0, 0, [])
+    os.remove(str(tmpdir.join("b.csv")))
+    assert index.update(str(tmpdir))[:2] == (0, 1)
+
+def test_old_index_is_rebuilt(tmpdir):
+    filename = str(tmpdir.join("index.sqlite"))
+    conn = sqlite3.connect(filename)
+    conn.execute("CREATE TABLE files (path TEXT PRIMARY KEY, Voc REAL)")
+    conn.execute("INSERT INTO files VALUES ('x.csv', 1.)")
+    conn.commit()
+    conn.close()
+    assert len(DataIndex(filename)) == 0
+
+# The index command line must not load the GUI or instrument drivers
+def test_cli_imports():
+    code = "import sys; import GridEdgeAT.gridedgeat.dataIndex; " + \
+        "print([m for m in ['GridEdgeAT.gridedgeat.mainWindow', 'cv2', 'visa', " + \
+        "'PyQt5.QtWidgets'] if m in sys.modules])"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.check_output([sys.executable, "-c", code], cwd=root)
+    assert out.decode().strip().splitlines()[-1] == "[]"
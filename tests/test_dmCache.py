@@ -0,0 +1,68 @@
+'''
+test_dmCache.py
+---------------
+Tests for the local cache of DM documents
+
+Copyright (C) 2017-2019 Nicola Ferralis <ferralis@mit.edu>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+'''
+import time, sqlite3
+from GridEdgeAT.gridedgeat.dmCache import DMCache
+
+def docs(ids, substrate="NF190203AA"):
+    return [{'_id': str(i), 'substrate': substrate, 'itemId': '1', 'measType': 'JV'} for i in ids]
+
+def test_get_put(tmpdir):
+    cache = DMCache(str(tmpdir.join("cache.sqlite")))
+    cache.put(docs(range(3)))
+    assert sorted(cache.get(['0', '2', 'x'])) == ['0', '2']
+    assert cache.get([]) == {}
+
+def test_lru_eviction(tmpdir):
+    cache = DMCache(str(tmpdir.join("cache.sqlite")), maxEntries=3)
+    cache.put(docs(range(3)))
+    time.sleep(0.01)
+    cache.get(['0'])
+    cache.put(docs([3]))
+    assert sorted(cache.get(['0', '1', '2', '3'])) == ['0', '2', '3']
+
+def test_expired_documents(tmpdir):
+    cache = DMCache(str(tmpdir.join("cache.sqlite")), ttl=1e-6)
+    cache.put(docs(range(2)))
+    time.sleep(0.01)
+    assert cache.get(['0', '1']) == {}
+    assert sorted(cache.get(['0', '1'], expired=True)) == ['0', '1']
+    cache.ttl = 0
+    assert sorted(cache.get(['0', '1'])) == ['0', '1']
+
+def test_listing_drops_removed_documents(tmpdir):
+    cache = DMCache(str(tmpdir.join("cache.sqlite")))
+    assert cache.getListing("NF190203AA") == (None, None)
+    cache.put(docs(range(3)) + docs([9], "NF190203BB"))
+    cache.putListing("NF190203AA", [{'_id': '1'}])
+    entries, cached = cache.getListing("NF190203AA")
+    assert entries == [{'_id': '1'}] and cached <= time.time()
+    assert sorted(cache.get(['0', '1', '2', '9'])) == ['1', '9']
+
+def test_connections_closed(tmpdir, monkeypatch):
+    opened, closed = [], []
+    class Connection(sqlite3.Connection):
+        def close(self):
+            closed.append(self)
+            super(Connection, self).close()
+    connect = sqlite3.connect
+    def tracked(*args, **kwargs):
+        opened.append(1)
+        return connect(*args, factory=Connection, **kwargs)
+    monkeypatch.setattr(sqlite3, 'connect', tracked)
+    cache = DMCache(str(tmpdir.join("cache.sqlite")))
+    cache.put(docs(range(3)))
+    cache.get(['0'])
+    cache.putListing("NF190203AA", [{'_id': '1'}])
+    cache.getListing("NF190203AA")
+    assert len(opened) == 5 and len(closed) == 5
@@ -0,0 +1,85 @@
+'''
+test_jvAnalysis.py
+------------------
+Tests for the vectorized JV analysis
+
+Copyright (C) 2017-2019 Nicola Ferralis <ferralis@mit.edu>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+'''
+import numpy as np
+from GridEdgeAT.gridedgeat.jvAnalysis import *
+
+POWER_IN = 100.
+
+# Diode-like JV curve (mA/cm^2), negative current under illumination
+def jv_curve(V, jsc=20., j0=1e-8, nVt=0.04):
+    return j0*(np.exp(V/nVt)-1) - jsc
+
+# Per-curve analysis as in Acquisition.analyseJV before vectorization
+# (linear interpolation of Voc and Jsc, MPP at the most negative power)
+def analyse_jv_scalar(V, J, powerIn):
+    ind = np.argsort(V)
+    V, J = V[ind], J[ind]
+    jsc = np.interp(0, V, J)
+    voc = np.interp(0, J, V)
+    ind_Pmax = np.argmin(V*J)
+    vpmax, jpmax = V[ind_Pmax], J[ind_Pmax]
+    ff = vpmax*jpmax/(voc*jsc)
+    pce = abs(100*vpmax*jpmax/powerIn)
+    return np.array([voc, jsc, vpmax, vpmax*jpmax, ff, pce])
+
+def test_analyse_jv_matches_scalar():
+    curves = []
+    for jsc, step in [(20., 0.01), (15., 0.02), (22., 0.005)]:
+        V = np.arange(-0.2, 1.2, step)
+        curves.append(np.column_stack((V, jv_curve(V, jsc))))
+    res = analyse_jv(*stack_jv(curves), POWER_IN)
+    assert res.shape == (3, len(JV_PARAMS))
+    for k, JV in enumerate(curves):
+        np.testing.assert_allclose(res[k], analyse_jv_scalar(JV[:,0], JV[:,1], POWER_IN), rtol=1e-9)
+
+def test_analyse_jv_reverse_scan():
+    V = np.arange(-0.2, 1.2, 0.01)
+    J = jv_curve(V)
+    np.testing.assert_allclose(analyse_jv(V[::-1], J[::-1], POWER_IN),
+                               analyse_jv(V, J, POWER_IN))
+
+def test_analyse_jv_no_crossing():
+    V = np.arange(-0.2, 0.2, 0.01)
+    res = analyse_jv(V, -np.ones(len(V)), POWER_IN)[0]
+    assert res[0] == 0 and res[1] == 0 and res[4] == 0 and res[5] == 0
+
+def test_stack_jv_padding():
+    V, J = stack_jv([np.ones((3,2)), np.ones((5,2))])
+    assert V.shape == (2, 5)
+    assert np.isnan(V[0,3:]).all() and np.isfinite(V[1]).all()
+
+def test_adaptive_voltage_list():
+    v_step = 0.01
+    v_list = list(np.arange(-0.2-1e-9, 1.2+1e-9, v_step))
+    V = np.array(v_list)
+    J = jv_curve(V)
+    ref = analyse_jv(V, J, POWER_IN)[0]
+    grid = adaptive_voltage_list(V, J, v_list, v_step, POWER_IN, 0.01)
+    assert len(grid) < len(v_list)
+    assert set(grid) <= set(v_list) and grid == sorted(grid)
+    # Full resolution around MPP and Voc
+    for c in [ref[2], ref[0]]:
+        assert np.count_nonzero(np.abs(np.array(grid)-c) <= 2*v_step+1e-9) >= 4
+    res = analyse_jv(grid, jv_curve(np.array(grid)), POWER_IN)[0]
+    assert abs(res[3]-ref[3]) <= 0.01*abs(ref[3]) and abs(res[4]-ref[4]) <= 0.01*abs(ref[4])
+    # Reverse direction is kept
+    grid_r = adaptive_voltage_list(V, J, v_list[::-1], v_step, POWER_IN, 0.01)
+    assert set(grid_r) <= set(v_list) and grid_r == sorted(grid_r)[::-1]
+
+def test_adaptive_voltage_list_unresolved():
+    v_step = 0.01
+    v_list = list(np.arange(-0.2-1e-9, 1.2+1e-9, v_step))
+    # Measured on a coarse grid: MPP and Voc not resolved, full list
+    V = np.array(v_list[::8])
+    assert adaptive_voltage_list(V, jv_curve(V), v_list, v_step, POWER_IN, 0.01) == v_list
@@ -0,0 +1,49 @@
+'''
+test_perfData.py
+----------------
+Tests for perfData records and the tracking buffer
+
+Copyright (C) 2017-2019 Nicola Ferralis <ferralis@mit.edu>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+'''
+import numpy as np
+from GridEdgeAT.gridedgeat.perfData import *
+
+def samples(n, start=0):
+    return np.concatenate([make_perf_data([0, 0, 0.5, -k, 0, 0], 1, timestep=k, epoch=1e9+k) \
+        for k in range(start, start+n)])
+
+def test_buffer_round_trip():
+    buf = PerfDataBuffer(capacity=4)
+    recs = samples(10)
+    buf.append(recs[:3])
+    for rec in recs[3:]:
+        buf.append(rec)
+    assert len(buf) == 10 and buf.dropped == 0
+    np.testing.assert_array_equal(buf.data(), recs)
+
+def test_buffer_maxlen_drops_oldest():
+    buf = PerfDataBuffer(capacity=2, maxlen=5)
+    buf.append(samples(8))
+    assert len(buf) == 5 and buf.dropped == 3
+    np.testing.assert_array_equal(buf.data()['Time step'], [3, 4, 5, 6, 7])
+
+def test_buffer_decimation_keeps_ends():
+    buf = PerfDataBuffer()
+    buf.append(samples(100))
+    data = buf.data(maxPoints=10)
+    assert len(data) == 10
+    assert data['Time step'][0] == 0 and data['Time step'][-1] == 99
+
+def test_dataframe_round_trip():
+    perfData = make_perf_data([[0.9, -20., 0.7, -12., 0.66, 12.],
+                               [0.8, -19., 0.6, -10., 0.65, 10.]], 1, epoch=1.5e9)
+    for asStrings in [False, True]:
+        df = perf_to_dataframe(perfData, asStrings)
+        assert list(df.columns) == PERF_COLUMNS
+        np.testing.assert_array_equal(perf_from_dataframe(df), perfData)
@@ -0,0 +1,102 @@
+'''
+test_persistence.py
+-------------------
+Tests for the batched DM submission
+
+Copyright (C) 2017-2019 Nicola Ferralis <ferralis@mit.edu>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+'''
+import numpy as np
+from GridEdgeAT.gridedgeat import persistence
+from GridEdgeAT.gridedgeat.persistence import *
+
+DB_CONNECT_INFO = ["localhost", "", "", "", "", "8080", "/measurements"]
+
+class NoMongo():
+    def __init__(self, dbConnectInfo):
+        pass
+    def getDB(self):
+        return None, False
+
+class Reply():
+    def __init__(self, res, etag="etag"):
+        self.res = res
+        self.headers = {'ETag': etag}
+    def raise_for_status(self):
+        pass
+    def json(self):
+        return self.res
+
+def documents(num, substrate="NF190203AA"):
+    return [{'substrate': substrate, 'itemId': str(k), 'Voc': np.float64(0.9)} for k in range(num)]
+
+def submit_http(monkeypatch, reply, num=3):
+    posted = []
+    def post(url, json=None, timeout=None):
+        posted.append((url, json))
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+    monkeypatch.setattr(persistence, 'DataManagement', NoMongo)
+    monkeypatch.setattr(persistence.requests, 'post', post)
+    return submit_documents_DM(documents(num), DB_CONNECT_INFO), posted
+
+def test_http_single_round_trip(monkeypatch):
+    status, posted = submit_http(monkeypatch, Reply([{'id': 'a'}, {'id': 'b'}, {'id': 'c'}]))
+    assert status == [(True, 'a'), (True, 'b'), (True, 'c')]
+    assert len(posted) == 1 and len(posted[0][1]) == 3
+    assert posted[0][0] == "http://localhost:8080/measurements"
+    assert posted[0][1][0]['Voc'] == 0.9
+
+def test_http_reply_without_ids(monkeypatch):
+    for res in [[{'id': 'a'}], {'ok': 1}, None]:
+        status, _ = submit_http(monkeypatch, Reply(res))
+        assert status == [(True, 'etag')]*3
+
+def test_http_failure(monkeypatch):
+    status, _ = submit_http(monkeypatch, IOError("refused"))
+    assert status == [(False, "refused")]*3
+
+def test_format_status():
+    msg = format_status_DM("Substrate X", documents(2), [(True, 'a'), (False, 'err')])
+    assert "1/2 document(s)" in msg and "FAILED (err)" in msg
+
+def test_batch_per_substrate(tmpdir):
+    worker = PersistenceWorker(str(tmpdir))
+    delivered = []
+    worker.deliver = lambda label, docs, owners: delivered.append((label, docs, owners))
+    worker.processJob(('dm', "NF190203AA1", documents(2), None))
+    worker.processJob(('dm', "NF190203AA2", documents(2), None))
+    assert delivered == []
+    worker.processJob(('dm', "NF190203BB1", documents(1, "NF190203BB"), None))
+    assert len(delivered) == 1
+    label, docs, owners = delivered[0]
+    assert label == "Substrate NF190203AA" and len(docs) == 4
+    assert owners == [("NF190203AA1", 2, None), ("NF190203AA2", 2, None)]
+    worker.processJob(('flush',))
+    assert len(delivered) == 2 and delivered[1][2] == [("NF190203BB1", 1, None)]
+    worker.processJob(('flush',))
+    assert len(delivered) == 2
+
+def test_deliver_spools_failed_documents(monkeypatch, tmpdir):
+    import json, pandas as pd
+    worker = PersistenceWorker(str(tmpdir), maxRetries=1)
+    worker.dbConnectInfo = DB_CONNECT_INFO
+    monkeypatch.setattr(persistence, 'submit_documents_DM',
+        lambda docs, info: [(d['itemId'] != '3', 'x') for d in docs])
+    csv1 = (str(tmpdir.join("dev1.csv")), pd.DataFrame({'a': [1]}))
+    csv2 = (str(tmpdir.join("dev2.csv")), pd.DataFrame({'a': [2]}))
+    docs = documents(4)
+    worker.deliver("Substrate NF190203AA", docs,
+        [("NF190203AA1", 2, csv1), ("NF190203AA2", 2, csv2)])
+    spooled = worker.spoolFiles()
+    assert len(spooled) == 1
+    with open(spooled[0]) as f:
+        assert [d['itemId'] for d in json.load(f)['documents']] == ['3']
+    # Only the device with undelivered documents is saved locally
+    assert not tmpdir.join("dev1.csv").check() and tmpdir.join("dev2.csv").check()
@@ -0,0 +1,68 @@
+'''
+test_resultsStore.py
+--------------------
+Tests for the columnar results store
+
+Copyright (C) 2017-2019 Nicola Ferralis <ferralis@mit.edu>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+'''
+import numpy as np
+from GridEdgeAT.gridedgeat.resultsStore import *
+
+def jv_entry(n, value):
+    perfData = make_perf_data([[value, -20., 0.7, -12., 0.66, 12.]]*2, 1, epoch=1e9)
+    return perfData, np.full((n, 4), float(value))
+
+def tracking_entry(n, value):
+    perfData = make_perf_data([[0, 0, 0.7, -value, 0, 0]]*n, 1, timestep=1., epoch=1e9)
+    return perfData, np.full((2, 4), float(value))
+
+def add(store, deviceID, data):
+    return store.add(deviceID, data[0], None, data[1])
+
+def check_entries(store, expected):
+    assert sorted(store.entries) == sorted(expected)
+    for key, (perfData, JV) in expected.items():
+        e = store.get(key)
+        np.testing.assert_array_equal(e.perfData, perfData)
+        np.testing.assert_array_equal(e.JV, JV)
+
+def test_add_find_remove():
+    store = ResultsStore()
+    k1 = add(store, "NF190203AA1", jv_entry(10, 1))
+    k2 = add(store, "NF190203AA1", tracking_entry(5, 2))
+    k3 = add(store, "NF190203AA2", jv_entry(10, 3))
+    assert store.find("NF190203AA1") == [k1, k2]
+    assert store.find("NF190203AA1", 'tracking') == [k2]
+    assert store.findType('JV') == [k1, k3]
+    store.remove(k1)
+    assert store.find("NF190203AA1") == [k2]
+    assert k1 not in store and len(store) == 2
+
+def test_compact_keeps_offsets():
+    store = ResultsStore()
+    expected = {}
+    for k in range(20):
+        data = jv_entry(10+k, k)
+        expected[add(store, "D"+str(k), data)] = data
+    for key in list(expected)[::2] + list(expected)[1:8:2]:
+        store.remove(key)
+        del expected[key]
+        check_entries(store, expected)
+    assert store.jvUnused <= store.jvUsed/2
+    assert store.jvUsed >= sum(len(d[1]) for d in expected.values())
+
+def test_compact_on_unused_perf_rows():
+    store = ResultsStore()
+    keys = [add(store, "D"+str(k), tracking_entry(100, k)) for k in range(4)]
+    add(store, "D4", jv_entry(100, 4))
+    for key in keys[:3]:
+        store.remove(key)
+    # Few JV rows were freed, but most perfData rows were
+    assert store.perfUsed == 102 and store.perfUnused == 0
+    check_entries(store, {keys[3]: tracking_entry(100, 3), 4: jv_entry(100, 4)})
@@ -0,0 +1,37 @@
+'''
+test_xystage.py
+---------------
+Tests for the stage path planning
+
+Copyright (C) 2017-2019 Nicola Ferralis <ferralis@mit.edu>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+'''
+import random
+from GridEdgeAT.gridedgeat.modules.xystage.xystage import *
+
+def test_plan_path_not_longer_than_input_order():
+    rnd = random.Random(0)
+    for simult in [False, True]:
+        for _ in range(20):
+            positions = [(rnd.uniform(0, 100), rnd.uniform(0, 100)) for _ in range(8)]
+            order = plan_path(positions, (0, 0), 2., 3., blTime=0.5, simult=simult)
+            assert sorted(order) == list(range(len(positions)))
+            assert path_time(positions, order, (0, 0), 2., 3., 0.5, simult) <= \
+                path_time(positions, list(range(len(positions))), (0, 0), 2., 3., 0.5, simult) + 1e-9
+
+def test_plan_path_line():
+    positions = [(30, 0), (10, 0), (20, 0), (40, 0)]
+    order = plan_path(positions, (0, 0), 1., 1.)
+    assert [positions[k][0] for k in order] == [10, 20, 30, 40]
+
+def test_move_time():
+    assert move_time((0, 0), (10, 5), 2., 1.) == 10.
+    assert move_time((0, 0), (10, 5), 2., 1., simult=True) == 5.
+    # Backlash only when moving towards negative positions
+    assert move_time((10, 5), (0, 0), 2., 1., blTime=1.) == 12.
+    assert move_time((10, 5), (0, 0), 2., 1., blTime=1., simult=True) == 6.